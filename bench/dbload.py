@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+
+# -*- coding: utf-8 -*-
+#########################################################
+# SCRIPT : dbload.py                                    #
+#          Micro benchmark for loading the database     #
+#          cold (xml parse) vs. warm (snapshot cache)   #
+#          I. Helwegen 2020                             #
+#########################################################
+
+####################### IMPORTS #########################
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "opt", "xnas"))
+from common.xnas_engine import groups # database is always imported in engine
+import common.database as dbmodule
+from common.database import database
+#########################################################
+
+####################### GLOBALS #########################
+MOUNTS  = 200
+SHARES  = 400
+REPEATS = 50
+#########################################################
+
+###################### FUNCTIONS ########################
+
+def makeDB(mounts, shares):
+    db = {}
+    db[groups.SETTINGS] = {"srvenable": True, "dyninterval": 60, "dynzfshealth": False, "remoteprobe": "icmp", "probetimeout": 2}
+    db[groups.MOUNTS] = {}
+    for i in range(mounts):
+        db[groups.MOUNTS]["mount{}".format(i)] = {"fsname": "/dev/sd{}".format(i), "uuid": "{:08x}-0000-0000-0000-000000000000".format(i),
+                                          "label": "", "mountpoint": "/mnt/mount{}".format(i), "type": "ext4",
+                                          "options": "defaults", "rw": True, "freq": 0, "pass": 2, "uacc": "rw",
+                                          "sacc": "ro", "method": "dynmount", "idletimeout": 0, "timeout": 0, "zfs": False}
+    db[groups.REMOTEMOUNTS] = ""
+    db[groups.SHARES] = {}
+    for i in range(shares):
+        db[groups.SHARES]["share{}".format(i)] = {"xmount": "mount{}".format(i % mounts), "remotemount": False,
+                                          "folder": "folder{}".format(i), "uacc": "rw", "sacc": "ro", "enabled": True}
+    db[groups.NETSHARES] = ""
+    return db
+
+def timeLoad(path, repeats, cold):
+    total = 0
+    for i in range(repeats):
+        if cold and os.path.exists(dbmodule.CACHEFILE):
+            os.remove(dbmodule.CACHEFILE)
+        start = time.perf_counter()
+        benchdb(path)
+        total += time.perf_counter() - start
+    return total / repeats * 1000
+
+#########################################################
+
+#########################################################
+# Class : benchdb                                       #
+#########################################################
+class benchdb(database):
+    def __init__(self, path):
+        self.path = path
+        database.__init__(self, logging.getLogger('xnas.bench'))
+
+    def getXMLpath(self, doexit = True, dowrite = False):
+        return self.path
+
+######################### MAIN ##########################
+if __name__ == "__main__":
+    tmpdir = tempfile.mkdtemp()
+    try:
+        # cache and lock next to the database, /run/xnas is not required
+        dbmodule.RUNDIR = tmpdir
+        dbmodule.LOCKFILE = os.path.join(tmpdir, "xnas.xml.lock")
+        dbmodule.CACHEFILE = os.path.join(tmpdir, "xnas.xml.cache")
+        path = os.path.join(tmpdir, "xnas.xml")
+        writer = benchdb.__new__(benchdb)
+        writer.path = path
+        writer.logger = logging.getLogger('xnas.bench')
+        writer.writeXML(path, writer.prettify(dbmodule.XML_COMMENT, makeDB(MOUNTS, SHARES)))
+        # the cache is only written for files that stopped changing
+        past = time.time() - 2 * dbmodule.CACHERACY
+        os.utime(path, (past, past))
+
+        print("database: {} mounts, {} shares, {} bytes".format(MOUNTS, SHARES, os.path.getsize(path)))
+        cold = timeLoad(path, REPEATS, True)
+        benchdb(path) # write cache
+        warm = timeLoad(path, REPEATS, False)
+        print("cold load (xml parse):      {:8.3f} ms".format(cold))
+        print("warm load (snapshot cache): {:8.3f} ms".format(warm))
+        print("speedup:                    {:8.1f} x".format(cold / warm))
+    finally:
+        shutil.rmtree(tmpdir)
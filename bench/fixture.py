@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+#########################################################
+# SERVICE : fixture.py                                  #
+#           Fake system layer for benchmarks: shell,    #
+#           /dev, /sys, /proc mountinfo, fstab,         #
+#           smb.conf and the database in a temporary    #
+#           tree                                        #
+#           I. Helwegen 2020                            #
+#########################################################
+
+####################### IMPORTS #########################
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import logging
+import tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "opt", "xnas"))
+import common.xnas_engine as enginemodule # database is always imported in engine
+from common.xnas_engine import groups
+import common.database as dbmodule
+import common.xnas_check as checkmodule
+import common.dynmountdata as dynmodule
+import mounts.fstab as fstabmodule
+import mounts.devices as devmodule
+import mounts.mountpoint as mpmodule
+import mounts.mounttable as mtmodule
+import net.cifsshare as cifsmodule
+import net.nfsshare as nfsmodule
+import remotes.cifs as cifsremotemodule
+from common.shell import shell
+from common.records import records
+#########################################################
+
+####################### GLOBALS #########################
+FORKCOST   = 0.002 # simulated cost of running a command [s]
+DISKSIZE   = 1000204886016
+DISKUSED   = 200040977203
+BINFILES   = 20    # files in each recycle bin
+USERS      = 5
+#########################################################
+
+###################### FUNCTIONS ########################
+
+#########################################################
+
+#########################################################
+# Class : fixture                                       #
+#########################################################
+class fixture(object):
+    # disks, remotes and shares (each with a cifs netshare) in a temporary
+    # tree, the modules are pointed to the tree and commands are answered
+    # from the state of the fixture
+    def __init__(self, disks = 50, remotes = 10, shares = 100, pools = 0, forkcost = FORKCOST):
+        self.disks = disks
+        self.remotes = remotes
+        self.shares = shares
+        self.pools = pools
+        self.forkcost = forkcost
+        self.commands = 0
+        self.mounted = set()
+        self.down = set()
+        self.root = tempfile.mkdtemp(prefix = "xnasbench.")
+        self.saved = []
+        self.execute = None
+        self.logger = logging.getLogger('xnas.bench')
+        try:
+            self.build()
+            self.install()
+        except:
+            self.remove()
+            raise
+
+    def __del__(self):
+        pass
+
+    def remove(self):
+        self.uninstall()
+        shutil.rmtree(self.root, ignore_errors = True)
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def resetState(self):
+        # as at the start of a new process
+        devmodule.devices.invalidate()
+        fstabmodule.fstab.invalidate()
+        dbmodule.database.snapshot = None
+        dynmodule.dynmountdata.dynmounts = []
+        self.refreshMounts()
+        xlogger = logging.getLogger('xnas')
+        for handler in list(xlogger.handlers):
+            xlogger.removeHandler(handler)
+
+    def mount(self, mountpoint):
+        self.mounted.add(mountpoint)
+        self.writeMountinfo()
+
+    def unmount(self, mountpoint):
+        self.mounted.discard(mountpoint)
+        self.writeMountinfo()
+
+    def diskFsname(self, i):
+        return self.path("dev", "sd{}1".format(self.diskName(i)))
+
+    def diskMountpoint(self, i):
+        return self.path("mnt", "disk{}".format(i))
+
+    def diskUuid(self, i):
+        return "{:08x}-1d2c-4b5a-9e8f-{:012x}".format(i, i)
+
+    ################## INTERNAL FUNCTIONS ###################
+
+    def diskName(self, i):
+        name = ""
+        i += 1
+        while i > 0:
+            i, rest = divmod(i - 1, 26)
+            name = chr(ord('a') + rest) + name
+        return name
+
+    def remoteMountpoint(self, j):
+        return self.path("mnt", "remote{}".format(j))
+
+    def remoteUrl(self, j):
+        return "//srv{}/share{}".format(j, j)
+
+    def poolMountpoint(self, p):
+        return self.path("pool{}".format(p))
+
+    def shareMount(self, k):
+        # every fifth share is on a remote, if any
+        if self.remotes and k % 5 == 4:
+            j = k % self.remotes
+            return "remote{}".format(j), True, self.remoteMountpoint(j)
+        i = k % self.disks
+        return "disk{}".format(i), False, self.diskMountpoint(i)
+
+    def build(self):
+        for folder in ["etc", "dev/disk/by-uuid", "dev/disk/by-path", "dev/disk/by-label", "mnt", "media",
+                       "shares", "run/xnas", "log", "proc"]:
+            os.makedirs(self.path(folder))
+        fstab = []
+        for i in range(self.disks):
+            fsname = self.diskFsname(i)
+            open(fsname, "w").close()
+            part = os.path.basename(fsname)
+            os.symlink(os.path.join("..", "..", part), self.path("dev", "disk", "by-uuid", self.diskUuid(i)))
+            os.symlink(os.path.join("..", "..", part), self.path("dev", "disk", "by-path", "pci-0000:00:1f.2-ata-{}-part1".format(i + 1)))
+            os.symlink(os.path.join("..", "..", part), self.path("dev", "disk", "by-label", "disk{}".format(i)))
+            os.makedirs(self.diskMountpoint(i))
+            fstab.append("UUID={}\t{}\text4\tdefaults,nofail\t0\t2\n".format(self.diskUuid(i), self.diskMountpoint(i)))
+            self.mounted.add(self.diskMountpoint(i))
+        for j in range(self.remotes):
+            os.makedirs(self.remoteMountpoint(j))
+            fstab.append("{}\t{}\tcifs\tguest,_netdev,nofail,iocharset=utf8\t0\t0\n".format(self.remoteUrl(j), self.remoteMountpoint(j)))
+            self.mounted.add(self.remoteMountpoint(j))
+        for p in range(self.pools):
+            os.makedirs(self.poolMountpoint(p))
+            self.mounted.add(self.poolMountpoint(p))
+        with open(self.path("etc", "fstab"), "w") as fstab_file:
+            fstab_file.writelines(fstab)
+        smbconf = ["[global]\n", "\tworkgroup = WORKGROUP\n"]
+        for k in range(self.shares):
+            xmount, remote, mountpoint = self.shareMount(k)
+            folder = os.path.join(mountpoint, "share{}".format(k))
+            recycle = os.path.join(folder, ".recycle", "user")
+            os.makedirs(recycle)
+            for f in range(BINFILES):
+                open(os.path.join(recycle, "file{}".format(f)), "w").close()
+            os.symlink(folder, self.path("shares", "share{}".format(k)))
+            smbconf.append("[share{}]\n".format(k))
+            smbconf.append("\tpath = {}\n".format(self.path("shares", "share{}".format(k))))
+            smbconf.append("\tvfs objects = recycle\n")
+            smbconf.append("\trecycle:repository = .recycle/%U\n")
+        with open(self.path("etc", "smb.conf"), "w") as smb_file:
+            smb_file.writelines(smbconf)
+        open(self.path("etc", "exports"), "w").close()
+        open(self.path("etc", "nfs-kernel-server"), "w").close()
+        self.buildSysfs()
+        self.writeMountinfo()
+        self.writeDB()
+
+    def buildSysfs(self):
+        # sysfs and udev database of the disks and pools, as lsblk reports them
+        for i in range(self.disks):
+            disk = "sd{}".format(self.diskName(i))
+            self.addSysDevice(disk, "252:{}".format(i), disk + "1", "8:{}".format(i + 1),
+                              "ext4", "disk{}".format(i), self.diskUuid(i))
+        for p in range(self.pools):
+            disk = "nvme{}n1".format(p)
+            self.addSysDevice(disk, "259:{}".format(2 * p), disk + "p1", "259:{}".format(2 * p + 1),
+                              "zfs_member", "pool{}".format(p), "{:016d}".format(p + 1))
+
+    def addSysDevice(self, disk, diskdev, part, partdev, fstype, label, uuid):
+        devices = os.path.join("..", "..", "devices", "fixture")
+        for name, dev, folder in [(disk, diskdev, disk), (part, partdev, os.path.join(disk, part))]:
+            os.makedirs(self.path("sys", "devices", "fixture", folder))
+            with open(self.path("sys", "devices", "fixture", folder, "dev"), "w") as devfile:
+                devfile.write(dev + "\n")
+            with open(self.path("sys", "devices", "fixture", folder, "uevent"), "w") as ueventfile:
+                ueventfile.write("DEVNAME={}\nDEVTYPE={}\n".format(name, "partition" if name == part else "disk"))
+            os.makedirs(self.path("sys", "class", "block"), exist_ok = True)
+            os.symlink(os.path.join(devices, folder), self.path("sys", "class", "block", name))
+        open(self.path("sys", "devices", "fixture", disk, part, "partition"), "w").close()
+        os.makedirs(self.path("sys", "block"), exist_ok = True)
+        os.symlink(os.path.join("..", "devices", "fixture", disk), self.path("sys", "block", disk))
+        os.makedirs(self.path("run", "udev", "data"), exist_ok = True)
+        with open(self.path("run", "udev", "data", "b" + partdev), "w") as udevfile:
+            udevfile.write("E:ID_FS_TYPE={}\nE:ID_FS_LABEL={}\nE:ID_FS_UUID={}\n".format(fstype, label, uuid))
+
+    def writeDB(self):
+        db = {}
+        db[groups.SETTINGS] = {"srvenable": True, "dyninterval": 60, "dynzfshealth": False, "dynremovable": False,
+                               "cifsautobinenable": True, "autofixenable": True, "autofixretries": 3,
+                               "autofixinterval": 60, "zfsmountrecursive": True, "remoteprobe": "icmp", "probetimeout": 2}
+        db[groups.MOUNTS] = {}
+        for i in range(self.disks):
+            db[groups.MOUNTS]["disk{}".format(i)] = {"uuid": self.diskUuid(i).upper(), "zfs": False,
+                                                     "mountpoint": self.diskMountpoint(i), "method": "dynmount"}
+        for p in range(self.pools):
+            db[groups.MOUNTS]["pool{}".format(p)] = {"uuid": "pool{}".format(p), "zfs": True,
+                                                     "mountpoint": self.poolMountpoint(p), "method": "startup"}
+        db[groups.REMOTEMOUNTS] = {}
+        for j in range(self.remotes):
+            db[groups.REMOTEMOUNTS]["remote{}".format(j)] = {"https": False, "server": "srv{}".format(j),
+                                                             "sharename": "share{}".format(j), "type": "cifs",
+                                                             "mountpoint": self.remoteMountpoint(j), "method": "startup"}
+        db[groups.SHARES] = {}
+        db[groups.NETSHARES] = {}
+        for k in range(self.shares):
+            xmount, remote, mountpoint = self.shareMount(k)
+            db[groups.SHARES]["share{}".format(k)] = {"xmount": xmount, "remotemount": remote,
+                                                      "folder": "share{}".format(k), "enabled": True}
+            db[groups.NETSHARES]["share{}".format(k)] = {"type": "cifs", "enabled": True, "recyclemaxage": 30}
+        writer = dbmodule.database.__new__(dbmodule.database)
+        writer.logger = self.logger
+        path = self.path("etc", dbmodule.XML_FILENAME)
+        writer.writeXML(path, writer.prettify(dbmodule.XML_COMMENT, records().load(db)))
+        # the cache is only written for files that stopped changing
+        past = time.time() - 2 * dbmodule.CACHERACY
+        os.utime(path, (past, past))
+
+    def writeMountinfo(self):
+        lines = ["21 1 8:0 / / rw,relatime shared:1 - ext4 /dev/root rw\n"]
+        mountid = 100
+        for i in range(self.disks):
+            if self.diskMountpoint(i) in self.mounted:
+                lines.append("{} 21 8:{} / {} rw,relatime shared:{} - ext4 {} rw\n".format(mountid, i + 1,
+                             self.diskMountpoint(i), mountid, self.diskFsname(i)))
+                mountid += 1
+        for j in range(self.remotes):
+            if self.remoteMountpoint(j) in self.mounted:
+                lines.append("{} 21 0:{} / {} rw,relatime shared:{} - cifs {} rw\n".format(mountid, mountid,
+                             self.remoteMountpoint(j), mountid, self.remoteUrl(j)))
+                mountid += 1
+        for p in range(self.pools):
+            if self.poolMountpoint(p) in self.mounted:
+                lines.append("{} 21 0:{} / {} rw,relatime shared:{} - zfs pool{} rw\n".format(mountid, mountid,
+                             self.poolMountpoint(p), mountid, p))
+                mountid += 1
+        with open(self.path("proc", "mountinfo"), "w") as mountinfo:
+            mountinfo.writelines(lines)
+        self.refreshMounts()
+
+    def refreshMounts(self):
+        # a regular file doesn't signal changes, so read it again
+        with mtmodule.mounttable.lock:
+            if mtmodule.mounttable.mountinfo:
+                try:
+                    mtmodule.mounttable.mountinfo.close()
+                except:
+                    pass
+            mtmodule.mounttable.mountinfo = None
+            mtmodule.mounttable.poller = None
+
+    def install(self):
+        self.patch(enginemodule, "SHARESFOLDER", self.path("shares"))
+        self.patch(enginemodule, "LOG_LOCATION", self.path("log"))
+        self.patch(dbmodule, "XML_LOCATION", self.path("etc"))
+        self.patch(dbmodule, "RUNDIR", self.path("run", "xnas"))
+        self.patch(dbmodule, "LOCKFILE", self.path("run", "xnas", "xnas.xml.lock"))
+        self.patch(dbmodule, "CACHEFILE", self.path("run", "xnas", "xnas.xml.cache"))
+        self.patch(checkmodule, "CHECKCACHE", self.path("run", "xnas", "check.json"))
+        self.patch(checkmodule, "CHECKUSERCACHE", self.path("run", "xnas", "check-{}.json"))
+        self.patch(dynmodule, "MEDIAFOLDER", self.path("media"))
+        self.patch(dynmodule, "RUNFILE", self.path("run", "dynmount"))
+        self.patch(fstabmodule, "FSTABLOC", self.path("etc") + os.sep)
+        self.patch(fstabmodule, "FSTABFILE", self.path("etc", "fstab"))
+        self.patch(devmodule, "DEVBACKEND", "lsblk")
+        self.patch(devmodule, "SYSROOT", self.root)
+        self.patch(devmodule, "SYSBLOCK", self.path("sys", "class", "block"))
+        self.patch(devmodule, "SYSDISKS", self.path("sys", "block"))
+        self.patch(devmodule, "UDEVDATA", self.path("run", "udev", "data"))
+        self.patch(devmodule, "MOUNTINFO", self.path("proc", "mountinfo"))
+        self.patch(devmodule, "SWAPS", self.path("proc", "swaps"))
+        self.patch(devmodule, "DEVDIR", self.path("dev"))
+        self.patch(devmodule, "DEVICEPATHS", [self.path("dev", "disk", "by-path"), self.path("dev", "disk", "by-uuid"),
+                                              self.path("dev", "disk", "by-label")])
+        self.patch(mpmodule, "DEFAULTLOCATION", self.path("mnt"))
+        self.patch(mpmodule, "UUIDLOCATION", self.path("dev", "disk", "by-uuid"))
+        self.patch(mtmodule, "MOUNTINFO", self.path("proc", "mountinfo"))
+        self.patch(cifsmodule, "CONFIGFILE", self.path("etc", "smb.conf"))
+        self.patch(nfsmodule, "CONFIGFILE", self.path("etc", "exports"))
+        self.patch(nfsmodule, "CONFIGFILEBU", self.path("etc", "exports.bak"))
+        self.patch(nfsmodule, "DEFAULTSFILE", self.path("etc", "nfs-kernel-server"))
+        self.patch(cifsremotemodule, "CIFSCREDS", self.path("etc", "cifscredentials-"))
+        try:
+            # needs watchdog
+            import common.xnas_wd as wdmodule
+            self.patch(wdmodule, "DEVICE_LOC", self.path("dev", "disk", "by-path"))
+            self.patch(wdmodule, "MOUNTINFO", self.path("proc", "mountinfo"))
+        except ImportError:
+            pass
+        os.environ["XNAS_NODAEMON"] = "1"
+        self.execute = shell.execute
+        system = self
+        shell.execute = lambda sh, cmd, input, timeout: system.run(cmd, input, timeout)
+        self.resetState()
+
+    def uninstall(self):
+        if self.execute:
+            shell.execute = self.execute
+            self.execute = None
+        for module, name, value in reversed(self.saved):
+            setattr(module, name, value)
+        self.saved = []
+
+    def patch(self, module, name, value):
+        self.saved.append((module, name, getattr(module, name)))
+        setattr(module, name, value)
+
+    def run(self, cmd, input = None, timeout = None):
+        # answers a command as the system would, (returncode, stdout, stderr)
+        self.commands += 1
+        if self.forkcost:
+            time.sleep(self.forkcost)
+        args = cmd if isinstance(cmd, list) else shlex.split(cmd)
+        retval = 0, "", ""
+        if not args:
+            return retval
+        name = os.path.basename(args[0])
+        if name == "lsblk":
+            retval = 0, self.lsblk("-Jfpe7" in args), ""
+        elif name == "df":
+            retval = 0, self.df(args), ""
+        elif name == "zpool":
+            retval = 0, self.zpool(args), ""
+        elif name == "zfs":
+            retval = self.zfs(args)
+        elif name == "ping":
+            host = args[-1]
+            retval = (1, "", "") if host in self.down else (0, "", "")
+        elif name == "mount" or name == "umount":
+            retval = self.mountCmd(name, args)
+        elif name == "pdbedit":
+            retval = 0, "".join(["user{}:{}:User {}\n".format(u, 1000 + u, u) for u in range(USERS)]), ""
+        elif name == "hostname":
+            retval = 0, "192.168.1.2 \n", ""
+        return retval
+
+    def lsblk(self, human):
+        blockdevices = []
+        for i in range(self.disks):
+            mountpoint = self.diskMountpoint(i) if self.diskMountpoint(i) in self.mounted else None
+            part = {"name": self.diskFsname(i), "fstype": "ext4", "label": "disk{}".format(i), "uuid": self.diskUuid(i),
+                    "fssize": "931,5G" if human else str(DISKSIZE), "fsused": str(DISKUSED), "fsuse%": "20%",
+                    "mountpoint": mountpoint}
+            disk = {"name": self.diskFsname(i)[:-1], "fstype": None, "label": None, "uuid": None, "fssize": None,
+                    "fsused": None, "fsuse%": None, "mountpoint": None, "children": [part]}
+            blockdevices.append(disk)
+        for p in range(self.pools):
+            part = {"name": self.path("dev", "nvme{}n1p1".format(p)), "fstype": "zfs_member", "label": "pool{}".format(p),
+                    "uuid": "{:016d}".format(p + 1), "fssize": None, "fsused": None, "fsuse%": None, "mountpoint": None}
+            disk = {"name": self.path("dev", "nvme{}n1".format(p)), "fstype": None, "label": None, "uuid": None, "fssize": None,
+                    "fsused": None, "fsuse%": None, "mountpoint": None, "children": [part]}
+            blockdevices.append(disk)
+        return json.dumps({"blockdevices": blockdevices})
+
+    def df(self, args):
+        lines = ["Filesystem Size Use% Mounted on"]
+        if "-tzfs" in args:
+            for p in range(self.pools):
+                if self.poolMountpoint(p) in self.mounted:
+                    lines.append("pool{} 976762584 195352516 {}".format(p, self.poolMountpoint(p)))
+        else:
+            for j in range(self.remotes):
+                if self.remoteMountpoint(j) == args[-1] and self.remoteMountpoint(j) in self.mounted:
+                    lines.append("{} 976762584 195352516 {}".format(self.remoteUrl(j), self.remoteMountpoint(j)))
+        return "\n".join(lines) + "\n"
+
+    def zpool(self, args):
+        lines = []
+        for p in range(self.pools):
+            if "name,health" in args:
+                lines.append("pool{}\tONLINE".format(p))
+            else:
+                lines.append("pool{}".format(p))
+        return "".join([line + "\n" for line in lines])
+
+    def zfs(self, args):
+        pools = ["pool{}".format(p) for p in range(self.pools)]
+        retval = 0, "", ""
+        if len(args) > 1 and args[1] == "list":
+            if "-r" in args:
+                retval = 0, "".join(["{}\ton\toff\tnone\n".format(pool) for pool in pools]), ""
+            elif args[-1] in pools:
+                retval = 0, args[-1] + "\n", ""
+            else:
+                retval = 1, "", "dataset does not exist\n"
+        elif len(args) > 1 and args[1] == "get" and "name,property,value" in args:
+            # bulk query of all filesystems, properties are the last argument
+            lines = []
+            for pool in pools:
+                for prop in args[-1].split(","):
+                    lines.append("{}\t{}\t{}\n".format(pool, prop, self.zfsProperty(pool, prop)))
+            retval = 0, "".join(lines), ""
+        elif len(args) > 1 and args[1] == "get":
+            pool = args[-1]
+            if not pool in pools:
+                retval = 1, "", "dataset does not exist\n"
+            elif "mountpoint" in args:
+                retval = 0, self.poolMountpoint(int(pool[4:])) + "\n", ""
+            elif "readonly" in args:
+                retval = 0, "off\n", ""
+            else:
+                retval = 0, "on\n", ""
+        elif len(args) > 2 and args[1] in ["mount", "unmount"]:
+            pool = args[-1]
+            if pool in pools:
+                if args[1] == "mount":
+                    self.mount(self.poolMountpoint(int(pool[4:])))
+                else:
+                    self.unmount(self.poolMountpoint(int(pool[4:])))
+        return retval
+
+    def zfsProperty(self, pool, prop):
+        value = "on"
+        if prop == "mountpoint":
+            value = self.poolMountpoint(int(pool[4:]))
+        elif prop == "mounted":
+            value = "yes" if self.poolMountpoint(int(pool[4:])) in self.mounted else "no"
+        elif prop in ["readonly", "encryption"]:
+            value = "off"
+        elif prop == "keylocation":
+            value = "none"
+        elif prop == "compression":
+            value = "lz4"
+        return value
+
+    def mountCmd(self, name, args):
+        mountpoint = os.path.normpath(args[-1])
+        if name == "mount":
+            self.mount(mountpoint)
+        else:
+            self.unmount(mountpoint)
+        return 0, "", ""
+
+######################### MAIN ##########################
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+
+# -*- coding: utf-8 -*-
+#########################################################
+# SCRIPT : xnasbench.py                                 #
+#          Benchmarks of xnas commands and xservices    #
+#          on a fake system layer (see fixture.py)      #
+#          I. Helwegen 2020                             #
+#########################################################
+
+####################### IMPORTS #########################
+import io
+import sys
+import time
+import logging
+import argparse
+from threading import Lock
+from contextlib import redirect_stdout
+from fixture import fixture, FORKCOST
+from common.xnas_engine import xnas_engine
+from common.shell import shell
+#########################################################
+
+####################### GLOBALS #########################
+REPEATS = 5
+#########################################################
+
+###################### FUNCTIONS ########################
+
+def runCommand(cls, argv):
+    # as the command line would, output is dropped
+    with redirect_stdout(io.StringIO()):
+        try:
+            cls().run(argv)
+        except SystemExit:
+            pass
+
+def benchXnasShw(system):
+    from xnas import xnas
+    runCommand(xnas, ["xnas", "shw"])
+
+def benchXmountLst(system):
+    from xmount import xmount
+    runCommand(xmount, ["xmount", "lst"])
+
+def benchXnasChk(system):
+    from xnas import xnas
+    runCommand(xnas, ["xnas", "chk"])
+
+def benchOnAdded(system):
+    # all disks appear at once, e.g. after a hub is connected
+    from mounts.dynmount import dynmount
+    from mounts.mountfs import mountfs
+    from common.dynmountdata import dynmountdata
+    for i in range(system.disks):
+        system.unmount(system.diskMountpoint(i))
+    system.resetState()
+    engine = benchengine()
+    dyn = dynmount.__new__(dynmount)
+    dyn.engine = engine
+    dyn.verbose = False
+    dyn.zfshealth = False
+    dyn.removable = False
+    dyn.logger = logging.getLogger('xnas.dynmount')
+    dyn.xmounts = []
+    mountfs.__init__(dyn, dyn.logger)
+    dynmountdata.__init__(dyn, dyn.logger)
+    for i in range(system.disks):
+        dyn.onAdded(system.diskFsname(i))
+
+def benchEmptyBin(system):
+    from net.cifsemptybin import cifsemptybin
+    engine = benchengine()
+    emptybin = cifsemptybin(engine, manual = True)
+    emptybin.checkAndEmpty(emptybin.getBins())
+
+def measure(system, name, func, repeats):
+    times = []
+    commands = 0
+    for i in range(repeats):
+        system.resetState()
+        system.commands = 0
+        start = time.perf_counter()
+        func(system)
+        times.append(time.perf_counter() - start)
+        commands += system.commands
+    print("{:<24} {:>10.1f} {:>10.1f} {:>10.1f}".format(name, min(times) * 1000,
+          sum(times) / len(times) * 1000, commands / repeats))
+
+#########################################################
+
+#########################################################
+# Class : benchengine                                   #
+#########################################################
+class benchengine(xnas_engine):
+    # engine as in xservices
+    def __init__(self):
+        xnas_engine.__init__(self, "xservices")
+        self.mutex = Lock()
+
+######################### MAIN ##########################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmarks xnas on a fake system layer")
+    parser.add_argument("-d", "--disks", type = int, default = 50, help = "number of disks (default = 50)")
+    parser.add_argument("-r", "--remotes", type = int, default = 10, help = "number of remote mounts (default = 10)")
+    parser.add_argument("-s", "--shares", type = int, default = 100, help = "number of shares, each a cifs netshare (default = 100)")
+    parser.add_argument("-p", "--pools", type = int, default = 0, help = "number of zfs pools (default = 0)")
+    parser.add_argument("-f", "--forkcost", type = float, default = FORKCOST, help = "simulated time per command [s] (default = {})".format(FORKCOST))
+    parser.add_argument("-n", "--repeats", type = int, default = REPEATS, help = "repeats per benchmark (default = {})".format(REPEATS))
+    parser.add_argument("benchmarks", nargs = "*", help = "benchmarks to run (default = all)")
+    args = parser.parse_args()
+
+    benchmarks = [("xnas shw", benchXnasShw), ("xmount lst", benchXmountLst), ("xnas chk", benchXnasChk),
+                  ("dynmount.onAdded burst", benchOnAdded), ("cifsemptybin scan", benchEmptyBin)]
+    system = fixture(args.disks, args.remotes, args.shares, args.pools, args.forkcost)
+    try:
+        print("fixture: {} disks, {} remotes, {} shares, {} pools, {} ms per command".format(args.disks,
+              args.remotes, args.shares, args.pools, args.forkcost * 1000))
+        print("{:<24} {:>10} {:>10} {:>10}".format("benchmark", "min [ms]", "mean [ms]", "commands"))
+        for name, func in benchmarks:
+            if args.benchmarks and not name.split()[0] in args.benchmarks and not name in args.benchmarks:
+                continue
+            try:
+                measure(system, name, func, args.repeats)
+            except ImportError as e:
+                print("{:<24} skipped: {}".format(name, e))
+    finally:
+        system.remove()
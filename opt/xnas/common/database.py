@@ -9,15 +9,38 @@
 ####################### IMPORTS #########################
 import os
 import xml.etree.ElementTree as ET
-from xml.dom.minidom import parseString
+from xml.sax.saxutils import escape
 import random
+import fcntl
+import tempfile
+import marshal
+import stat
+import time
 import string
+from collections.abc import Mapping
 from common.xnas_engine import groups # database is always imported in engine
+from common.records import records
 #########################################################
 
 ####################### GLOBALS #########################
 XML_FILENAME     = "xnas.xml"
+XML_LOCATION     = "/etc/"
 ENCODING         = 'utf-8'
+XML_COMMENT      = ("This XML file describes the XNAS configuration.\n"
+                    "            This file is managed by XNAS, edit at your own risk.")
+XML_INDENT       = "\t"
+RUNDIR           = "/run/xnas"
+# Serializes writers of the database (CLI and xservices), a writer merges its
+# changes into the file if it was written after it was loaded
+LOCKFILE         = os.path.join(RUNDIR, "xnas.xml.lock")
+# Parsed database, valid as long as inode, size, mtime, mode and owner of the
+# file match
+CACHEFILE        = os.path.join(RUNDIR, "xnas.xml.cache")
+CACHEVERSION     = 3
+CACHERACY        = 2 # don't cache a file that may still change within mtime resolution [s]
+# Secondary indexes, maintained on load, add and remove. Indexed keys are
+# never changed in place, items are replaced with addToGroup
+INDEXES          = {groups.MOUNTS: ['uuid'], groups.SHARES: ['xmount'], groups.REMOTEMOUNTS: ['type']}
 #########################################################
 
 ###################### FUNCTIONS ########################
@@ -28,9 +51,21 @@ ENCODING         = 'utf-8'
 # Class : database                                      #
 #########################################################
 class database(object):
+    # A long running process may keep the parsed database, to hand it out
+    # again as long as the file didn't change
+    keepSnapshot = False
+    snapshot = None
+
     def __init__(self, logger):
         self.logger = logger
         self.db = {}
+        self.comment = XML_COMMENT
+        self.loaded = None
+        self.indexes = {}
+        self.indexFuncs = {}
+        for group, keys in INDEXES.items():
+            for key in keys:
+                self.indexFuncs[(group, key)] = None
         if not self.getXMLpath(False):
             # only create xml if super user, otherwise keep empty
             self.createXML()
@@ -57,12 +92,12 @@ class database(object):
         return retval
 
     def checkKey(self, group, key):
-        retval = None
-        if group in self.db:
-            if self.db[group]:
-                if key in self.db[group]:
-                    retval = self.db[group][key]
-        return retval
+        # a group that is a record (settings) gives the default of an unset
+        # field, also if the group itself is not in the database
+        items = self.db.get(group)
+        if not isinstance(items, Mapping):
+            items = records().newGroup(group)
+        return items.get(key)
 
     def checkKeyDef(self, group, key, default):
         retval = self.checkKey(group, key)
@@ -73,7 +108,12 @@ class database(object):
     def findInGroup(self, group, key, value):
         retkey = None
         retval = None
-        if group in self.db:
+        names = self.findInIndex(group, key, value)
+        if names != None:
+            if names:
+                retkey = names[0]
+                retval = self.db[group][retkey]
+        elif group in self.db:
             if self.db[group]:
                 for ikey, ivalue in self.db[group].items():
                     try:
@@ -88,7 +128,11 @@ class database(object):
     def findAllInGroup(self, group, key, value):
         retkey = None
         retval = {}
-        if group in self.db:
+        names = self.findInIndex(group, key, value)
+        if names != None:
+            for name in names:
+                retval[name] = self.db[group][name]
+        elif group in self.db:
             if self.db[group]:
                 for ikey, ivalue in self.db[group].items():
                     try:
@@ -100,19 +144,60 @@ class database(object):
         return retval
 
     def addToGroup(self, group, item):
-        if not group in self.db:
-            self.db[group]={}
-        if not isinstance(self.db[group], dict):
-            self.db[group]={}
-        self.db[group].update(item)
+        if not group in self.db or not isinstance(self.db[group], Mapping):
+            self.db[group] = records().newGroup(group)
+            self.buildIndexes(group)
+        if group in records.GROUPS:
+            self.db[group].update(item)
+        else:
+            for name, value in item.items():
+                self.db[group][name] = records().newItem(group, value)
+        for name in item:
+            self.indexItem(group, name)
 
     def removeFromGroup(self, group, item):
         retval = False
         if self.checkKey(group, item):
+            self.unindexItem(group, item)
             self.db[group].pop(item)
             retval = True
         return retval
 
+    def addIndex(self, group, key, keyfunc = None):
+        # keyfunc(item) returns the value to index, e.g. an url built from an item
+        self.indexFuncs[(group, key)] = keyfunc
+        self.buildIndex(group, key)
+
+    def findInIndex(self, group, key, value):
+        # returns None if not indexed, otherwise the names in database order
+        names = None
+        if (group, key) in self.indexes:
+            try:
+                names = list(self.indexes[(group, key)][0].get(value, []))
+            except TypeError: # unhashable value
+                return None
+            if len(names) > 1:
+                names = [name for name in self.db[group] if name in names]
+        return names
+
+    def diffDB(self, db):
+        # changed items per group compared to db, {group: {name: (old, new)}}
+        # old or new is None if the item was added or removed
+        changes = {}
+        for group in list(db.keys()) + [group for group in self.db.keys() if not group in db]:
+            old = db.get(group)
+            new = self.db.get(group)
+            if not isinstance(old, Mapping):
+                old = {}
+            if not isinstance(new, Mapping):
+                new = {}
+            for name in list(old.keys()) + [name for name in new.keys() if not name in old]:
+                if not name in old or not name in new or old[name] != new[name]:
+                    if not group in changes:
+                        changes[group] = {}
+                    changes[group][name] = (old.get(name), new.get(name))
+        return changes
+
     def generateUniqueName(self, group, value, value2 = "", value3 = ""):
         name = ""
         pname = ""
@@ -196,6 +281,52 @@ class database(object):
 
     ################## INTERNAL FUNCTIONS ###################
 
+    def buildIndexes(self, group = None):
+        for igroup, key in list(self.indexFuncs.keys()):
+            if not group or igroup == group:
+                self.buildIndex(igroup, key)
+
+    def buildIndex(self, group, key):
+        values = {}
+        names = {}
+        if group in self.db and isinstance(self.db[group], Mapping):
+            keyfunc = self.indexFuncs[(group, key)]
+            for name, item in self.db[group].items():
+                try:
+                    value = self.getIndexValue(item, key, keyfunc)
+                    values.setdefault(value, []).append(name)
+                    names[name] = value
+                except:
+                    pass
+        self.indexes[(group, key)] = (values, names)
+
+    def indexItem(self, group, name, key = None):
+        for igroup, ikey in list(self.indexes.keys()):
+            if igroup == group and (not key or ikey == key):
+                self.unindexItem(group, name, ikey)
+                values, names = self.indexes[(igroup, ikey)]
+                try:
+                    value = self.getIndexValue(self.db[group][name], ikey, self.indexFuncs[(igroup, ikey)])
+                    values.setdefault(value, []).append(name)
+                    names[name] = value
+                except:
+                    pass
+
+    def unindexItem(self, group, name, key = None):
+        for igroup, ikey in list(self.indexes.keys()):
+            if igroup == group and (not key or ikey == key):
+                values, names = self.indexes[(igroup, ikey)]
+                if name in names:
+                    value = names.pop(name)
+                    values[value].remove(name)
+                    if not values[value]:
+                        values.pop(value)
+
+    def getIndexValue(self, item, key, keyfunc):
+        if keyfunc:
+            return keyfunc(item)
+        return item[key]
+
     def decodeName(self, value):
         name = ""
         if value == "/":
@@ -212,94 +343,239 @@ class database(object):
     def getXML(self):
         XMLpath = self.getXMLpath()
         try:
-            tree = ET.parse(XMLpath)
-            root = tree.getroot()
-            self.db = self.parseKids(root)
+            xmlstat = self.statXML(XMLpath)
+            if database.snapshot and database.snapshot[0] == xmlstat:
+                plain, self.comment = database.snapshot[1:]
+            else:
+                cache = self.loadCache(xmlstat)
+                if cache:
+                    plain, self.comment = cache
+                else:
+                    # keep the comment, to write it back on update
+                    parser = ET.XMLParser(target = ET.TreeBuilder(insert_comments = True))
+                    tree = ET.parse(XMLpath, parser)
+                    root = tree.getroot()
+                    self.comment = self.getXMLcomment(root)
+                    plain, errors = records().parse(self.parseKids(root, True), self.gettype)
+                    for error in errors:
+                        self.logger.error("Error in xml file: {}".format(error))
+                    self.saveCache(xmlstat, plain)
+                if database.keepSnapshot:
+                    database.snapshot = (xmlstat, plain, self.comment)
+            # records don't share data with the snapshot
+            self.db = records().load(plain)
+            self.loaded = (xmlstat, plain)
+            self.buildIndexes()
         except Exception as e:
             self.logger.error("Error parsing xml file")
             self.logger.error("Check XML file syntax for errors")
             self.logger.exception(e)
             exit(1)
 
-    def parseKids(self, item):
+    def statXML(self, XMLpath):
+        # owner and mode are included, the cache follows a chmod or chown
+        xmlstat = os.stat(XMLpath)
+        return (xmlstat.st_ino, xmlstat.st_size, xmlstat.st_mtime_ns, stat.S_IMODE(xmlstat.st_mode), xmlstat.st_uid)
+
+    def loadCache(self, xmlstat):
+        retval = None
+        try:
+            with open(CACHEFILE, "rb") as cache_file:
+                cachestat = os.fstat(cache_file.fileno())
+                if self.trustCache(cachestat, xmlstat):
+                    version, cachexmlstat, comment, db = marshal.loads(cache_file.read())
+                    if version == CACHEVERSION and cachexmlstat == xmlstat:
+                        retval = (db, comment)
+        except:
+            pass
+        return retval
+
+    def trustCache(self, cachestat, xmlstat):
+        # only trust a cache that can only be written by root or the owner of
+        # the database and is not readable by more users than the database
+        retval = False
+        if stat.S_ISREG(cachestat.st_mode) and cachestat.st_uid in [0, xmlstat[4]]:
+            mode = stat.S_IMODE(cachestat.st_mode)
+            retval = not mode & 0o022 and not mode & ~xmlstat[3]
+        return retval
+
+    def saveCache(self, xmlstat, plain):
+        if time.time() - xmlstat[2] / 1e9 < CACHERACY:
+            return
+        tmppath = ""
+        try:
+            if os.getuid() == 0 and not os.path.isdir(RUNDIR):
+                os.makedirs(RUNDIR)
+            fd, tmppath = tempfile.mkstemp(prefix = ".{}.".format(os.path.basename(CACHEFILE)), dir = RUNDIR)
+            with os.fdopen(fd, "wb") as cache_file:
+                # not readable by more users than the database itself
+                os.fchmod(cache_file.fileno(), xmlstat[3] & ~0o022)
+                cache_file.write(marshal.dumps((CACHEVERSION, xmlstat, self.comment, plain)))
+            os.replace(tmppath, CACHEFILE)
+        except:
+            # not allowed to write, or not marshallable, just don't cache
+            if tmppath:
+                try:
+                    os.remove(tmppath)
+                except:
+                    pass
+
+    def parseKids(self, item, raw = False):
+        # raw keeps the texts, to be typed by the records
         db = {}
         if self.hasKids(item):
             for kid in item:
+                if kid.tag is ET.Comment:
+                    continue
                 if self.hasKids(kid):
-                    db[kid.tag] = self.parseKids(kid)
+                    db[kid.tag] = self.parseKids(kid, raw)
                 else:
-                    db.update(self.parseKids(kid))
+                    db.update(self.parseKids(kid, raw))
         else:
-            db[item.tag] = self.gettype(item.text)
+            if raw:
+                db[item.tag] = item.text if item.text else ""
+            else:
+                db[item.tag] = self.gettype(item.text)
         return db
 
     def hasKids(self, item):
         retval = False
         for kid in item:
-            retval = True
-            break
+            if not kid.tag is ET.Comment:
+                retval = True
+                break
         return retval
 
     def updateXML(self):
-        db = ET.Element('config')
-        comment = ET.Comment(self.getXMLcomment("config"))
-        db.append(comment)
-        self.buildXML(db, self.db)
-
         XMLpath = self.getXMLpath(dowrite = True)
-
-        with open(XMLpath, "w") as xml_file:
-            xml_file.write(self.prettify(db))
-
-    def buildXML(self, xmltree, item):
-        if isinstance(item, dict):
-            for key, value in item.items():
-                kid = ET.SubElement(xmltree, key)
-                self.buildXML(kid, value)
-        else:
-            xmltree.text = self.settype(item)
+        lock = self.lockXML()
+        try:
+            self.mergeXML(XMLpath)
+            self.writeXML(XMLpath, self.prettify(self.comment, self.db))
+            self.loaded = (self.statXML(XMLpath), records().dump(self.db))
+        finally:
+            self.unlockXML(lock)
+
+    def mergeXML(self, XMLpath):
+        # If another process wrote the database after it was loaded here, load
+        # it again and make the changes done here on top of it
+        if self.loaded:
+            xmlstat, plain = self.loaded
+            if self.statXML(XMLpath) != xmlstat:
+                changes = self.diffDB(plain)
+                self.reload()
+                for group, items in changes.items():
+                    for name, (old, new) in items.items():
+                        if new == None:
+                            self.removeFromGroup(group, name)
+                        else:
+                            self.addToGroup(group, {name: new})
 
     def createXML(self):
         self.logger.info("Creating new XML file")
-        db = ET.Element('config')
-        comment = ET.Comment("This XML file describes the XNAS configuration.\n"
-        "            This file is managed by XNAS, edit at your own risk.")
-        db.append(comment)
         sections = {groups.SETTINGS: "", groups.MOUNTS: "", groups.REMOTEMOUNTS: "", groups.SHARES: "", groups.NETSHARES: ""}
-        for key, value in sections.items():
-            child = ET.SubElement(db, key)
         XMLpath = self.getNewXMLpath()
+        lock = self.lockXML()
+        try:
+            self.writeXML(XMLpath, self.prettify(XML_COMMENT, sections))
+        finally:
+            self.unlockXML(lock)
+
+    def writeXML(self, XMLpath, content):
+        # Write a new file and rename it over the old one, so after a crash
+        # the database is either completely old or completely new
+        xmldir = os.path.dirname(XMLpath)
+        fd, tmppath = tempfile.mkstemp(prefix = ".{}.".format(XML_FILENAME), dir = xmldir)
+        try:
+            with os.fdopen(fd, "w", encoding = ENCODING) as xml_file:
+                self.copyMode(XMLpath, xml_file.fileno())
+                xml_file.write(content)
+                xml_file.flush()
+                os.fsync(xml_file.fileno())
+            os.replace(tmppath, XMLpath)
+        except:
+            try:
+                os.remove(tmppath)
+            except:
+                pass
+            raise
+        self.syncDir(xmldir)
+
+    def copyMode(self, XMLpath, fd):
+        mode = 0o644
+        try:
+            xmlstat = os.stat(XMLpath)
+            mode = xmlstat.st_mode & 0o7777
+            os.fchown(fd, xmlstat.st_uid, xmlstat.st_gid)
+        except:
+            pass
+        os.fchmod(fd, mode)
 
-        with open(XMLpath, "w") as xml_file:
-            xml_file.write(self.prettify(db))
+    def syncDir(self, xmldir):
+        try:
+            dirfd = os.open(xmldir, os.O_RDONLY)
+            try:
+                os.fsync(dirfd)
+            finally:
+                os.close(dirfd)
+        except:
+            pass
 
-    def getXMLcomment(self, tag):
-        comment = ""
-        XMLpath = self.getXMLpath()
-        with open(XMLpath, 'r') as xml_file:
-            content = xml_file.read()
-            xmltag = "<{}>".format(tag)
-            xmlend = "</{}>".format(tag)
-            begin = content.find(xmltag)
-            end = content.find(xmlend)
-            content = content[begin:end]
-            cmttag = "<!--"
-            cmtend = "-->"
-            begin = content.find(cmttag)
-            end = content.find(cmtend)
-            if (begin > -1) and (end > -1):
-                comment = content[begin+len(cmttag):end]
+    def lockXML(self):
+        # advisory, continue without lock if the lock file is not available
+        lock = None
+        try:
+            if not os.path.isdir(RUNDIR):
+                os.makedirs(RUNDIR)
+            lock = open(LOCKFILE, "a")
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        except:
+            if lock:
+                lock.close()
+                lock = None
+        return lock
+
+    def unlockXML(self, lock):
+        if lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            except:
+                pass
+            lock.close()
+
+    def getXMLcomment(self, root):
+        comment = XML_COMMENT
+        for kid in root:
+            if kid.tag is ET.Comment:
+                comment = kid.text
+                break
         return comment
 
-    def prettify(self, elem):
-        """Return a pretty-printed XML string for the Element.
+    def prettify(self, comment, db):
+        """Return a pretty-printed XML string for the database.
         """
-        rough_string = ET.tostring(elem, ENCODING)
-        reparsed = parseString(rough_string)
-        return reparsed.toprettyxml(indent="\t").replace('<?xml version="1.0" ?>','<?xml version="1.0" encoding="%s"?>' % ENCODING)
+        lines = ['<?xml version="1.0" encoding="{}"?>'.format(ENCODING), "<config>"]
+        if comment != None:
+            lines.append("{}<!--{}-->".format(XML_INDENT, comment))
+        self.prettifyKids(lines, db, XML_INDENT)
+        lines.append("</config>")
+        return "\n".join(lines) + "\n"
+
+    def prettifyKids(self, lines, item, indent):
+        for key, value in item.items():
+            if isinstance(value, Mapping) and value:
+                lines.append("{}<{}>".format(indent, key))
+                self.prettifyKids(lines, value, indent + XML_INDENT)
+                lines.append("{}</{}>".format(indent, key))
+            else:
+                text = "" if isinstance(value, Mapping) else self.settype(value)
+                if text:
+                    lines.append("{}<{}>{}</{}>".format(indent, key, escape(text, {'"': "&quot;"}), key))
+                else:
+                    lines.append("{}<{}/>".format(indent, key))
 
     def getXMLpath(self, doexit = True, dowrite = False):
-        etcpath = "/etc/"
+        etcpath = XML_LOCATION
         XMLpath = ""
         # first look in etc
         if os.path.isfile(os.path.join(etcpath,XML_FILENAME)):
@@ -316,7 +592,7 @@ class database(object):
         return XMLpath
 
     def getNewXMLpath(self):
-        etcpath = "/etc/"
+        etcpath = XML_LOCATION
         XMLpath = ""
         # first look in etc
         if os.path.exists(etcpath):
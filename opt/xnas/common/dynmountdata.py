@@ -11,6 +11,7 @@ import os
 import logging
 import time
 import json
+from collections.abc import Mapping
 from common.xnas_engine import groups
 from mounts.mountpoint import mountpoint
 from mounts.devices import devices
@@ -97,6 +98,22 @@ class dynmountdata(mountpoint, devices):
             refsena.append(refshare['enabled'])
         return refs, refsena
 
+    def getChanged(self, changes, group):
+        # names in group that changed or of which the referring shares changed,
+        # None if everything needs to be processed
+        names = None
+        if changes != None:
+            names = []
+            if group in changes:
+                names.extend(changes[group].keys())
+            if groups.SHARES in changes:
+                for old, new in changes[groups.SHARES].values():
+                    for refshare in [old, new]:
+                        if isinstance(refshare, Mapping) and 'xmount' in refshare:
+                            if not refshare['xmount'] in names:
+                                names.append(refshare['xmount'])
+        return names
+
     def checkReferences(self, engine, name, verbose = True):
         refs, refsena = self.getReferences(engine, name)
         i = 0
@@ -185,6 +202,20 @@ class dynmountdata(mountpoint, devices):
                 break
         return dmitem
 
+    @classmethod
+    def mountDynmount(cls, mountpoint, mounted):
+        # only follows mounted state, other health states are not overruled
+        xmounts = []
+        health = "ONLINE" if mounted else "OFFLINE"
+        for item in cls.dynmounts:
+            if item['mountpoint'] and os.path.normpath(item['mountpoint']) == mountpoint:
+                if item['health'] in ["ONLINE", "OFFLINE"] and item['health'] != health:
+                    item['health'] = health
+                    xmounts.append(item['xmount'])
+        if xmounts:
+            cls.monUpdate()
+        return xmounts
+
     @classmethod
     def getDynmountMounted(cls, xmount):
         mounted = False
@@ -30,9 +30,9 @@ class ip(object):
 
     def get(self):
         myIp = ""
-        cmd = "hostname -I"
+        cmd = ["hostname", "-I"]
         try:
-            myIp = shell().command(cmd).strip().split()[0]
+            myIp = shell().command(cmd, idempotent = True).strip().split()[0]
         except:
             pass
         return myIp
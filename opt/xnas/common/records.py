@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+#########################################################
+# SERVICE : records.py                                  #
+#           Typed records for the items in the database #
+#                                                       #
+#           I. Helwegen 2020                            #
+#########################################################
+
+####################### IMPORTS #########################
+from copy import deepcopy
+from collections.abc import Mapping, MutableMapping
+from common.xnas_engine import groups # records are always imported in database
+#########################################################
+
+####################### GLOBALS #########################
+BOOLTEXT = {"true": True, "false": False}
+# immutable values, don't need to be copied
+SCALARS  = (str, int, float, bool, type(None))
+#########################################################
+
+###################### FUNCTIONS ########################
+
+#########################################################
+
+#########################################################
+# Class : record                                        #
+#########################################################
+class record(MutableMapping):
+    # Declared fields (name, type, default) are kept in slots, the record
+    # behaves as the dict it replaces: an unset field is an absent key, but
+    # reads as its default, and keys that are not declared are kept in extra.
+    # Texts are converted to the declared types when parsing the xml
+    FIELDS = ()
+    __slots__ = ("extra",)
+
+    def __init_subclass__(cls):
+        cls.TYPES = {}
+        for name, ftype, default in cls.FIELDS:
+            cls.TYPES[name] = (ftype, default)
+
+    def __init__(self, values = None):
+        self.extra = None
+        if values:
+            for key, value in values.items():
+                self[key] = value
+
+    def __getitem__(self, key):
+        if key in self.TYPES:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                return self.TYPES[key][1]
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.TYPES:
+            setattr(self, key, value)
+        else:
+            if self.extra == None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.TYPES:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        elif self.extra and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self.TYPES:
+            return hasattr(self, key)
+        return bool(self.extra) and key in self.extra
+
+    def __iter__(self):
+        for name, ftype, default in self.FIELDS:
+            if hasattr(self, name):
+                yield name
+        if self.extra:
+            yield from list(self.extra)
+
+    def __len__(self):
+        length = len(self.extra) if self.extra else 0
+        for name, ftype, default in self.FIELDS:
+            if hasattr(self, name):
+                length += 1
+        return length
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, dict(self.items()))
+
+    def __deepcopy__(self, memo):
+        return type(self)(deepcopy(dict(self.items()), memo))
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def copy(self):
+        return type(self)(self)
+
+    @classmethod
+    def fromValues(cls, values):
+        # a record that doesn't share data with values
+        item = cls.__new__(cls)
+        item.extra = None
+        for key, value in values.items():
+            if not type(value) in SCALARS:
+                value = deepcopy(value)
+            if key in cls.TYPES:
+                setattr(item, key, value)
+            else:
+                if item.extra == None:
+                    item.extra = {}
+                item.extra[key] = value
+        return item
+
+    @classmethod
+    def parse(cls, texts, gettype):
+        # texts from the xml to the declared types, other keys and empty
+        # texts are guessed (an empty text stays "", as it always was)
+        values = {}
+        errors = []
+        for key, text in texts.items():
+            if key in cls.TYPES and text:
+                ftype, default = cls.TYPES[key]
+                try:
+                    values[key] = cls.fromText(text, ftype)
+                except ValueError:
+                    errors.append("{}: {} expected, found '{}'".format(key, ftype.__name__, text))
+                    values[key] = records.guessTypes(text, gettype)
+            else:
+                values[key] = records.guessTypes(text, gettype)
+        return values, errors
+
+    @classmethod
+    def fromText(cls, text, ftype):
+        if not isinstance(text, str):
+            raise ValueError
+        if ftype == str:
+            return text
+        if ftype == bool:
+            value = BOOLTEXT.get(text.lower())
+            if value == None:
+                raise ValueError
+            return value
+        return ftype(text)
+
+#########################################################
+# Class : mountrecord                                   #
+#########################################################
+class mountrecord(record):
+    FIELDS = (("uuid", str, ""), ("zfs", bool, False), ("mountpoint", str, ""), ("method", str, "disabled"))
+    __slots__ = tuple(field[0] for field in FIELDS)
+
+#########################################################
+# Class : remotemountrecord                             #
+#########################################################
+class remotemountrecord(record):
+    FIELDS = (("https", bool, False), ("server", str, ""), ("sharename", str, ""), ("type", str, ""),
+              ("mountpoint", str, ""), ("method", str, "disabled"))
+    __slots__ = tuple(field[0] for field in FIELDS)
+
+#########################################################
+# Class : sharerecord                                   #
+#########################################################
+class sharerecord(record):
+    FIELDS = (("xmount", str, ""), ("remotemount", bool, False), ("folder", str, ""), ("enabled", bool, True))
+    __slots__ = tuple(field[0] for field in FIELDS)
+
+#########################################################
+# Class : netsharerecord                                #
+#########################################################
+class netsharerecord(record):
+    FIELDS = (("type", str, "cifs"), ("enabled", bool, True), ("recyclemaxage", int, 0))
+    __slots__ = tuple(field[0] for field in FIELDS)
+
+#########################################################
+# Class : settingsrecord                                #
+#########################################################
+class settingsrecord(record):
+    FIELDS = (("srvenable", bool, True), ("dyninterval", int, 60), ("dynzfshealth", bool, False),
+              ("dynremovable", bool, False), ("cifsautobinenable", bool, True), ("autofixenable", bool, True),
+              ("autofixretries", int, 3), ("autofixinterval", int, 60), ("zfsmountrecursive", bool, True),
+              ("remoteprobe", str, "icmp"), ("probetimeout", int, 2))
+    __slots__ = tuple(field[0] for field in FIELDS)
+
+#########################################################
+# Class : records                                       #
+#########################################################
+class records(object):
+    # groups with a record per item, and groups that are a record themselves
+    ITEMS  = {groups.MOUNTS: mountrecord, groups.REMOTEMOUNTS: remotemountrecord,
+              groups.SHARES: sharerecord, groups.NETSHARES: netsharerecord}
+    GROUPS = {groups.SETTINGS: settingsrecord}
+
+    def __init__(self):
+        pass
+
+    def __del__(self):
+        pass
+
+    def parse(self, db, gettype):
+        # db with the texts from the xml, returns plain typed data and errors
+        plain = {}
+        errors = []
+        for group, items in db.items():
+            if not isinstance(items, Mapping):
+                plain[group] = items
+            elif group in records.GROUPS:
+                plain[group], grouperrors = records.GROUPS[group].parse(items, gettype)
+                errors.extend(["{}: {}".format(group, error) for error in grouperrors])
+            elif group in records.ITEMS:
+                plain[group] = {}
+                for name, item in items.items():
+                    if isinstance(item, Mapping):
+                        plain[group][name], itemerrors = records.ITEMS[group].parse(item, gettype)
+                        errors.extend(["{}/{}: {}".format(group, name, error) for error in itemerrors])
+                    else:
+                        plain[group][name] = records.guessTypes(item, gettype)
+            else:
+                plain[group] = records.guessTypes(items, gettype)
+        return plain, errors
+
+    def load(self, plain):
+        # plain data to records, the plain data is not shared
+        db = {}
+        for group, items in plain.items():
+            if not isinstance(items, Mapping):
+                db[group] = items
+            elif group in records.GROUPS:
+                db[group] = records.GROUPS[group].fromValues(items)
+            else:
+                db[group] = {}
+                for name, item in items.items():
+                    db[group][name] = self.newItem(group, item)
+        return db
+
+    def dump(self, db):
+        # records to plain data, e.g. to cache
+        plain = {}
+        for group, items in db.items():
+            if not isinstance(items, Mapping):
+                plain[group] = items
+            elif group in records.GROUPS:
+                plain[group] = self.copyValues(items)
+            else:
+                plain[group] = {}
+                for name, item in items.items():
+                    plain[group][name] = self.copyValues(item) if isinstance(item, Mapping) else item
+        return plain
+
+    def newGroup(self, group):
+        if group in records.GROUPS:
+            return records.GROUPS[group]()
+        return {}
+
+    def newItem(self, group, item):
+        if group in records.ITEMS and isinstance(item, Mapping):
+            return records.ITEMS[group].fromValues(item)
+        return deepcopy(item)
+
+    def copyValues(self, item):
+        values = {}
+        for key, value in item.items():
+            if not type(value) in SCALARS:
+                value = deepcopy(value)
+            values[key] = value
+        return values
+
+    @classmethod
+    def guessTypes(cls, texts, gettype):
+        if isinstance(texts, Mapping):
+            values = {}
+            for key, text in texts.items():
+                values[key] = cls.guessTypes(text, gettype)
+            return values
+        return gettype(texts)
+
+######################### MAIN ##########################
+if __name__ == "__main__":
+    pass
@@ -7,11 +7,24 @@
 #########################################################
 
 ####################### IMPORTS #########################
+import os
+import sys
+import json
+import time
+import atexit
 import subprocess
+from threading import Lock, get_ident
+from collections import deque
 #########################################################
 
 ####################### GLOBALS #########################
 CMDNOTEXIST = 127
+# Profile external commands: report to stderr at exit and/or write a chrome
+# trace (chrome://tracing, perfetto) to the file in XNAS_TRACE. Only the last
+# PROFILEMAX commands and phases are kept, xservices may profile for days
+PROFILEENV  = "XNAS_PROFILE"
+TRACEENV    = "XNAS_TRACE"
+PROFILEMAX  = 100000
 #########################################################
 
 ###################### FUNCTIONS ########################
@@ -22,28 +35,55 @@ CMDNOTEXIST = 127
 # Class : shell                                         #
 #########################################################
 class shell(object):
+    # Output of idempotent commands, per invocation. A command that changes
+    # the system may change what others return, so it clears the memo and
+    # bumps the generation, so results read before it are not stored.
+    memo = {}
+    memoLock = Lock()
+    memoEnable = False
+    memoGeneration = 0
+    # Commands run while profiling, None if not profiling
+    profile = None
+    profileLock = Lock()
+    traceFile = ""
+
     def __init__(self):
         pass
 
     def __del__(self):
         pass
 
-    def runCommand(self, cmd, input = None, timeout = None):
-        retval = 127, "", ""
-        if input:
-            input = input.encode("utf-8")
-        try:
-            if timeout == 0:
-                timout = None
-            out = subprocess.run(cmd, shell=True, capture_output=True, input = input, timeout = timeout)
-            retval = out.returncode, out.stdout.decode("utf-8"), out.stderr.decode("utf-8")
-        except subprocess.TimeoutExpired:
-            retval = 124, "", ""
+    def runCommand(self, cmd, input = None, timeout = None, idempotent = False, readonly = False):
+        # cmd is a shell command line or an argv list (run without shell)
+        # readonly commands (ping, status) may return other output each time,
+        # but don't change the system
+        profiling = shell.profile != None
+        if profiling:
+            start = time.time()
+        key = None
+        retval = None
+        if idempotent and shell.memoEnable and not input:
+            key = (tuple(cmd) if isinstance(cmd, list) else cmd, timeout)
+            with shell.memoLock:
+                retval = shell.memo.get(key)
+                generation = shell.memoGeneration
+        cached = retval != None
+        if not cached:
+            retval = self.execute(cmd, input, timeout)
+            if key:
+                with shell.memoLock:
+                    if generation == shell.memoGeneration:
+                        shell.memo[key] = retval
+            elif not idempotent and not readonly:
+                shell.invalidate()
+
+        if profiling:
+            shell.record(cmd, start, time.time(), retval, cached)
 
         return retval
 
-    def command(self, cmd, retcode = 0, input = None, timeout = None, timeoutError = False):
-        returncode, stdout, stderr = self.runCommand(cmd, input, timeout)
+    def command(self, cmd, retcode = 0, input = None, timeout = None, timeoutError = False, idempotent = False, readonly = False):
+        returncode, stdout, stderr = self.runCommand(cmd, input, timeout, idempotent, readonly)
 
         if returncode == 124 and not timeoutError:
             returncode = 0
@@ -53,16 +93,201 @@ class shell(object):
         return stdout
 
     def commandExists(self, cmd):
-        returncode, stdout, stderr = self.runCommand(cmd)
+        returncode, stdout, stderr = self.runCommand(cmd, idempotent = True)
 
         return returncode != CMDNOTEXIST
 
+    @classmethod
+    def startProfile(cls, traceFile = ""):
+        with cls.profileLock:
+            if cls.profile == None:
+                cls.profile = deque(maxlen = PROFILEMAX)
+                atexit.register(cls.stopProfile)
+            if traceFile:
+                cls.traceFile = traceFile
+
+    @classmethod
+    def stopProfile(cls):
+        # prints the report and writes the trace, if profiling
+        with cls.profileLock:
+            profile = cls.profile
+            cls.profile = None
+        if profile != None:
+            try:
+                print(cls.report(profile), file = sys.stderr)
+            except:
+                pass
+            if cls.traceFile:
+                cls.writeTrace(profile, cls.traceFile)
+
+    @classmethod
+    def record(cls, cmd, start, end, retval, cached):
+        entry = {}
+        entry['cmd'] = " ".join(cmd) if isinstance(cmd, list) else cmd
+        entry['caller'] = cls.getCaller()
+        entry['start'] = start
+        entry['time'] = end - start
+        entry['exitcode'] = retval[0]
+        entry['stdout'] = len(retval[1])
+        entry['stderr'] = len(retval[2])
+        entry['cached'] = cached
+        entry['pid'] = os.getpid()
+        entry['tid'] = get_ident()
+        with cls.profileLock:
+            if cls.profile != None:
+                cls.profile.append(entry)
+
+    @classmethod
+    def recordPhase(cls, name, start, end):
+        # a step in xnas itself, to compare with the commands run in it
+        entry = {}
+        entry['phase'] = name
+        entry['caller'] = cls.getCaller()
+        entry['start'] = start
+        entry['time'] = end - start
+        entry['pid'] = os.getpid()
+        entry['tid'] = get_ident()
+        with cls.profileLock:
+            if cls.profile != None:
+                cls.profile.append(entry)
+
+    @classmethod
+    def report(cls, profile):
+        # time per command (program and subcommand), most expensive first
+        commands = {}
+        phases = {}
+        total = 0
+        for entry in profile:
+            if 'phase' in entry:
+                if not entry['phase'] in phases:
+                    phases[entry['phase']] = {'count': 0, 'time': 0, 'max': 0}
+                phase = phases[entry['phase']]
+                phase['count'] += 1
+                phase['time'] += entry['time']
+                phase['max'] = max(phase['max'], entry['time'])
+                continue
+            name = " ".join(entry['cmd'].split()[:2])
+            if not name in commands:
+                commands[name] = {'count': 0, 'cached': 0, 'time': 0, 'max': 0, 'bytes': 0, 'failed': 0, 'callers': {}}
+            command = commands[name]
+            command['count'] += 1
+            command['time'] += entry['time']
+            command['max'] = max(command['max'], entry['time'])
+            command['bytes'] += entry['stdout']
+            if entry['cached']:
+                command['cached'] += 1
+            if entry['exitcode'] != 0:
+                command['failed'] += 1
+            command['callers'][entry['caller']] = command['callers'].get(entry['caller'], 0) + 1
+            total += entry['time']
+        lines = []
+        lines.append("xnas profile: {} commands, {:.3f} s".format(sum(command['count'] for command in commands.values()), total))
+        if len(profile) >= PROFILEMAX:
+            lines.append("only the last {} commands and phases are kept".format(PROFILEMAX))
+        lines.append("{:>6} {:>6} {:>6} {:>10} {:>10} {:>10}  {}".format("count", "cached", "failed", "total [ms]", "max [ms]", "output [B]", "command (caller)"))
+        for name, command in sorted(commands.items(), key = lambda item: item[1]['time'], reverse = True):
+            caller = max(command['callers'], key = command['callers'].get)
+            if len(command['callers']) > 1:
+                caller += " +{}".format(len(command['callers']) - 1)
+            lines.append("{:>6} {:>6} {:>6} {:>10.1f} {:>10.1f} {:>10}  {} ({})".format(command['count'], command['cached'],
+                         command['failed'], command['time'] * 1000, command['max'] * 1000, command['bytes'], name, caller))
+        if phases:
+            lines.append("{:>6} {:>10} {:>10}  {}".format("count", "total [ms]", "max [ms]", "phase"))
+            for name, phase in phases.items():
+                lines.append("{:>6} {:>10.1f} {:>10.1f}  {}".format(phase['count'], phase['time'] * 1000, phase['max'] * 1000, name))
+        return "\n".join(lines)
+
+    @classmethod
+    def writeTrace(cls, profile, path):
+        # chrome trace event format, times in us
+        events = []
+        for entry in profile:
+            event = {}
+            if 'phase' in entry:
+                event['name'] = entry['phase']
+                event['cat'] = "phase"
+                event['args'] = {'caller': entry['caller']}
+            else:
+                event['name'] = entry['cmd']
+                event['cat'] = "cached" if entry['cached'] else "shell"
+                event['args'] = {'caller': entry['caller'], 'exitcode': entry['exitcode'],
+                                 'stdout': entry['stdout'], 'stderr': entry['stderr']}
+            event['ph'] = "X"
+            event['ts'] = int(entry['start'] * 1000000)
+            event['dur'] = int(entry['time'] * 1000000)
+            event['pid'] = entry['pid']
+            event['tid'] = entry['tid']
+            events.append(event)
+        try:
+            with open(path, "w") as trace_file:
+                json.dump({'traceEvents': events, 'displayTimeUnit': "ms"}, trace_file)
+        except:
+            pass
+
+    @classmethod
+    def getCaller(cls):
+        # first frame outside this file
+        caller = ""
+        frame = sys._getframe(1)
+        while frame and frame.f_code.co_filename == __file__:
+            frame = frame.f_back
+        if frame:
+            caller = "{}:{} {}".format(os.path.basename(frame.f_code.co_filename), frame.f_lineno, frame.f_code.co_name)
+        return caller
+
+    @classmethod
+    def memoize(cls, enable = True):
+        # Only for short living processes, a service must see changes
+        with cls.memoLock:
+            cls.memoEnable = enable
+            cls.memo = {}
+            cls.memoGeneration += 1
+
+    @classmethod
+    def invalidate(cls):
+        with cls.memoLock:
+            cls.memo = {}
+            cls.memoGeneration += 1
+
+    @classmethod
+    def afterFork(cls):
+        cls.memoLock = Lock()
+        cls.memo = {}
+        cls.memoGeneration = 0
+        # a forked child keeps profiling, to its own trace
+        cls.profileLock = Lock()
+        if cls.profile != None:
+            cls.profile = deque(maxlen = PROFILEMAX)
+            if cls.traceFile:
+                cls.traceFile = "{}.{}".format(cls.traceFile, os.getpid())
+
+    ################## INTERNAL FUNCTIONS ###################
+
+    def execute(self, cmd, input, timeout):
+        retval = 127, "", ""
+        if input:
+            input = input.encode("utf-8")
+        try:
+            if timeout == 0:
+                timout = None
+            out = subprocess.run(cmd, shell=not isinstance(cmd, list), capture_output=True, input = input, timeout = timeout)
+            retval = out.returncode, out.stdout.decode("utf-8"), out.stderr.decode("utf-8")
+        except subprocess.TimeoutExpired:
+            retval = 124, "", ""
+        except OSError as e:
+            # argv command doesn't exist or cannot be executed
+            retval = CMDNOTEXIST, "", str(e)
+
+        return retval
+
     def handleError(self, returncode, stderr):
         exc = ("External command failed.\n"
                "Command returned: {}\n"
                "Error message:\n{}").format(returncode, stderr)
         raise Exception(exc)
 
+os.register_at_fork(after_in_child = shell.afterFork)
+
 ######################### MAIN ##########################
 if __name__ == "__main__":
     pass
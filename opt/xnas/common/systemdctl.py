@@ -119,7 +119,7 @@ class systemdctl(object):
         if self.available():
             cmd = "{} {}".format(CTLSTATUS, service)
             try:
-                retcode, stdout, stderr = shell().runCommand(cmd)
+                retcode, stdout, stderr = shell().runCommand(cmd, readonly = True)
                 retval = stdout.splitlines()
             except:
                 pass
@@ -128,9 +128,9 @@ class systemdctl(object):
     def isActive(self, service):
         retval = False
         if self.available():
-            cmd = "{} {}".format(CTLISACTIVE, service)
+            cmd = CTLISACTIVE.split() + [service]
             try:
-                shell().command(cmd)
+                shell().command(cmd, idempotent = True)
                 retval = True
             except:
                 pass
@@ -139,9 +139,9 @@ class systemdctl(object):
     def isEnabled(self, service):
         retval = False
         if self.available():
-            cmd = "{} {}".format(CTLISENABLED, service)
+            cmd = CTLISENABLED.split() + [service]
             try:
-                shell().command(cmd)
+                shell().command(cmd, idempotent = True)
                 retval = True
             except:
                 pass
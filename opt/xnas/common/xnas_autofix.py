@@ -35,7 +35,9 @@ class xnas_autofix(object):
         self.update(enable, retries, interval)
         self.timer     = None
         self.isRunning = False
-        self.counter   = 0
+        # objects with errors and the number of times they were checked,
+        # None until all objects are checked once
+        self.counters  = None
         self.start()
 
     def __del__(self):
@@ -55,6 +57,7 @@ class xnas_autofix(object):
         if self.interval == 0:
             self.interval = 1
         if dostart:
+            self.counters = None
             self.start()
 
     ################## INTERNAL FUNCTIONS ###################
@@ -63,7 +66,7 @@ class xnas_autofix(object):
         if not self.enable:
             self.checkOnce()
         elif not self.isRunning:
-            if self.counter == 0:
+            if self.counters == None:
                 interval = 1
                 if self.verbose:
                     self.logger.info("Check and fix now")
@@ -72,7 +75,6 @@ class xnas_autofix(object):
                 if self.verbose:
                     self.logger.info("Check and fix in {} seconds".format(interval))
             self.timer = Timer(interval, self.run)
-            self.counter += 1
             self.timer.start()
             self.isRunning = True
 
@@ -87,7 +89,7 @@ class xnas_autofix(object):
         if self.verbose:
             self.logger.info("Checking and fixing errors")
         self.checkAndFix()
-        if (self.retries == 0) or (self.counter < self.retries):
+        if self.counters:
             self.start()
         self.engine.mutex.release()
 
@@ -96,18 +98,57 @@ class xnas_autofix(object):
             self.logger.warning("Running xservices with errors, service may have limited performance")
 
     def checkAndFix(self):
-        checkResults = xnas_check(self.engine, noMsg = True, level = self.counter-1, json = True).check()
-        if not checkResults:
-            if self.retries == 0:
-                self.retries = 1
-            self.counter = self.retries # do not check anymore
+        if self.counters == None:
+            checkResults = xnas_check(self.engine, noMsg = True, level = 0, json = True).check()
+            levels = {}
         else:
+            # Only check the objects that had errors and their dependents
+            levels = self.getLevels(self.counters)
+            checkResults = self.checkLevels(levels)
+        if checkResults:
             xnas_fix(self.engine).fix(checkResults)
-            checkResults = xnas_check(self.engine, noMsg = True, level = self.counter-1, json = True).check()
-            if not checkResults:
-                if self.retries == 0:
-                    self.retries = 1
-                self.counter = self.retries # do not check anymore
+            # Only check the fixed objects and their dependents
+            fixed = {}
+            for Error in checkResults:
+                key = (Error['obj'], Error['name'])
+                fixed[key] = levels.get(key, 0)
+            levels = self.getLevels(fixed)
+            checkResults = self.checkLevels(levels)
+        self.updateCounters(levels, checkResults)
+
+    def getLevels(self, counters):
+        # the objects to check with the level to check them, dependents are
+        # checked at the level of the object they depend on
+        levels = {}
+        xcheck = xnas_check(self.engine, noMsg = True, json = True)
+        for key, counter in counters.items():
+            for item in [key] + xcheck.getDependents(key[0], key[1]):
+                if not item in levels or counter < levels[item]:
+                    levels[item] = counter
+        del xcheck
+        return levels
+
+    def checkLevels(self, levels):
+        checkResults = []
+        # mounts first, then shares and netshares
+        ordered = sorted(levels, key = lambda item: item[0])
+        for level in sorted(set(levels.values())):
+            items = [item for item in ordered if levels[item] == level]
+            checkResults.extend(xnas_check(self.engine, noMsg = True, level = level, json = True).checkItems(items))
+        return checkResults
+
+    def updateCounters(self, levels, checkResults):
+        counters = {}
+        for Error in checkResults:
+            key = (Error['obj'], Error['name'])
+            if key in counters:
+                continue
+            counter = levels.get(key, 0) + 1
+            if self.retries == 0 or counter < self.retries:
+                counters[key] = counter
+            elif self.verbose:
+                self.logger.info("{}: No more retries to fix errors".format(Error['name']))
+        self.counters = counters
 
 ######################### MAIN ##########################
 if __name__ == "__main__":
@@ -7,9 +7,17 @@
 #########################################################
 
 ####################### IMPORTS #########################
+import os
+import json
+import hashlib
+import time
 import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from mounts.mount import mount
 from mounts.fstab import fstab
+from mounts.mounttable import mounttable
 from mounts.zfs import zfs
 from remotes.remotemount import remotemount
 from remotes.davfs import davfs
@@ -23,7 +31,10 @@ from remotes.ping import ping
 
 ####################### GLOBALS #########################
 # {"obj": OBJECT, "name": NAME, "check": CHECK}
-
+CHECKCACHE = "/run/xnas/check.json" # shared by root
+CHECKUSERCACHE = "/run/user/{}/xnas-check.json" # other users
+CHECKTTL   = 10 # [s]
+CHECKJOBS  = 8  # objects checked in parallel
 #########################################################
 
 ###################### FUNCTIONS ########################
@@ -34,64 +45,86 @@ from remotes.ping import ping
 # Class : xnas_check                                    #
 #########################################################
 class xnas_check(object):
-    def __init__(self, engine, Mount = None, Remotemount = None, Share = None, Net = None, noMsg = False, level = -1, json = False):
+    def __init__(self, engine, Mount = None, Remotemount = None, Share = None, Net = None, noMsg = False, level = -1, json = False, jobs = CHECKJOBS):
         #self.engine = engine
         self.logger = logging.getLogger('xnas.check')
         self.engine = engine
         self.noMsg = noMsg
         self.level = level
         self.json = json
+        self.jobs = jobs
+        # messages and objects per worker thread
+        self.local = threading.local()
+        self.owner = threading.current_thread()
         self.msgLst = []
         self.msgCnt = 0
-        self.selfMount = False
+        self.stamp = []
         self.object = objects.NONE
+        # Only create the objects that are needed for checking
+        self.Mount = Mount
+        self.selfMount = not Mount
         if Mount:
-            self.Mount = Mount
             self.object = objects.MOUNT
-        else:
-            self.Mount = mount(engine)
-            self.selfMount = True
-        self.selfRemotemount = False
+        self.Remotemount = Remotemount
+        self.selfRemotemount = not Remotemount
         if Remotemount:
-            self.Remotemount = Remotemount
             self.object = objects.REMOTEMOUNT
-        else:
-            self.Remotemount = remotemount(engine)
-            self.selfRemotemount = True
-        self.selfShare = False
+        self.Share = Share
+        self.selfShare = not Share
         if Share:
-            self.Share = Share
             self.object = objects.SHARE
-        else:
-            self.Share = share(engine)
-            self.selfShare = True
-        self.selfNet = False
+        self.Net = Net
+        self.selfNet = not Net
         if Net:
-            self.Net = Net
             self.object = objects.NETSHARE
-        else:
-            self.Net = netshare(engine)
-            self.selfNet = True
 
     def __del__(self):
-        if self.selfNet:
+        if self.selfNet and self.Net:
             del self.Net
-        if self.selfShare:
+        if self.selfShare and self.Share:
             del self.Share
-        if self.selfRemotemount:
+        if self.selfRemotemount and self.Remotemount:
             del self.Remotemount
-        if self.selfMount:
+        if self.selfMount and self.Mount:
             del self.Mount
         del self.msgLst
 
     def check(self):
+        self.msgLst = []
+        self.msgCnt = 0
+        Errors = self.runChecks(self.getItems())
+
+        Errors = [Error for Error in Errors if not Error['warning']]
+
+        if Errors and not self.json:
+            print("Xnas reported one or more errors ...")
+            if not self.noMsg:
+                print("Please run 'xnas fix' to fix these errors")
+        return Errors
+
+    def checkObject(self, obj, name):
+        # Only checks the object and the objects it depends on, results of
+        # other processes are reused for a short time
         self.msgLst = []
         self.msgCnt = 0
         Errors = []
-        Errors.extend(self.checkMounts())
-        Errors.extend(self.checkRemoteMounts())
-        Errors.extend(self.checkShares())
-        Errors.extend(self.checkNets())
+        cache = self.loadCache()
+        stale = False
+        for dobj, dname in self.getDependencies(obj, name):
+            key = self.getCacheKey(dobj, dname)
+            if key in cache:
+                for message in cache[key]['messages']:
+                    self.logError(message)
+                Errors.extend(cache[key]['errors'])
+            else:
+                msgStart = len(self.msgLst)
+                objErrors = self.checkItem(dobj, dname)
+                cache[key] = {'time': time.time(), 'errors': objErrors,
+                              'messages': [msg['message'] for msg in self.msgLst[msgStart:]]}
+                Errors.extend(objErrors)
+                stale = True
+        if stale:
+            self.saveCache(cache)
 
         Errors = [Error for Error in Errors if not Error['warning']]
 
@@ -101,6 +134,29 @@ class xnas_check(object):
                 print("Please run 'xnas fix' to fix these errors")
         return Errors
 
+    def checkItems(self, items):
+        # Only checks the objects in items, without reusing results
+        self.msgLst = []
+        self.msgCnt = 0
+        Errors = self.runChecks(items)
+        return [Error for Error in Errors if not Error['warning']]
+
+    def getDependents(self, obj, name):
+        # the objects that depend on the object, in the order of check
+        deps = []
+        if obj == objects.MOUNT or obj == objects.REMOTEMOUNT:
+            remote = obj == objects.REMOTEMOUNT
+            dbshares = self.engine.checkGroup(groups.SHARES)
+            if dbshares:
+                for key, share in dbshares.items():
+                    if share['xmount'] == name and bool(share['remotemount']) == remote:
+                        deps.append((objects.SHARE, key))
+                        deps.extend(self.getDependents(objects.SHARE, key))
+        elif obj == objects.SHARE:
+            if self.engine.checkKey(groups.NETSHARES, name):
+                deps.append((objects.NETSHARE, name))
+        return deps
+
     def GetList(self):
         return self.msgLst
 
@@ -127,137 +183,304 @@ class xnas_check(object):
 
     ################## INTERNAL FUNCTIONS ###################
 
-    def checkMounts(self):
-        Errors = []
-        mounts = self.engine.checkGroup(groups.MOUNTS)
-        if mounts:
-            for key, mount in mounts.items():
-                device = self.Mount.getDevices(mount['uuid'])
-                if device:
-                    if mount['zfs']:
-                        health = zfs.getHealth(self.Mount, mount['uuid'], device[0]['mounted'])
-                        available = health == "ONLINE" or health == "DEGRADED"
-                    else:
-                        available = True
-                else:
-                    available = False
-                if not available:
-                    if mount['method'] == "startup" and self.level < 1:
-                        self.printError(objects.MOUNT, key, errors.UNAVAILABLE)
-                        Errors.append(self.makeError(objects.MOUNT, key, errors.UNAVAILABLE, self.level2warningRpt(self.level)))
+    def getMount(self):
+        if threading.current_thread() != self.owner:
+            # workers don't share objects
+            if not hasattr(self.local, "Mount"):
+                self.local.Mount = mount(self.engine)
+            return self.local.Mount
+        if not self.Mount:
+            self.Mount = mount(self.engine)
+        return self.Mount
+
+    def getRemotemount(self):
+        if threading.current_thread() != self.owner:
+            # workers don't share objects
+            if not hasattr(self.local, "Remotemount"):
+                self.local.Remotemount = remotemount(self.engine)
+            return self.local.Remotemount
+        if not self.Remotemount:
+            self.Remotemount = remotemount(self.engine)
+        return self.Remotemount
+
+    def getShare(self):
+        if threading.current_thread() != self.owner:
+            # workers don't share objects
+            if not hasattr(self.local, "Share"):
+                self.local.Share = share(self.engine)
+            return self.local.Share
+        if not self.Share:
+            self.Share = share(self.engine)
+        return self.Share
+
+    def getNet(self):
+        if threading.current_thread() != self.owner:
+            # workers don't share objects
+            if not hasattr(self.local, "Net"):
+                self.local.Net = netshare(self.engine)
+            return self.local.Net
+        if not self.Net:
+            self.Net = netshare(self.engine)
+        return self.Net
+
+    def getDependencies(self, obj, name):
+        # the object and the objects it depends on, in the order of check
+        deps = []
+        if obj == objects.NETSHARE:
+            if self.engine.checkKey(groups.SHARES, name):
+                deps.extend(self.getDependencies(objects.SHARE, name))
+            deps.append((obj, name))
+        elif obj == objects.SHARE:
+            db = self.engine.checkKey(groups.SHARES, name)
+            if db and db['xmount']:
+                if db['remotemount']:
+                    deps.append((objects.REMOTEMOUNT, db['xmount']))
                 else:
-                    if mount['method'] == "dynmount":
-                        if not device[0]['mounted']:
-                            self.printError(objects.MOUNT, key, errors.DYNNOTMOUNTED)
-                            Errors.append(self.makeError(objects.MOUNT, key, errors.DYNNOTMOUNTED, self.level2warning(self.level)))
-                    if device[0]['mounted']:
-                        if mount['zfs']:
-                            health = zfs.getHealth(self.Mount, mount['uuid'], device[0]['mounted'])
-                        else:
-                            health = fstab.getHealth(self.Mount, mount['uuid'], device[0]['fsname'], device[0]['label'], device[0]['mounted'])
-                        if health != "ONLINE":
-                            self.printError(objects.MOUNT, key, errors.UNHEALTHY, health)
-                            Errors.append(self.makeError(objects.MOUNT, key, errors.UNHEALTHY, self.level2warning(self.level)))
-                    else:
-                        if self.Mount.isReferenced(key, True) and mount['method'] == "startup" and self.level >= 0:
-                            self.printError(objects.MOUNT, key, errors.REFNOTMOUNTED)
-                            Errors.append(self.makeError(objects.MOUNT, key, errors.REFNOTMOUNTED, self.level2warning(self.level)))
+                    deps.append((objects.MOUNT, db['xmount']))
+            deps.append((obj, name))
+        elif obj == objects.MOUNT or obj == objects.REMOTEMOUNT:
+            deps.append((obj, name))
+        return deps
+
+    def getItems(self):
+        # all objects, in the order of reporting
+        items = []
+        for obj, group in [(objects.MOUNT, groups.MOUNTS), (objects.REMOTEMOUNT, groups.REMOTEMOUNTS),
+                           (objects.SHARE, groups.SHARES), (objects.NETSHARE, groups.NETSHARES)]:
+            dbgroup = self.engine.checkGroup(group)
+            if dbgroup:
+                for name in dbgroup:
+                    items.append((obj, name))
+        return items
+
+    def runChecks(self, items):
+        # Checks may wait for devices or hosts, so they run in parallel.
+        # Errors and messages are reported in the order of items.
+        if self.jobs > 1 and len(items) > 1:
+            with ThreadPoolExecutor(max_workers = min(self.jobs, len(items))) as executor:
+                results = list(executor.map(self.checkWorker, items))
+        else:
+            results = [self.checkWorker(item) for item in items]
+        Errors = []
+        for objErrors, messages in results:
+            for message in messages:
+                self.logError(message)
+            Errors.extend(objErrors)
+        return Errors
 
+    def checkWorker(self, item):
+        self.local.messages = []
+        try:
+            Errors = self.checkItem(item[0], item[1])
+        finally:
+            messages = self.local.messages
+            self.local.messages = None
+        return Errors, messages
+
+    def checkItem(self, obj, name):
+        Errors = []
+        if obj == objects.MOUNT:
+            db = self.engine.checkKey(groups.MOUNTS, name)
+            if db:
+                Errors = self.checkMount(name, db)
+        elif obj == objects.REMOTEMOUNT:
+            db = self.engine.checkKey(groups.REMOTEMOUNTS, name)
+            if db:
+                Errors = self.checkRemoteMount(name, db)
+        elif obj == objects.SHARE:
+            db = self.engine.checkKey(groups.SHARES, name)
+            if db:
+                Errors = self.checkShare(name, db)
+        elif obj == objects.NETSHARE:
+            db = self.engine.checkKey(groups.NETSHARES, name)
+            if db:
+                Errors = self.checkNet(name, db)
         return Errors
 
-    def checkRemoteMounts(self):
+    def getCacheKey(self, obj, name):
+        # results depend on the level and on access to credentials
+        return "{}:{}:{}:{}".format(obj, name, self.level, self.engine.isSudo())
+
+    def getCachePath(self):
+        # others can't write the cache of root, so they keep their own
+        path = CHECKCACHE
+        if os.getuid() != 0:
+            path = CHECKUSERCACHE.format(os.getuid())
+        return path
+
+    def getStamp(self):
+        # results are only valid for the same database, fstab and mount table,
+        # the availability of devices and remotes is only covered by CHECKTTL.
+        # The mount table generation only counts in this process, so its
+        # content is compared
+        stamp = []
+        try:
+            XMLpath = self.engine.getXMLpath(False)
+            stamp.append(list(self.engine.statXML(XMLpath)))
+        except:
+            stamp.append([])
+        stamp.append(list(fstab.fstabSignature() or []))
+        stamp.append(hashlib.sha256(repr(mounttable().getMounts()).encode()).hexdigest())
+        return stamp
+
+    def loadCache(self):
+        cache = {}
+        now = time.time()
+        # taken before checking, results are saved with the state they started from
+        self.stamp = self.getStamp()
+        paths = [self.getCachePath()]
+        if paths[0] != CHECKCACHE:
+            paths.append(CHECKCACHE)
+        for path in reversed(paths):
+            try:
+                with open(path, "r") as cache_file:
+                    cachestat = os.fstat(cache_file.fileno())
+                    if not cachestat.st_uid in [0, os.getuid()] or cachestat.st_mode & 0o022:
+                        continue
+                    data = json.load(cache_file)
+                if data['db'] == self.stamp:
+                    for key, item in data['items'].items():
+                        if 0 <= now - item['time'] < CHECKTTL:
+                            cache[key] = item
+            except:
+                pass
+        return cache
+
+    def saveCache(self, cache):
+        path = self.getCachePath()
+        tmppath = ""
+        try:
+            cachedir = os.path.dirname(path)
+            if path == CHECKCACHE and not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+            fd, tmppath = tempfile.mkstemp(prefix = ".{}.".format(os.path.basename(path)), dir = cachedir)
+            with os.fdopen(fd, "w") as cache_file:
+                os.fchmod(cache_file.fileno(), 0o644)
+                json.dump({'db': self.stamp, 'items': cache}, cache_file)
+            os.replace(tmppath, path)
+        except:
+            if tmppath:
+                try:
+                    os.remove(tmppath)
+                except:
+                    pass
+
+    def checkMount(self, key, mount):
         Errors = []
+        device = self.getMount().getDevices(mount['uuid'])
+        if device:
+            if mount['zfs']:
+                health = zfs.getHealth(self.getMount(), mount['uuid'], device[0]['mounted'])
+                available = health == "ONLINE" or health == "DEGRADED"
+            else:
+                available = True
+        else:
+            available = False
+        if not available:
+            if mount['method'] == "startup" and self.level < 1:
+                self.printError(objects.MOUNT, key, errors.UNAVAILABLE)
+                Errors.append(self.makeError(objects.MOUNT, key, errors.UNAVAILABLE, self.level2warningRpt(self.level)))
+        else:
+            if mount['method'] == "dynmount":
+                if not device[0]['mounted']:
+                    self.printError(objects.MOUNT, key, errors.DYNNOTMOUNTED)
+                    Errors.append(self.makeError(objects.MOUNT, key, errors.DYNNOTMOUNTED, self.level2warning(self.level)))
+            if device[0]['mounted']:
+                if mount['zfs']:
+                    health = zfs.getHealth(self.getMount(), mount['uuid'], device[0]['mounted'])
+                else:
+                    health = fstab.getHealth(self.getMount(), mount['uuid'], device[0]['fsname'], device[0]['label'], device[0]['mounted'])
+                if health != "ONLINE":
+                    self.printError(objects.MOUNT, key, errors.UNHEALTHY, health)
+                    Errors.append(self.makeError(objects.MOUNT, key, errors.UNHEALTHY, self.level2warning(self.level)))
+            else:
+                if self.getMount().isReferenced(key, True) and mount['method'] == "startup" and self.level >= 0:
+                    self.printError(objects.MOUNT, key, errors.REFNOTMOUNTED)
+                    Errors.append(self.makeError(objects.MOUNT, key, errors.REFNOTMOUNTED, self.level2warning(self.level)))
 
-        remotemounts = self.engine.checkGroup(groups.REMOTEMOUNTS)
-        if remotemounts:
-            for key, mount in remotemounts.items():
-                url = self.Remotemount.buildDbURL(mount)
-                entry = self.Remotemount.getEntry(fsname=url)
-                netdev = False
-                mounted = False
-                Guest = False
-                Creds = False
-                if entry:
-                    if '_netdev' in entry['options']:
-                        netdev = True
-                    if 'guest' in entry['options']:
-                        Guest = True
-                    for opt in entry['options']:
-                        if 'credentials' in opt:
-                            Creds = True
-                            break
-                    mounted = self.Remotemount.isMounted(entry['mountpoint'])
-
-                    if mount['method'] == "dynmount" and self.level >= 0:
-                        if not mounted:
-                            if ping().ping(url):
-                                self.printError(objects.REMOTEMOUNT, key, errors.DYNNOTMOUNTED)
-                                Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.DYNNOTMOUNTED, self.level2warning(self.level)))
-                            else:
-                                self.printError(objects.REMOTEMOUNT, key, errors.HOSTFAILED)
-                                Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.HOSTFAILED, self.level2warningRpt(self.level)))
-
-                    if not netdev:
-                        self.printError(objects.REMOTEMOUNT, key, errors.NONETDEV)
-                        Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.NONETDEV, self.level2warning(self.level)))
-
-                    if mount['type'] == 'cifs' and self.engine.isSudo():
-                        if not (Guest ^ Creds):
-                            self.printError(objects.REMOTEMOUNT, key, errors.NOCREDENTIALS)
-                            Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.NOCREDENTIALS, self.level2warning(self.level)))
-                    elif mount['type'] == 'davfs' and self.engine.isSudo():
-                        Creds = davfs(self.logger).hasCredentials(url)
-                        if not (Guest ^ Creds):
-                            self.printError(objects.REMOTEMOUNT, key, errors.NOCREDENTIALS)
-                            Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.NOCREDENTIALS, self.level2warning(self.level)))
-
-                    if mounted:
-                        health = self.Remotemount.getHealth(fsname = entry['fsname'], isMounted = mounted, hasHost = ping().ping(url))
-                        if health != "ONLINE":
-                            self.printError(objects.REMOTEMOUNT, key, errors.UNHEALTHY, health)
-                            Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.UNHEALTHY, self.level2warning(self.level)))
-                    else:
-                        if self.Remotemount.isReferenced(key, True) and mount['method'] == "startup" and self.level >= 0:
-                            if ping().ping(url):
-                                self.printError(objects.REMOTEMOUNT, key, errors.REFNOTMOUNTED)
-                                Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.REFNOTMOUNTED, self.level2warning(self.level)))
-                            else:
-                                self.printError(objects.REMOTEMOUNT, key, errors.HOSTFAILED)
-                                Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.HOSTFAILED, self.level2warningRpt(self.level)))
-                else: # No entry available
-                    if mount['method'] == "startup":
-                        self.printError(objects.REMOTEMOUNT, key, errors.UNAVAILABLE)
-                        Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.UNAVAILABLE, self.level2warningRpt(self.level)))
         return Errors
 
-    def checkShares(self):
+    def checkRemoteMount(self, key, mount):
         Errors = []
-        shares = self.engine.checkGroup(groups.SHARES)
-        if shares:
-            for key, share in shares.items():
-                if share['enabled']:
-                    if not self.Share.getlink(self.engine.shareDir(key)):
-                        self.printError(objects.SHARE, key, errors.ENABLEDNOTLINKED)
-                        Errors.append(self.makeError(objects.SHARE, key, errors.ENABLEDNOTLINKED, self.level2warning(self.level)))
-                else: #disabled
-                    if self.Share.isReferenced(key, True):
-                        self.printError(objects.SHARE, key, errors.DISABLEDREFERENCED)
-                        Errors.append(self.makeError(objects.SHARE, key, errors.DISABLEDREFERENCED, self.level2warning(self.level)))
-                    elif self.Share.getlink(self.engine.shareDir(key)):
-                        self.printError(objects.SHARE, key, errors.DISABLEDLINKED)
-                        Errors.append(self.makeError(objects.SHARE, key, errors.DISABLEDLINKED, self.level2warning(self.level)))
+        url = self.getRemotemount().buildDbURL(mount)
+        entry = self.getRemotemount().getEntry(fsname=url)
+        netdev = False
+        mounted = False
+        Guest = False
+        Creds = False
+        if entry:
+            if '_netdev' in entry['options']:
+                netdev = True
+            if 'guest' in entry['options']:
+                Guest = True
+            for opt in entry['options']:
+                if 'credentials' in opt:
+                    Creds = True
+                    break
+            mounted = self.getRemotemount().isMounted(entry['mountpoint'])
+
+            if mount['method'] == "dynmount" and self.level >= 0:
+                if not mounted:
+                    if ping().ping(url, type = mount['type']):
+                        self.printError(objects.REMOTEMOUNT, key, errors.DYNNOTMOUNTED)
+                        Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.DYNNOTMOUNTED, self.level2warning(self.level)))
+                    else:
+                        self.printError(objects.REMOTEMOUNT, key, errors.HOSTFAILED)
+                        Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.HOSTFAILED, self.level2warningRpt(self.level)))
+
+            if not netdev:
+                self.printError(objects.REMOTEMOUNT, key, errors.NONETDEV)
+                Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.NONETDEV, self.level2warning(self.level)))
+
+            if mount['type'] == 'cifs' and self.engine.isSudo():
+                if not (Guest ^ Creds):
+                    self.printError(objects.REMOTEMOUNT, key, errors.NOCREDENTIALS)
+                    Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.NOCREDENTIALS, self.level2warning(self.level)))
+            elif mount['type'] == 'davfs' and self.engine.isSudo():
+                Creds = davfs(self.logger).hasCredentials(url)
+                if not (Guest ^ Creds):
+                    self.printError(objects.REMOTEMOUNT, key, errors.NOCREDENTIALS)
+                    Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.NOCREDENTIALS, self.level2warning(self.level)))
+
+            if mounted:
+                health = self.getRemotemount().getHealth(fsname = entry['fsname'], isMounted = mounted, hasHost = ping().ping(url, type = mount['type']))
+                if health != "ONLINE":
+                    self.printError(objects.REMOTEMOUNT, key, errors.UNHEALTHY, health)
+                    Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.UNHEALTHY, self.level2warning(self.level)))
+            else:
+                if self.getRemotemount().isReferenced(key, True) and mount['method'] == "startup" and self.level >= 0:
+                    if ping().ping(url, type = mount['type']):
+                        self.printError(objects.REMOTEMOUNT, key, errors.REFNOTMOUNTED)
+                        Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.REFNOTMOUNTED, self.level2warning(self.level)))
+                    else:
+                        self.printError(objects.REMOTEMOUNT, key, errors.HOSTFAILED)
+                        Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.HOSTFAILED, self.level2warningRpt(self.level)))
+        else: # No entry available
+            if mount['method'] == "startup":
+                self.printError(objects.REMOTEMOUNT, key, errors.UNAVAILABLE)
+                Errors.append(self.makeError(objects.REMOTEMOUNT, key, errors.UNAVAILABLE, self.level2warningRpt(self.level)))
         return Errors
 
-    def checkNets(self):
+    def checkShare(self, key, share):
         Errors = []
+        if share['enabled']:
+            if not self.getShare().getlink(self.engine.shareDir(key)):
+                self.printError(objects.SHARE, key, errors.ENABLEDNOTLINKED)
+                Errors.append(self.makeError(objects.SHARE, key, errors.ENABLEDNOTLINKED, self.level2warning(self.level)))
+        else: #disabled
+            if self.getShare().isReferenced(key, True):
+                self.printError(objects.SHARE, key, errors.DISABLEDREFERENCED)
+                Errors.append(self.makeError(objects.SHARE, key, errors.DISABLEDREFERENCED, self.level2warning(self.level)))
+            elif self.getShare().getlink(self.engine.shareDir(key)):
+                self.printError(objects.SHARE, key, errors.DISABLEDLINKED)
+                Errors.append(self.makeError(objects.SHARE, key, errors.DISABLEDLINKED, self.level2warning(self.level)))
+        return Errors
 
-        netshares = self.engine.checkGroup(groups.NETSHARES)
-        if netshares:
-            for key, netshare in netshares.items():
-                if not self.Net.isSourced(key, True) and netshare['enabled']:
-                    self.printError(objects.NETSHARE, key, errors.UNAVAILABLE, key)
-                    Errors.append(self.makeError(objects.NETSHARE, key, errors.UNAVAILABLE, self.level2warning(self.level)))
-
+    def checkNet(self, key, netshare):
+        Errors = []
+        if not self.getNet().isSourced(key, True) and netshare['enabled']:
+            self.printError(objects.NETSHARE, key, errors.UNAVAILABLE, key)
+            Errors.append(self.makeError(objects.NETSHARE, key, errors.UNAVAILABLE, self.level2warning(self.level)))
         return Errors
 
     def level2warningRpt(self, level):
@@ -314,6 +537,11 @@ class xnas_check(object):
                 self.logError("{}: [Netshare] Source device '{}' is unavailable".format(name, text))
 
     def logError(self, message):
+        messages = getattr(self.local, "messages", None)
+        if messages != None:
+            # collected by checkWorker
+            messages.append(message)
+            return
         msg = {}
         self.msgCnt += 1
         msg['#'] = self.msgCnt
@@ -14,13 +14,16 @@ import logging.handlers
 import locale
 import json
 import signal
+from collections.abc import Mapping
 from common.ansi import ansi
+from common.shell import shell, PROFILEENV, TRACEENV
 import re
 #########################################################
 
 ####################### GLOBALS #########################
 VERSION = "1.1.2"
 LOG_FILENAME     = "xnas.log"
+LOG_LOCATION     = "/var/log"
 LOG_MAXSIZE      = 100*1024*1024
 HELPSTANDARD     = {"help": "this help file",
                     "version": "print version information",
@@ -62,6 +65,7 @@ class groups:
     NETSHARES = "netshares"
 
 from common.database import database
+from remotes.ping import ping
 
 #########################################################
 # Class : xnas_engine                                   #
@@ -87,6 +91,11 @@ class xnas_engine(database):
             self.logger.addHandler(self.fh)
             self.fh.setFormatter(self.formatter)
         database.__init__(self, self.logger)
+        # A command only runs shortly, xservices must see all changes
+        shell.memoize(name != "xservices")
+        if shell.profile == None and (os.environ.get(PROFILEENV) or os.environ.get(TRACEENV)):
+            shell.startProfile(os.environ.get(TRACEENV, ""))
+        self.configProbe()
 
     def __del__(self):
         database.__del__(self)
@@ -107,6 +116,9 @@ Version: {}""".format(ansi.bold, ansi.fg.blue, ansi.reset, ansi.italic, ansi.res
         return "{}{}XNAS{}: {}A lightweight, eXtended Network Attached Storage system for linux devices{}".format(
                 ansi.bold, ansi.fg.blue, ansi.reset, ansi.italic, ansi.reset)
 
+    def configProbe(self):
+        ping.config(self.checkKey(groups.SETTINGS, "remoteprobe"), self.checkKey(groups.SETTINGS, "probetimeout"))
+
     def isSudo(self):
         return os.getuid() == 0
 
@@ -239,7 +251,8 @@ Version: {}""".format(ansi.bold, ansi.fg.blue, ansi.reset, ansi.italic, ansi.res
         return testkey in settings
 
     def printJson(self, list):
-        print(json.dumps(list))
+        # database records are printed as the dicts they replace
+        print(json.dumps(list, default = dict))
 
     def printJsonResult(self, result):
         r = {}
@@ -338,11 +351,11 @@ Version: {}""".format(ansi.bold, ansi.fg.blue, ansi.reset, ansi.italic, ansi.res
     def settings2Table(self, settings):
         settingsList = []
 
-        if isinstance(settings, dict):
+        if isinstance(settings, Mapping):
             for key, value in settings.items():
                 setting = {}
                 setting['setting'] = key
-                if isinstance(value, dict):
+                if isinstance(value, Mapping):
                     extralist = []
                     for k2, v2 in value.items():
                         if isinstance(v2, list):
@@ -679,7 +692,7 @@ Version: {}""".format(ansi.bold, ansi.fg.blue, ansi.reset, ansi.italic, ansi.res
         return key, value, nextind
 
     def getLogger(self):
-        logpath = "/var/log"
+        logpath = LOG_LOCATION
         LoggerPath = "/dev/null"
         # first look in log path
         if os.path.exists(logpath):
@@ -73,6 +73,8 @@ class xnas_fix(object):
     def fix(self, Errors):
         self.msgLst = []
         self.msgCnt = 0
+        # fstab is backed up, written and reloaded once for all remotemount fixes
+        transaction = self.Remotemount.beginFstab()
         for Error in Errors:
             if Error['obj'] == objects.MOUNT:
                 self.fixMount(Error)
@@ -84,6 +86,8 @@ class xnas_fix(object):
                 self.fixNet(Error)
             else:
                 self.logWarning("{}: Unknown error reported, unable to fix {}-{}".format(Error['name'], Error['obj'], Error['check']))
+        if transaction:
+            self.Remotemount.commitFstab()
 
     def GetList(self):
         return self.msgLst
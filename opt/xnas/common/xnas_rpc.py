@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+#########################################################
+# SERVICE : xnas_rpc.py                                 #
+#           Unix socket rpc to run xnas commands in a   #
+#           warm xservices process                      #
+#           I. Helwegen 2020                            #
+#########################################################
+
+####################### IMPORTS #########################
+import os
+import sys
+import json
+import pwd
+import grp
+import socket
+import struct
+import select
+import signal
+import logging
+import importlib
+import traceback
+from threading import Thread
+from common.shell import shell, PROFILEENV, TRACEENV
+#########################################################
+
+####################### GLOBALS #########################
+RPCDIR      = "/run/xnas"
+RPCSOCKET   = os.path.join(RPCDIR, "xnas.sock")
+# Besides root, only members of this group may connect (if the group exists)
+RPCGROUP    = "xnas"
+RPCNODAEMON = "XNAS_NODAEMON"
+RPCCOMMANDS = ["xnas", "xmount", "xremotemount", "xshare", "xnetshare", "xdir", "xpd", "xcd"]
+# Restarts xservices, which would stop the command itself
+RPCINPROCESS = {"xnas": ["srv"]}
+# Profiles the command in process, where it is started
+RPCPROFILE  = {"xnas": ["--profile", "-R"]}
+# Exit code if the daemon failed after the request was sent
+RPCFAILED   = 1
+RPCTIMEOUT  = 2
+# A request is its length followed by json, the caller's environment included
+RPCHEADER   = struct.Struct("!I")
+RPCMAXMSG   = 65536
+RPCMAXREQ   = 16777216
+RPCPOLL     = 0.1
+RPCFDS      = 3
+ENCODING    = 'utf-8'
+#########################################################
+
+###################### FUNCTIONS ########################
+
+#########################################################
+
+#########################################################
+# Class : rpcclient                                     #
+#########################################################
+class rpcclient(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __del__(self):
+        pass
+
+    def run(self, argv):
+        # Only returns if the daemon didn't handle the request, the command
+        # is then executed in process
+        exitcode = self.request(argv)
+        if exitcode != None:
+            os._exit(exitcode)
+
+    ################## INTERNAL FUNCTIONS ###################
+
+    def request(self, argv):
+        retval = None
+        if os.environ.get(RPCNODAEMON) or not os.path.exists(RPCSOCKET):
+            return retval
+        if self.name in RPCINPROCESS:
+            for arg in argv[1:]:
+                if arg in RPCINPROCESS[self.name]:
+                    return retval
+        if os.environ.get(PROFILEENV) or os.environ.get(TRACEENV):
+            return retval
+        if self.name in RPCPROFILE:
+            for arg in argv[1:]:
+                for opt in RPCPROFILE[self.name]:
+                    if arg.startswith(opt):
+                        return retval
+        sent = False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(RPCTIMEOUT)
+            sock.connect(RPCSOCKET)
+            request = {"name": self.name, "argv": argv, "cwd": self.getCwd(), "env": dict(os.environ)}
+            msg = json.dumps(request).encode(ENCODING)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            socket.send_fds(sock, [RPCHEADER.pack(len(msg))], [0, 1, 2])
+            sock.sendall(msg)
+            sent = True
+            # The command may be interactive, so wait for it as long as it takes
+            sock.settimeout(None)
+            reply = self.recvReply(sock)
+            # a rejected request didn't start, any other reply did
+            if "exitcode" in reply:
+                retval = reply["exitcode"]
+            elif not "rejected" in reply:
+                raise Exception(reply.get("error", "no exit code"))
+        except KeyboardInterrupt:
+            # Closing the socket terminates the command in the daemon
+            retval = 130
+        except Exception as e:
+            # Only run in process if the daemon didn't get the request, once
+            # sent the command may have (partly) run, so never run it again
+            if sent:
+                print("{}: xservices failed to run the command: {}".format(self.name, e), file = sys.stderr)
+                retval = RPCFAILED
+        finally:
+            sock.close()
+        return retval
+
+    def recvReply(self, sock):
+        data = b""
+        while True:
+            chunk = sock.recv(RPCMAXMSG)
+            if not chunk:
+                break
+            data += chunk
+        if not data:
+            raise Exception("connection closed")
+        return json.loads(data.decode(ENCODING))
+
+    def getCwd(self):
+        try:
+            cwd = os.getcwd()
+        except:
+            cwd = "/"
+        return cwd
+
+#########################################################
+# Class : rpcserver                                     #
+#########################################################
+class rpcserver(Thread):
+    def __init__(self, engine, verbose = False):
+        self.engine = engine
+        self.logger = logging.getLogger('xnas.rpcserver')
+        self.verbose = verbose
+        self.sock = None
+        self.commands = {}
+        self.running = False
+        Thread.__init__(self)
+        self.daemon = True
+
+    def __del__(self):
+        self.terminate()
+
+    def start(self):
+        if self.prepare():
+            self.running = True
+            Thread.start(self)
+            self.logger.info("rpc server listening on {}".format(RPCSOCKET))
+
+    def terminate(self):
+        self.running = False
+        if self.sock:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except:
+                pass
+            self.sock.close()
+            self.sock = None
+            try:
+                os.remove(RPCSOCKET)
+            except:
+                pass
+
+    def run(self):
+        while self.running:
+            try:
+                conn, addr = self.sock.accept()
+            except:
+                break
+            Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    ################## INTERNAL FUNCTIONS ###################
+
+    def prepare(self):
+        retval = False
+        self.loadCommands()
+        try:
+            if not os.path.isdir(RPCDIR):
+                os.makedirs(RPCDIR)
+            os.chmod(RPCDIR, 0o755)
+            if os.path.exists(RPCSOCKET):
+                os.remove(RPCSOCKET)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            umask = os.umask(0o177)
+            try:
+                self.sock.bind(RPCSOCKET)
+            finally:
+                os.umask(umask)
+            # Root and the rpc group may connect, commands run with the peer's credentials
+            try:
+                os.chown(RPCSOCKET, 0, grp.getgrnam(RPCGROUP).gr_gid)
+                os.chmod(RPCSOCKET, 0o660)
+            except KeyError:
+                pass
+            self.sock.listen()
+            retval = True
+        except Exception as e:
+            self.logger.warning("rpc server not available: {}".format(e))
+            if self.sock:
+                self.sock.close()
+                self.sock = None
+        return retval
+
+    def loadCommands(self):
+        # Import the commands once, so a request doesn't pay for it
+        for name in RPCCOMMANDS:
+            try:
+                module = importlib.import_module(name)
+                self.commands[name] = getattr(module, name)
+            except Exception as e:
+                self.logger.warning("rpc server cannot load {}: {}".format(name, e))
+
+    def handle(self, conn):
+        # Requests that fail before the command starts are rejected, so the
+        # client runs them in process. Once started, a failure is an error
+        fds = []
+        started = False
+        try:
+            conn.settimeout(RPCTIMEOUT)
+            msg, fds, flags, addr = socket.recv_fds(conn, RPCHEADER.size, RPCFDS)
+            request = self.recvRequest(conn, msg)
+            conn.settimeout(None)
+            pid, uid, gid = struct.unpack("3i", conn.getsockopt(socket.SOL_SOCKET,
+                                          socket.SO_PEERCRED, struct.calcsize("3i")))
+            if not self.allowed(uid):
+                self.logger.warning("rpc request from pid {} rejected, uid {} not allowed".format(pid, uid))
+                self.reject(conn, "not allowed")
+            elif len(fds) == RPCFDS and request["name"] in self.commands:
+                if self.verbose:
+                    self.logger.info("rpc request from pid {}: {}".format(pid, " ".join(request["argv"])))
+                childpid = os.fork()
+                if childpid == 0:
+                    self.child(conn, request, fds, uid, gid)
+                started = True
+                for fd in fds:
+                    os.close(fd)
+                fds = []
+                exitcode = self.waitChild(conn, childpid)
+                self.reply(conn, {"exitcode": exitcode})
+            else:
+                self.reject(conn, "invalid request")
+        except Exception as e:
+            if started:
+                self.logger.error("rpc request failed: {}".format(e))
+                self.reply(conn, {"error": str(e)})
+            else:
+                self.logger.warning("rpc request rejected: {}".format(e))
+                self.reject(conn, str(e))
+        finally:
+            for fd in fds:
+                os.close(fd)
+            conn.close()
+
+    def recvRequest(self, conn, msg):
+        # msg holds the start of the header, the rest may follow in parts
+        while len(msg) < RPCHEADER.size:
+            chunk = conn.recv(RPCHEADER.size - len(msg))
+            if not chunk:
+                raise Exception("connection closed")
+            msg += chunk
+        length = RPCHEADER.unpack(msg)[0]
+        if length > RPCMAXREQ:
+            raise Exception("request too large")
+        data = bytearray()
+        while len(data) < length:
+            chunk = conn.recv(min(length - len(data), RPCMAXMSG))
+            if not chunk:
+                raise Exception("connection closed")
+            data += chunk
+        return json.loads(data.decode(ENCODING))
+
+    def allowed(self, uid):
+        retval = uid == 0
+        if not retval:
+            try:
+                group = grp.getgrnam(RPCGROUP)
+                user = pwd.getpwuid(uid)
+                retval = user.pw_gid == group.gr_gid or user.pw_name in group.gr_mem
+            except KeyError:
+                pass
+        return retval
+
+    def reply(self, conn, reply):
+        try:
+            conn.sendall(json.dumps(reply).encode(ENCODING))
+        except:
+            pass
+
+    def reject(self, conn, reason):
+        # The client may still be sending, read the rest after the reply, as
+        # closing with unread data resets the connection and loses the reply
+        self.reply(conn, {"rejected": reason})
+        try:
+            conn.shutdown(socket.SHUT_WR)
+            conn.settimeout(RPCTIMEOUT)
+            while conn.recv(RPCMAXMSG):
+                pass
+        except:
+            pass
+
+    def waitChild(self, conn, pid):
+        exitcode = 1
+        try:
+            pidfd = os.pidfd_open(pid)
+        except:
+            pidfd = None
+        done = False
+        while not done:
+            wpid, status = os.waitpid(pid, os.WNOHANG)
+            if wpid:
+                exitcode = os.waitstatus_to_exitcode(status)
+                if exitcode < 0:
+                    exitcode = 128 - exitcode
+                done = True
+            else:
+                if pidfd != None:
+                    readable, w, x = select.select([conn, pidfd], [], [])
+                else:
+                    readable, w, x = select.select([conn], [], [], RPCPOLL)
+                if conn in readable:
+                    try:
+                        data = conn.recv(1)
+                    except:
+                        data = b""
+                    if not data:
+                        # client is gone (e.g. ctrl-c), stop the command as well
+                        try:
+                            os.kill(pid, signal.SIGTERM)
+                        except:
+                            pass
+        if pidfd != None:
+            os.close(pidfd)
+        return exitcode
+
+    def child(self, conn, request, fds, uid, gid):
+        exitcode = 1
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            for i, fd in enumerate(fds):
+                os.dup2(fd, i)
+                os.close(fd)
+            # The command only gets the client's stdin, stdout and stderr, not
+            # the daemon's socket, connections and files
+            conn.close()
+            self.sock.close()
+            os.closerange(3, os.sysconf("SC_OPEN_MAX"))
+            sys.stdin = open(0, "r", closefd = False)
+            sys.stdout = open(1, "w", closefd = False)
+            sys.stderr = open(2, "w", closefd = False)
+            # The command sets up its own logging
+            for logger in [logging.getLogger(), logging.getLogger('xnas')]:
+                for handler in list(logger.handlers):
+                    logger.removeHandler(handler)
+            # As in process, the command runs in the caller's environment
+            os.environ.clear()
+            os.environ.update(request.get("env", {}))
+            if uid != 0:
+                os.initgroups(pwd.getpwuid(uid).pw_name, gid)
+                os.setgid(gid)
+                os.setuid(uid)
+            try:
+                os.chdir(request["cwd"])
+            except:
+                pass
+            sys.argv = request["argv"]
+            self.commands[request["name"]]().run(request["argv"])
+            exitcode = 0
+        except SystemExit as e:
+            if e.code == None:
+                exitcode = 0
+            elif isinstance(e.code, int):
+                exitcode = e.code
+            else:
+                print(e.code, file = sys.stderr)
+        except:
+            traceback.print_exc()
+        finally:
+            # os._exit doesn't run atexit
+            shell.stopProfile()
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            except:
+                pass
+            os._exit(exitcode & 0xFF)
+
+######################### MAIN ##########################
+if __name__ == "__main__":
+    pass
@@ -8,11 +8,16 @@
 
 ####################### IMPORTS #########################
 import os
+import time
+import select
 from remotes.ping import ping
 from mounts.zfs import zfs
+from mounts.devices import devices
+from mounts.mounttable import mounttable, MOUNTINFO
 from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, wait
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler, FileCreatedEvent, FileDeletedEvent, EVENT_TYPE_CREATED, EVENT_TYPE_DELETED
+from watchdog.events import FileSystemEventHandler, FileCreatedEvent, FileDeletedEvent, EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED
 from watchdog.observers.api import EventEmitter, BaseObserver
 
 #########################################################
@@ -21,6 +26,11 @@ from watchdog.observers.api import EventEmitter, BaseObserver
 DEVICE_LOC = "/dev/disk/by-path"
 OBSERVER_TIMEOUT = 5
 EMITTER_TIMEOUT  = 5
+PROBE_DEBOUNCE   = 3    # failed probes before an online host is offline
+PROBE_MAXBACKOFF = 300  # maximum probe interval for offline hosts [s]
+PROBE_FLAPWINDOW = 600  # window to count state changes [s]
+PROBE_FLAPCOUNT  = 2    # state changes in window to be flapping
+PROBE_MINWAIT    = 0.5
 #########################################################
 
 ###################### FUNCTIONS ########################
@@ -46,6 +56,8 @@ class deviceHandler(FileSystemEventHandler):
             self.initial()
         else:
             if not event.is_directory:
+                if event.event_type in [EVENT_TYPE_DELETED, EVENT_TYPE_CREATED]:
+                    devices.invalidate()
                 if event.event_type == EVENT_TYPE_DELETED:
                     fsname = self.findInList(event.src_path)
                     if self.onDeleted:
@@ -137,6 +149,119 @@ class simpleHandler(FileSystemEventHandler):
                 if self.onAdded:
                     self.onAdded(event.src_path)
 
+#########################################################
+# Class : fileHandler                                   #
+#########################################################
+class fileHandler(FileSystemEventHandler):
+    def __init__(self, path, onChanged = None):
+        self.path = path
+        self.onChanged = onChanged
+
+    def __del__(self):
+        pass
+
+    def on_any_event(self, event):
+        if event and not event.is_directory:
+            # A replaced file (write to temp and rename) arrives as a move
+            if event.event_type in [EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED, EVENT_TYPE_DELETED]:
+                changed = event.src_path == self.path
+            elif event.event_type == EVENT_TYPE_MOVED:
+                changed = event.dest_path == self.path or event.src_path == self.path
+            else:
+                changed = False
+            if changed and self.onChanged:
+                self.onChanged(self.path)
+
+#########################################################
+# Class : file_wd                                       #
+#########################################################
+class file_wd(object):
+    def __init__(self, path, onChanged = None):
+        self.path = os.path.abspath(path)
+        self.onChanged = onChanged
+        self.observer = None
+
+    def __del__(self):
+        if self.observer:
+            self.stop()
+
+    def start(self):
+        if self.observer:
+            self.stop()
+        # Watch the folder, the file itself may be replaced
+        event_handler = fileHandler(self.path, self.onChanged)
+        self.observer = Observer()
+        self.observer.schedule(event_handler, path = os.path.dirname(self.path), recursive = False)
+        self.observer.start()
+
+    def stop(self):
+        if self.observer:
+            self.observer.stop()
+            #self.observer.join()
+            del self.observer
+            self.observer = None
+
+#########################################################
+# Class : probeSchedule                                 #
+#########################################################
+class probeSchedule(object):
+    # Per url probe interval and debounced state: offline hosts are probed
+    # less often the longer they are offline, hosts that recently changed
+    # state or failed once are probed more often
+    def __init__(self, interval = EMITTER_TIMEOUT):
+        self.interval = interval
+        self.urls = {}
+
+    def __del__(self):
+        pass
+
+    def getDue(self, urlList, now):
+        for url in list(self.urls.keys()):
+            if not url in urlList:
+                self.urls.pop(url)
+        return [url for url in urlList if not url in self.urls or self.urls[url]['next'] <= now]
+
+    def getWait(self, timeout, now):
+        wait = timeout
+        if self.urls:
+            wait = min(timeout, max(PROBE_MINWAIT, min(item['next'] for item in self.urls.values()) - now))
+        return wait
+
+    def result(self, url, available, now):
+        if not url in self.urls:
+            # first state is known immediately
+            item = {'state': available, 'failures': 0, 'offline': 0, 'changes': []}
+            self.urls[url] = item
+        else:
+            item = self.urls[url]
+            if available:
+                if not item['state']:
+                    item['changes'].append(now)
+                item['state'] = True
+                item['failures'] = 0
+                item['offline'] = 0
+            else:
+                item['failures'] += 1
+                if item['state'] and item['failures'] >= PROBE_DEBOUNCE:
+                    item['state'] = False
+                    item['changes'].append(now)
+                elif not item['state']:
+                    item['offline'] += 1
+        item['next'] = now + self.getInterval(item, now)
+        return item['state']
+
+    ################## INTERNAL FUNCTIONS ###################
+
+    def getInterval(self, item, now):
+        item['changes'] = [change for change in item['changes'] if now - change < PROBE_FLAPWINDOW]
+        if len(item['changes']) >= PROBE_FLAPCOUNT or (item['state'] and item['failures']):
+            interval = self.interval / 2
+        elif not item['state']:
+            interval = min(self.interval * (2 ** min(item['offline'], 16)), PROBE_MAXBACKOFF)
+        else:
+            interval = self.interval
+        return interval
+
 #########################################################
 # Class : RemoteEmitter                                 #
 #########################################################
@@ -147,12 +272,20 @@ class RemoteEmitter(EventEmitter):
     _lock = Lock()
 
     def __init__(self, event_queue, watch, timeout = EMITTER_TIMEOUT):
-        EventEmitter.__init__(self, event_queue, watch, timeout)
+        EventEmitter.__init__(self, event_queue, watch, timeout = timeout)
         self.ping = ping()
+        self.executor = None
+        self.workers = 0
+        self.running = {} # probes still running from an earlier sweep
+        self.schedule = probeSchedule(timeout)
 
     def on_thread_start(self):
         pass
 
+    def on_thread_stop(self):
+        if self.executor:
+            self.executor.shutdown(wait = False)
+
     @classmethod
     def update(cls, urlList = []):
         with cls._lock:
@@ -165,7 +298,21 @@ class RemoteEmitter(EventEmitter):
                     cls.offlineList.remove(item)
 
     def queue_events(self, timeout):
-        if self.stopped_event.wait(timeout):
+        if self.stopped_event.wait(self.schedule.getWait(timeout, time.monotonic())):
+            return
+
+        with self._lock:
+            urlList = self.schedule.getDue(list(self.urlList), time.monotonic())
+
+        if not self.should_keep_running() or not urlList:
+            return
+
+        # probe all at once without holding the lock, so a sweep takes as long
+        # as the slowest probe
+        try:
+            results = self.probe(urlList)
+        except:
+            self.stop()
             return
 
         with self._lock:
@@ -173,8 +320,12 @@ class RemoteEmitter(EventEmitter):
                 return
 
             try:
-                for url in self.urlList:
-                    available = self.ping.ping(url)
+                now = time.monotonic()
+                for url in urlList:
+                    if not url in self.urlList or not url in results:
+                        # removed while probing, or still probing: keep the last state
+                        continue
+                    available = self.schedule.result(url, results[url], now)
 
                     if available:
                         if not url in self.onlineList:
@@ -192,6 +343,33 @@ class RemoteEmitter(EventEmitter):
                 self.stop()
                 return
 
+    def probe(self, urlList):
+        # urls still probed from an earlier sweep are not probed again and
+        # get no result
+        results = {}
+        futures = {}
+        for url, future in list(self.running.items()):
+            if future.done():
+                self.running.pop(url)
+        urlList = [url for url in dict.fromkeys(urlList) if not url in self.running]
+        if len(urlList) + len(self.running) > self.workers:
+            # a worker for each probe, so none waits for a slow one to start
+            # and all finish before the deadline
+            if self.executor:
+                self.executor.shutdown(wait = False)
+            self.workers = len(urlList) + len(self.running)
+            self.executor = ThreadPoolExecutor(max_workers = self.workers)
+        for url in urlList:
+            futures[url] = self.executor.submit(self.ping.ping, url)
+        if futures:
+            wait(futures.values(), timeout = self.ping.getTimeout() + 1)
+        for url, future in futures.items():
+            # a probe that didn't finish in time counts as offline
+            results[url] = future.done() and not future.exception() and future.result()
+            if not future.done():
+                self.running[url] = future
+        return results
+
 #########################################################
 # Class : RemoteObserver                                #
 #########################################################
@@ -247,7 +425,7 @@ class ZfsEmitter(EventEmitter):
     _lock = Lock()
 
     def __init__(self, event_queue, watch, timeout = EMITTER_TIMEOUT):
-        EventEmitter.__init__(self, event_queue, watch, timeout)
+        EventEmitter.__init__(self, event_queue, watch, timeout = timeout)
         self.zfs = zfs(None, True)
 
     def __del__(self):
@@ -274,8 +452,10 @@ class ZfsEmitter(EventEmitter):
                 return
 
             try:
+                # one snapshot for all pools, mounted state is from the mount table
+                poolsHealth = self.zfs.getPoolsHealth()
                 for pool in self.poolList:
-                    health = self.zfs.getHealth(pool)
+                    health = poolsHealth[pool] if pool in poolsHealth else "UNEXIST"
 
                     if health == "ONLINE" or (health == "DEGRADED" and not self.deleteDegraded):
                         if not self.zfs.isMounted(pool):
@@ -346,6 +526,90 @@ class zfs_wd(object):
         if self.observer:
             self.observer.updateList(poolList, deleteDegraded)
 
+#########################################################
+# Class : MountEmitter                                  #
+#########################################################
+class MountEmitter(EventEmitter):
+    def __init__(self, event_queue, watch, timeout = EMITTER_TIMEOUT):
+        EventEmitter.__init__(self, event_queue, watch, timeout = timeout)
+        # own file, the kernel keeps the change state per open file
+        self.mountinfo = open(MOUNTINFO, "r")
+        self.poller = select.poll()
+        self.poller.register(self.mountinfo, select.POLLPRI | select.POLLERR)
+        self.poller.poll(0)
+        self.mountpoints = self.getMountpoints()
+
+    def __del__(self):
+        self.on_thread_stop()
+
+    def on_thread_start(self):
+        pass
+
+    def on_thread_stop(self):
+        if self.mountinfo:
+            self.mountinfo.close()
+            self.mountinfo = None
+
+    def queue_events(self, timeout):
+        try:
+            events = self.poller.poll(timeout * 1000)
+        except:
+            events = []
+
+        if not self.should_keep_running():
+            return
+
+        if events:
+            try:
+                mountpoints = self.getMountpoints()
+                for mountpoint in sorted(mountpoints - self.mountpoints):
+                    self.queue_event(FileCreatedEvent(mountpoint))
+                for mountpoint in sorted(self.mountpoints - mountpoints):
+                    self.queue_event(FileDeletedEvent(mountpoint))
+                self.mountpoints = mountpoints
+            except:
+                self.stop()
+                return
+
+    def getMountpoints(self):
+        mtable = mounttable()
+        return set(mountpoint for source, fstype, mountpoint, dev in mtable.getMounts() if mtable.isMounted(mountpoint))
+
+#########################################################
+# Class : MountObserver                                 #
+#########################################################
+class MountObserver(BaseObserver):
+    def __init__(self, timeout = OBSERVER_TIMEOUT):
+        BaseObserver.__init__(self, emitter_class = MountEmitter, timeout = timeout)
+
+#########################################################
+# Class : mount_wd                                      #
+#########################################################
+class mount_wd(object):
+    def __init__(self, onAdded = None, onDeleted = None):
+        self.onAdded = onAdded
+        self.onDeleted = onDeleted
+        self.observer = None
+
+    def __del__(self):
+        if self.observer:
+            self.stop()
+
+    def start(self):
+        if self.observer:
+            self.stop()
+        event_handler = simpleHandler(self.onAdded, self.onDeleted)
+        self.observer = MountObserver()
+        self.observer.schedule(event_handler, path = "", recursive = False)
+        self.observer.start()
+
+    def stop(self):
+        if self.observer:
+            self.observer.stop()
+            #self.observer.join()
+            del self.observer
+            self.observer = None
+
 ######################### MAIN ##########################
 if __name__ == "__main__":
     pass
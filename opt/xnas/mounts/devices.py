@@ -8,11 +8,31 @@
 
 ####################### IMPORTS #########################
 import os
+import sys
 import json
+import math
+import time
+from threading import Lock
 from common.shell import shell
+from mounts.mounttable import mounttable
 #########################################################
 
 ####################### GLOBALS #########################
+DEVICEPATHS  = ["/dev/disk/by-path", "/dev/disk/by-uuid", "/dev/disk/by-label"]
+CACHEMAXAGE  = 10
+# Backend to read block devices, "lsblk" or "sysfs" (native, no subprocesses)
+DEVBACKEND   = os.environ.get("XNAS_DEVBACKEND", "lsblk")
+# Root to read the sysfs backend from, to test with a fixture tree
+SYSROOT      = os.environ.get("XNAS_SYSROOT", "")
+SYSBLOCK     = SYSROOT + "/sys/class/block"
+SYSDISKS     = SYSROOT + "/sys/block"
+UDEVDATA     = SYSROOT + "/run/udev/data"
+MOUNTINFO    = SYSROOT + "/proc/self/mountinfo"
+SWAPS        = SYSROOT + "/proc/swaps"
+# Device nodes, as named by the sysfs backend
+DEVDIR       = "/dev"
+SYSEXCLUDE   = [7] # loop devices, as lsblk -e7
+SYSMAXDEPTH  = 8
 
 #########################################################
 
@@ -24,10 +44,18 @@ from common.shell import shell
 # Class : devices                                       #
 #########################################################
 class devices(object):
+    # Inventory shared by all instances, per human flag, as long as no devices
+    # are added or removed and no filesystems are (un)mounted
+    cache = {}
+    cacheLock = Lock()
+
     def __init__(self, logger, human):
         self.logger = logger
         self.human = human
-        self.loadDevices()
+        self.blkdevices = []
+        self.blkzfsdevices = []
+        if not self.getCache():
+            self.loadDevices()
 
     def __del__(self):
         del self.blkdevices
@@ -37,13 +65,24 @@ class devices(object):
         self.blkdevices = []
         self.blkzfsdevices = []
         try:
+            signature = self.getSignature()
             self.dfZfsDevices()
             self.blkDevices()
+            self.setCache(signature)
         except Exception as e:
             self.logger.error("Error reading devices information")
             self.logger.error(e)
             exit(1)
 
+    @classmethod
+    def invalidate(cls):
+        with cls.cacheLock:
+            cls.cache = {}
+
+    @classmethod
+    def afterFork(cls):
+        cls.cacheLock = Lock()
+
     def getBlockList(self, typefilter = []):
         deviceList = []
         for device in self.blkdevices:
@@ -120,16 +159,49 @@ class devices(object):
 
     ################## INTERNAL FUNCTIONS ###################
 
+    def getCache(self):
+        retval = False
+        with devices.cacheLock:
+            if self.human in devices.cache:
+                signature, stamp, blkdevices, blkzfsdevices = devices.cache[self.human]
+                if time.monotonic() - stamp < CACHEMAXAGE and signature == self.getSignature():
+                    # callers may modify entries, so hand out copies
+                    self.blkdevices = [dict(device) for device in blkdevices]
+                    self.blkzfsdevices = [dict(device) for device in blkzfsdevices]
+                    retval = True
+        return retval
+
+    def setCache(self, signature):
+        with devices.cacheLock:
+            devices.cache[self.human] = (signature, time.monotonic(),
+                                         [dict(device) for device in self.blkdevices],
+                                         [dict(device) for device in self.blkzfsdevices])
+
+    def getSignature(self):
+        # Cheap to get, changes when a device is added, removed or formatted or
+        # when a filesystem is (un)mounted
+        signature = []
+        for path in DEVICEPATHS:
+            try:
+                signature.append(tuple(sorted(os.listdir(path))))
+            except:
+                signature.append(())
+        signature.append(mounttable().refresh())
+        return tuple(signature)
+
     def blkDevices(self):
         entry = {}
         #sudo lsblk -fl | grep -v loop
         cmd = ""
         if self.human:
-            cmd = "lsblk -Jfpe7 -o NAME,FSTYPE,LABEL,UUID,FSSIZE,FSUSE%,MOUNTPOINT"
+            cmd = ["lsblk", "-Jfpe7", "-o", "NAME,FSTYPE,LABEL,UUID,FSSIZE,FSUSE%,MOUNTPOINT"]
         else:
-            cmd = "lsblk -Jfbpe7 -o NAME,FSTYPE,LABEL,UUID,FSSIZE,FSUSED,MOUNTPOINT"
+            cmd = ["lsblk", "-Jfbpe7", "-o", "NAME,FSTYPE,LABEL,UUID,FSSIZE,FSUSED,MOUNTPOINT"]
         try:
-            lines = json.loads(shell().command(cmd))
+            if DEVBACKEND == "sysfs":
+                lines = self.sysBlkDevices()
+            else:
+                lines = json.loads(shell().command(cmd, idempotent = True))
             #['NAME', 'FSTYPE', 'LABEL', 'UUID', 'FSAVAIL', 'FSUSE%', 'MOUNTPOINT']
             for line in lines['blockdevices']:
                 if 'children' in line:
@@ -185,11 +257,14 @@ class devices(object):
     def dfZfsDevices(self):
         cmd = ""
         if self.human:
-            cmd = "df -tzfs --output=source,size,pcent,target -h"
+            cmd = ["df", "-tzfs", "--output=source,size,pcent,target", "-h"]
         else:
-            cmd = "df -tzfs --output=source,size,used,target"
+            cmd = ["df", "-tzfs", "--output=source,size,used,target"]
         try:
-            lines = shell().command(cmd).splitlines()
+            if DEVBACKEND == "sysfs":
+                lines = self.sysZfsDevices()
+            else:
+                lines = shell().command(cmd, idempotent = True).splitlines()
             if len(lines) > 1:
                 for line in lines[1:]:
                     data = line.split()
@@ -222,6 +297,265 @@ class devices(object):
                     break
         return
 
+    def sysBlkDevices(self):
+        # Same structure as lsblk -J output, built from sysfs and the udev database
+        blkdevices = []
+        mounts = self.sysMounts()
+        swaps = self.sysSwaps()
+        for name in sorted(os.listdir(SYSDISKS)):
+            if not self.sysList(os.path.join(SYSBLOCK, name, "slaves")):
+                devc = self.sysDevice(name, mounts, swaps)
+                if devc:
+                    blkdevices.append(devc)
+        return {'blockdevices': blkdevices}
+
+    def sysDevice(self, name, mounts, swaps, depth = 0):
+        devc = None
+        path = os.path.join(SYSBLOCK, name)
+        dev = self.sysRead(path, "dev")
+        if not dev or depth > SYSMAXDEPTH:
+            return devc
+        if int(dev.split(":")[0]) in SYSEXCLUDE:
+            return devc
+        uevent = self.sysKeys(os.path.join(path, "uevent"), "")
+        udev = self.sysKeys(os.path.join(UDEVDATA, "b" + dev), "E:")
+        dmname = self.sysRead(path, os.path.join("dm", "name"))
+        if dmname:
+            fsname = os.path.join(DEVDIR, "mapper", dmname)
+        elif "DEVNAME" in uevent:
+            fsname = os.path.join(DEVDIR, uevent["DEVNAME"])
+        else:
+            fsname = os.path.join(DEVDIR, name.replace("!", "/"))
+        devc = {}
+        devc['name'] = fsname
+        devc['fstype'] = udev['ID_FS_TYPE'] if udev.get('ID_FS_TYPE') else None
+        if udev.get('ID_FS_LABEL_ENC'):
+            devc['label'] = self.unescape(udev['ID_FS_LABEL_ENC'], r"\x", 16, 2)
+        elif udev.get('ID_FS_LABEL'):
+            devc['label'] = udev['ID_FS_LABEL']
+        else:
+            devc['label'] = None
+        devc['uuid'] = udev['ID_FS_UUID'] if udev.get('ID_FS_UUID') else None
+        devpath = os.path.realpath(fsname) if not SYSROOT else fsname
+        if devpath in swaps:
+            mountpoint = "[SWAP]"
+        elif dev in mounts:
+            mountpoint = mounts[dev]
+        else:
+            mountpoint = mounts.get(devpath)
+        devc.update(self.sysFsSize(mountpoint))
+        devc['mountpoint'] = mountpoint
+        children = []
+        realpath = os.path.realpath(path)
+        for kid in sorted(self.sysList(realpath)):
+            if os.path.isfile(os.path.join(realpath, kid, "partition")):
+                kiddevc = self.sysDevice(kid, mounts, swaps, depth + 1)
+                if kiddevc:
+                    children.append(kiddevc)
+        for kid in sorted(self.sysList(os.path.join(path, "holders"))):
+            kiddevc = self.sysDevice(kid, mounts, swaps, depth + 1)
+            if kiddevc:
+                children.append(kiddevc)
+        if children:
+            devc['children'] = children
+        return devc
+
+    def sysFsSize(self, mountpoint):
+        fssize = None
+        fsused = None
+        if mountpoint and mountpoint.startswith("/"):
+            try:
+                stat = os.statvfs(mountpoint)
+                fssize = stat.f_frsize * stat.f_blocks
+                fsused = stat.f_frsize * (stat.f_blocks - stat.f_bfree)
+            except:
+                pass
+        if self.human:
+            used = None
+            if fssize != None:
+                used = "{:.0f}%".format(fsused * 100 / fssize) if fssize else "0%"
+                fssize = self.humanSize(fssize)
+            return {'fssize': fssize, 'fsuse%': used}
+        else:
+            return {'fssize': fssize, 'fsused': fsused}
+
+    def sysZfsDevices(self):
+        # Same lines as df -tzfs output, built from the mount table
+        lines = ["Filesystem"]
+        for source, fstype, mountpoint, dev in self.sysMountList():
+            if fstype == "zfs":
+                try:
+                    stat = os.statvfs(mountpoint)
+                except:
+                    continue
+                size = stat.f_frsize * stat.f_blocks
+                used = stat.f_frsize * (stat.f_blocks - stat.f_bfree)
+                avail = stat.f_frsize * stat.f_bavail
+                if self.human:
+                    pcent = "{}%".format(math.ceil(used * 100 / (used + avail))) if used + avail else "-"
+                    lines.append("{} {} {} {}".format(source, self.dfHumanSize(size), pcent, mountpoint))
+                else:
+                    lines.append("{} {} {} {}".format(source, math.ceil(size / 1024), math.ceil(used / 1024), mountpoint))
+        return lines
+
+    def sysMountList(self):
+        mountList = []
+        with open(MOUNTINFO, "r") as mountinfo:
+            for line in mountinfo:
+                # id parent major:minor root mountpoint options ... - fstype source superoptions
+                fields = line.split()
+                try:
+                    sep = fields.index("-")
+                    mountList.append((self.unescape(fields[sep + 2], "\\", 8, 3), fields[sep + 1],
+                                      self.unescape(fields[4], "\\", 8, 3), fields[2]))
+                except:
+                    pass
+        return mountList
+
+    def sysMounts(self):
+        # major:minor and source to the first mountpoint, like lsblk
+        mounts = {}
+        for source, fstype, mountpoint, dev in self.sysMountList():
+            if not dev in mounts:
+                mounts[dev] = mountpoint
+            if source.startswith("/") and not source in mounts:
+                mounts[source] = mountpoint
+        return mounts
+
+    def sysSwaps(self):
+        swaps = []
+        try:
+            with open(SWAPS, "r") as swapfile:
+                for line in swapfile.readlines()[1:]:
+                    fields = line.split()
+                    if fields and fields[1] == "partition":
+                        swaps.append(os.path.realpath(self.unescape(fields[0], "\\", 8, 3)))
+        except:
+            pass
+        return swaps
+
+    def sysRead(self, path, item):
+        content = ""
+        try:
+            with open(os.path.join(path, item), "r") as sysfile:
+                content = sysfile.read().strip()
+        except:
+            pass
+        return content
+
+    def sysList(self, path):
+        try:
+            return os.listdir(path)
+        except:
+            return []
+
+    def sysKeys(self, path, prefix):
+        keys = {}
+        try:
+            with open(path, "r") as keyfile:
+                for line in keyfile:
+                    if line.startswith(prefix) and "=" in line:
+                        key, value = line[len(prefix):].rstrip("\n").split("=", 1)
+                        keys[key] = value
+        except:
+            pass
+        return keys
+
+    def unescape(self, value, escape, base, digits):
+        # udev escapes as \x20, the mount table as \040
+        retval = ""
+        i = 0
+        while i < len(value):
+            code = value[i+len(escape):i+len(escape)+digits]
+            if value.startswith(escape, i) and len(code) == digits:
+                try:
+                    retval += chr(int(code, base))
+                    i += len(escape) + digits
+                    continue
+                except:
+                    pass
+            retval += value[i]
+            i += 1
+        return retval
+
+    def humanSize(self, size):
+        # Same format as lsblk: 1024 based, one decimal if not zero
+        exp = 0
+        while exp < 60 and size >= (1 << (exp + 10)):
+            exp += 10
+        dec = size >> exp
+        frac = size % (1 << exp)
+        suffix = "BKMGTPE"[exp // 10]
+        if frac:
+            frac = ((((frac * 1000) >> exp) + 50) // 100) * 10
+            if frac == 100:
+                dec += 1
+                frac = 0
+        if frac:
+            return "{}.{}{}".format(dec, frac // 10, suffix)
+        return "{}{}".format(dec, suffix)
+
+    def dfHumanSize(self, size):
+        # Same format as df -h: 1024 based, rounded up, one decimal below 10
+        value = float(size)
+        suffix = ""
+        for unit in "KMGTPEZY":
+            if value < 1024:
+                break
+            value /= 1024
+            suffix = unit
+        if suffix and value < 10:
+            value = math.ceil(value * 10) / 10
+            if value < 10:
+                return "{:.1f}{}".format(value, suffix)
+        value = math.ceil(value)
+        if suffix and value >= 1024:
+            return "1.0{}".format("KMGTPEZY"["KMGTPEZY".index(suffix) + 1])
+        return "{}{}".format(value, suffix)
+
+os.register_at_fork(after_in_child = devices.afterFork)
+
 ######################### MAIN ##########################
 if __name__ == "__main__":
-    pass
+    # Compare the sysfs backend with lsblk and df:
+    # [XNAS_SYSROOT=<fixture tree>] python3 -m mounts.devices [-h] [lsblk.json]
+    import logging
+    human = "-h" in sys.argv
+    files = [arg for arg in sys.argv[1:] if arg != "-h"]
+    logger = logging.getLogger('xnas.devices')
+    keys = ['fsname', 'label', 'uuid', 'type', 'mountpoint', 'mounted']
+    if not SYSROOT:
+        keys += ['size', 'used']
+    DEVBACKEND = "sysfs"
+    sysfs = devices(logger, human).blkdevices
+    DEVBACKEND = "lsblk"
+    devices.invalidate()
+    if files:
+        reference = devices.__new__(devices)
+        reference.logger = logger
+        reference.human = human
+        reference.blkdevices = []
+        reference.blkzfsdevices = []
+        with open(files[0], "r") as lsblkfile:
+            shell.command = lambda self, cmd, *args, **kwargs: lsblkfile.read() if cmd[0] == "lsblk" else ""
+            reference.blkDevices()
+        lsblk = reference.blkdevices
+    else:
+        lsblk = devices(logger, human).blkdevices
+    differences = 0
+    lsblkDict = {device['fsname']: device for device in lsblk}
+    sysfsDict = {device['fsname']: device for device in sysfs}
+    for fsname in sorted(set(lsblkDict) | set(sysfsDict)):
+        if not fsname in sysfsDict:
+            print("{}: only in lsblk".format(fsname))
+            differences += 1
+        elif not fsname in lsblkDict:
+            print("{}: only in sysfs".format(fsname))
+            differences += 1
+        else:
+            for key in keys:
+                if lsblkDict[fsname].get(key) != sysfsDict[fsname].get(key):
+                    print("{}: {} lsblk={} sysfs={}".format(fsname, key, lsblkDict[fsname].get(key), sysfsDict[fsname].get(key)))
+                    differences += 1
+    print("{} devices, {} differences".format(len(lsblkDict), differences))
+    exit(1 if differences else 0)
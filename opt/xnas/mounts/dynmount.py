@@ -10,7 +10,7 @@
 import logging
 from common.xnas_engine import groups
 from mounts.mountfs import mountfs
-from common.xnas_wd import device_wd, zfs_wd
+from common.xnas_wd import device_wd, zfs_wd, mount_wd
 from common.dynmountdata import dynmountdata
 #########################################################
 
@@ -35,10 +35,12 @@ class dynmount(mountfs, dynmountdata):
         self.xmounts   = []
         self.device_wd = device_wd(self.onAdded, self.onDeleted)
         self.zfs_wd = zfs_wd(self.getZfsList(), self.zfshealth, self.onZfsAdded, self.onZfsDeleted)
+        self.mount_wd = mount_wd(self.onMounted, self.onUnmounted)
         mountfs.__init__(self, self.logger)
         dynmountdata.__init__(self, self.logger)
         self.device_wd.start()
         self.zfs_wd.start()
+        self.mount_wd.start()
 
     def __del__(self):
         dynmountdata.__del__(self)
@@ -51,13 +53,16 @@ class dynmount(mountfs, dynmountdata):
         if self.zfs_wd:
             self.zfs_wd.stop()
             del self.zfs_wd
+        if self.mount_wd:
+            self.mount_wd.stop()
+            del self.mount_wd
 
     def update(self, zfshealth = False, removable = False):
         self.zfshealth = zfshealth
         self.removable = removable
 
-    def updateList(self):
-        self.getList()
+    def updateList(self, changes = None):
+        self.getList(self.getChanged(changes, groups.MOUNTS))
         self.zfs_wd.updateList(self.getZfsList(), self.zfshealth)
 
     ####################### CALLBACKS #######################
@@ -232,14 +237,36 @@ class dynmount(mountfs, dynmountdata):
             self.logger.warning("ZFS mount device added without data")
         self.engine.mutex.release()
 
+    def onMounted(self, mountpoint):
+        self.engine.mutex.acquire()
+        # mounted, also outside xnas (local and remote mounts)
+        xmounts = dynmountdata.mountDynmount(mountpoint, True)
+        if self.verbose:
+            for xmount in xmounts:
+                self.logger.info("{} mounted on {}".format(xmount, mountpoint))
+        self.engine.mutex.release()
+
+    def onUnmounted(self, mountpoint):
+        self.engine.mutex.acquire()
+        # unmounted, also outside xnas (local and remote mounts)
+        xmounts = dynmountdata.mountDynmount(mountpoint, False)
+        if self.verbose:
+            for xmount in xmounts:
+                self.logger.info("{} unmounted from {}".format(xmount, mountpoint))
+        self.engine.mutex.release()
+
     ################## INTERNAL FUNCTIONS ###################
 
-    def getList(self):
+    def getList(self, names = None):
         newxmounts = []
         mounts = self.engine.checkGroup(groups.MOUNTS)
         if mounts:
             for key, mount in mounts.items():
-                if mount['method'] == "dynmount":
+                if names != None and not key in names:
+                    # unchanged, the watchdogs keep it up to date
+                    if mount['method'] in ["dynmount", "auto"]:
+                        newxmounts.append(key)
+                elif mount['method'] == "dynmount":
                     refs, refsena = self.getReferences(self.engine, key)
                     mounted = self.isMounted(mount['mountpoint'])
                     dynmountdata.addDynmount(key, mounted, mount['mountpoint'], refs, refsena)
@@ -269,14 +296,12 @@ class dynmount(mountfs, dynmountdata):
     def findMount(self, uuid):
         xmount = ""
         zfs = False
-        mounts = self.engine.checkGroup(groups.MOUNTS)
-        if mounts:
-            for key, mount in mounts.items():
-                if mount['method'] == "dynmount":
-                    if mount['uuid'] == uuid:
-                        xmount = key
-                        zfs = mount['zfs']
-                        break
+        mounts = self.engine.findAllInGroup(groups.MOUNTS, 'uuid', uuid)
+        for key, mount in mounts.items():
+            if mount['method'] == "dynmount":
+                xmount = key
+                zfs = mount['zfs']
+                break
         return xmount, zfs
 
     def getMountPoint(self, xmount):
@@ -9,6 +9,8 @@
 ####################### IMPORTS #########################
 import os
 import shutil
+import tempfile
+from threading import Lock
 from common.ls import ls
 from common.shell import shell
 from common.systemdctl import systemdctl
@@ -32,9 +34,19 @@ TABSIZE = 8
 # Class : fstab                                         #
 #########################################################
 class fstab(object):
+    # Parsed entries shared by all instances, as long as the file is not changed
+    model = None
+    modelLock = Lock()
+
     def __init__(self, logger, remote = False):
         self.logger = logger
         self.entries = []
+        self.fileSignature = None
+        self.transaction = None
+        self.uuidIndex = {}
+        self.fsnameIndex = {}
+        self.labelIndex = {}
+        self.lineIndex = {}
         self.remote = remote
         try:
             self.tuneType("Whatever")
@@ -78,6 +90,7 @@ class fstab(object):
         else:
             newEntry = self.getEntryFromLine(linenr, True)
             newEntry['content'] = entry
+        self.indexFstab()
 
         try:
             self.writeFstabLine(linenr)
@@ -414,7 +427,10 @@ class fstab(object):
         if 0 < backupnr <= FSTABBACKUPS:
             backupfile="{}.{}{}".format(FSTABFILE,backupnr,FSTABBACKUP)
             if os.path.isfile(backupfile):
-                shutil.copy2(backupfile, FSTABFILE)
+                with open(backupfile, "rt") as fp:
+                    lines = fp.readlines()
+                self.saveFstab(lines)
+                fstab.invalidate()
                 retval = True
         return retval
 
@@ -425,7 +441,7 @@ class fstab(object):
             if os.path.isfile(backupfile):
                 cmd = "diff " + FSTABFILE + " " + backupfile
                 try:
-                    outp = shell().command(cmd, 1)
+                    outp = shell().command(cmd, 1, readonly = True)
                 except:
                     outp = []
                 if outp:
@@ -471,6 +487,56 @@ class fstab(object):
         del ctl
         return retval
 
+    def beginFstab(self):
+        # Edits are kept until commitFstab, then fstab is backed up and written once
+        retval = False
+        if self.transaction == None:
+            self.transaction = {'signature': None, 'lines': None, 'written': False}
+            retval = True
+        return retval
+
+    def flushFstab(self):
+        # Writes the edits kept so far, e.g. before mounting, the transaction continues
+        retval = True
+        if self.transaction and self.transaction['lines'] != None:
+            signature = self.transaction['signature']
+            lines = self.transaction['lines']
+            self.transaction['signature'] = None
+            self.transaction['lines'] = None
+            try:
+                if signature != self.fstabSignature():
+                    raise Exception("{} changed while editing".format(FSTABFILE))
+                self.backupFstab()
+                self.saveFstab(lines)
+                self.updateModel(signature)
+                self.transaction['written'] = True
+            except Exception as e:
+                self.logger.error("Error writing system mount information")
+                self.logger.error(e)
+                retval = False
+                try:
+                    self.readFstab()
+                except:
+                    pass
+        return retval
+
+    def commitFstab(self, reload = True):
+        retval = self.flushFstab()
+        if self.transaction != None:
+            if retval and reload and self.transaction['written']:
+                retval = self.systemdReload(self.remote)
+            self.transaction = None
+        return retval
+
+    @classmethod
+    def invalidate(cls):
+        with cls.modelLock:
+            cls.model = None
+
+    @classmethod
+    def afterFork(cls):
+        cls.modelLock = Lock()
+
     ################## INTERNAL FUNCTIONS ###################
 
     def getEntryLine(self, uuid = "", fsname = "", label = ""):
@@ -484,17 +550,91 @@ class fstab(object):
         return line
 
     def readFstab(self):
-        linenr = 0
-        with open(FSTABFILE, "rt") as fp:
-            for line in fp:
-                entry = self.parseFstabLine(line, linenr)
-                if entry:
-                    self.entries.append(entry)
-                linenr += 1
+        if not self.getModel():
+            linenr = 0
+            self.entries = []
+            with open(FSTABFILE, "rt") as fp:
+                self.fileSignature = self.fstabSignature(fp)
+                for line in fp:
+                    entry = self.parseFstabLine(line, linenr)
+                    if entry:
+                        self.entries.append(entry)
+                    linenr += 1
+            self.setModel()
+        self.indexFstab()
+
+    def getModel(self):
+        retval = False
+        with fstab.modelLock:
+            if fstab.model:
+                signature, entries = fstab.model
+                if signature == self.fstabSignature():
+                    # callers may modify entries, so hand out copies
+                    self.entries = self.copyEntries(entries)
+                    self.fileSignature = signature
+                    retval = True
+        return retval
+
+    def setModel(self):
+        with fstab.modelLock:
+            fstab.model = (self.fileSignature, self.copyEntries(self.entries))
+
+    def updateModel(self, signature):
+        # entries are changed as written, the model follows if they were read from the same file
+        self.indexFstab()
+        if signature == self.fileSignature:
+            self.fileSignature = self.fstabSignature()
+            self.setModel()
+        else:
+            fstab.invalidate()
+
+    @classmethod
+    def fstabSignature(cls, fp = None):
+        # Changes when the file is written or replaced
+        signature = None
+        try:
+            if fp:
+                stat = os.fstat(fp.fileno())
+            else:
+                stat = os.stat(FSTABFILE)
+            signature = (FSTABFILE, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except:
+            pass
+        return signature
+
+    def copyEntries(self, entries):
+        copies = []
+        for entry in entries:
+            content = dict(entry['content'])
+            content['options'] = list(content['options'])
+            copies.append({'line': entry['line'], 'content': content})
+        return copies
+
+    def indexFstab(self):
+        # positions in entries by uuid, label, fsname and line, links are resolved only here
+        self.uuidIndex = {}
+        self.fsnameIndex = {}
+        self.labelIndex = {}
+        self.lineIndex = {}
+        for pos, entry in enumerate(self.entries):
+            content = entry['content']
+            if content['uuid']:
+                self.uuidIndex.setdefault(content['uuid'].lower(), []).append(pos)
+            if content['fsname']:
+                self.fsnameIndex.setdefault(self.fstabKey(content['fsname']), []).append(pos)
+            if content['label']:
+                self.labelIndex.setdefault(content['label'].lower(), []).append(pos)
+            self.lineIndex.setdefault(entry['line'], pos)
+
+    def fstabKey(self, fsname):
+        key = ""
+        if not self.remote:
+            key = self.getDevPath(fsname)
+        else:
+            key = fsname
+        return key
 
     def writeFstabLine(self, line):
-        self.backupFstab()
-        lines = []
         entry = self.getEntryFromLine(line)
         if line == -1: # new entry
             #find last line
@@ -505,8 +645,7 @@ class fstab(object):
         else:
             defaultline = line
 
-        with open(FSTABFILE, "rt") as fp:
-            lines = fp.readlines()
+        signature, lines = self.readFstabLines()
 
         if defaultline == -1: # first entry in fstab
             newline = self.generateFstabLine(entry, "UUID=xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx\t/whatever\t\text4\tdefaults\t\t\t0\t2\n")
@@ -515,31 +654,94 @@ class fstab(object):
 
         if line == -1:
             lines.append(newline)
+            self.getEntryFromLine(line, True)['line'] = len(lines) - 1
         else:
             lines[line] = newline
 
-        with open(FSTABFILE, "wt") as fp:
-            fp.writelines(lines)
+        self.writeFstabLines(signature, lines)
 
     def delFstabLine(self, line):
-        self.backupFstab()
-        with open(FSTABFILE, "rt") as fp:
-            lines = fp.readlines()
+        signature, lines = self.readFstabLines()
 
+        if line < 0: # as pop, counted from the end
+            line += len(lines)
         lines.pop(line)
 
-        with open(FSTABFILE, "wt") as fp:
-            fp.writelines(lines)
+        entries = []
+        for entry in self.entries:
+            if entry['line'] != line:
+                if entry['line'] > line:
+                    entry['line'] -= 1
+                entries.append(entry)
+        self.entries = entries
+        self.writeFstabLines(signature, lines)
+
+    def readFstabLines(self):
+        if self.transaction and self.transaction['lines'] != None:
+            signature = self.transaction['signature']
+            lines = self.transaction['lines']
+        else:
+            with open(FSTABFILE, "rt") as fp:
+                signature = self.fstabSignature(fp)
+                lines = fp.readlines()
+        return signature, lines
+
+    def writeFstabLines(self, signature, lines):
+        if self.transaction != None:
+            self.transaction['signature'] = signature
+            self.transaction['lines'] = lines
+            self.indexFstab()
+        else:
+            self.backupFstab()
+            self.saveFstab(lines)
+            self.updateModel(signature)
 
     def backupFstab(self):
-        for i in range(FSTABBACKUPS-1,-1,-1):
-            if i > 0:
-                curfile="{}.{}{}".format(FSTABFILE,i,FSTABBACKUP)
-            else:
-                curfile=FSTABFILE
+        # Rotate by renaming, the current file is kept as first backup by a link,
+        # as it is replaced and not written in place
+        for i in range(FSTABBACKUPS-1,0,-1):
+            curfile="{}.{}{}".format(FSTABFILE,i,FSTABBACKUP)
             newfile="{}.{}{}".format(FSTABFILE,i+1,FSTABBACKUP)
             if os.path.isfile(curfile):
-                shutil.copy2(curfile, newfile)
+                os.replace(curfile, newfile)
+        newfile="{}.{}{}".format(FSTABFILE,1,FSTABBACKUP)
+        if os.path.isfile(FSTABFILE):
+            if os.path.isfile(newfile):
+                os.remove(newfile)
+            try:
+                os.link(os.path.realpath(FSTABFILE), newfile)
+            except OSError:
+                shutil.copy2(FSTABFILE, newfile)
+
+    def saveFstab(self, lines):
+        # Write a new file and rename it over the old one, so fstab is never
+        # seen partly written
+        fstabfile = os.path.realpath(FSTABFILE)
+        fstabdir = os.path.dirname(fstabfile)
+        fd, tmppath = tempfile.mkstemp(prefix = ".{}.".format(FSTABNAME), dir = fstabdir)
+        try:
+            with os.fdopen(fd, "wt") as fp:
+                self.copyFstabMode(fstabfile, fp.fileno())
+                fp.writelines(lines)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmppath, fstabfile)
+        except:
+            try:
+                os.remove(tmppath)
+            except:
+                pass
+            raise
+
+    def copyFstabMode(self, fstabfile, fd):
+        mode = 0o644
+        try:
+            fstabstat = os.stat(fstabfile)
+            mode = fstabstat.st_mode & 0o7777
+            os.fchown(fd, fstabstat.st_uid, fstabstat.st_gid)
+        except:
+            pass
+        os.fchmod(fd, mode)
 
     def generateFstabLine(self, entry, defaultline):
         pos = self.findPos(defaultline)
@@ -619,37 +821,36 @@ class fstab(object):
 
     def findEntryLine(self, uuid = "", fsname = "", label = ""):
         entryLine = -1
-        for entry in self.entries:
-            if entry['content']['uuid'] and uuid:
-                if entry['content']['uuid'].lower() == uuid.lower():
-                    entryLine = entry['line']
-                    break
-            elif entry['content']['fsname'] and fsname:
-                if not self.remote:
-                    entryfsname = self.getDevPath(entry['content']['fsname'])
-                    infsname = self.getDevPath(fsname)
-                else:
-                    entryfsname = entry['content']['fsname']
-                    infsname = fsname
-                if entryfsname == infsname:
-                    entryLine = entry['line']
-                    break
-            elif entry['content']['label'] and label:
-                if entry['content']['label'].lower() == label.lower():
-                    entryLine = entry['line']
-                    break
+        found = []
+        if uuid:
+            found.extend([(pos, "uuid") for pos in self.uuidIndex.get(uuid.lower(), [])])
+        if fsname:
+            found.extend([(pos, "fsname") for pos in self.fsnameIndex.get(self.fstabKey(fsname), [])])
+        if label:
+            found.extend([(pos, "label") for pos in self.labelIndex.get(label.lower(), [])])
+        for pos, key in sorted(found):
+            # an entry is only compared on its first key that is given (uuid, fsname, label)
+            content = self.entries[pos]['content']
+            if content['uuid'] and uuid:
+                entryKey = "uuid"
+            elif content['fsname'] and fsname:
+                entryKey = "fsname"
+            else:
+                entryKey = "label"
+            if key == entryKey:
+                entryLine = self.entries[pos]['line']
+                break
         return entryLine
 
     def getEntryFromLine(self, entryLine, fullInfo = False):
         entry = {}
 
-        for entr in self.entries:
-            if entr['line'] == entryLine:
-                if fullInfo:
-                    entry = entr
-                else:
-                    entry = entr['content']
-                break
+        pos = self.lineIndex.get(entryLine, -1)
+        if pos >= 0:
+            if fullInfo:
+                entry = self.entries[pos]
+            else:
+                entry = self.entries[pos]['content']
         return entry
 
     def tuneType(self, type):
@@ -700,6 +901,8 @@ class fstab(object):
 
         return tag
 
+os.register_at_fork(after_in_child = fstab.afterFork)
+
 ######################### MAIN ##########################
 if __name__ == "__main__":
     pass
@@ -7,6 +7,7 @@
 #########################################################
 
 ####################### IMPORTS #########################
+import time
 import logging
 from copy import deepcopy
 from mounts.devices import devices
@@ -15,6 +16,7 @@ from mounts.mountfs import mountfs
 from mounts.zfs import zfs
 from mounts.mountpoint import mountpoint
 from common.stdin import stdin
+from common.shell import shell
 from common.xnas_engine import groups
 #########################################################
 
@@ -94,52 +96,22 @@ class mount(devices, fstab, mountfs, zfs, mountpoint):
         return listentries
 
     def getMounts(self):
+        # Read all there is to know at once, then join it per mount without
+        # running commands
         mymounts = []
         mounts = self.engine.checkGroup(groups.MOUNTS)
         if mounts:
+            start = time.time()
+            snapshot = self.getMountsSnapshot(mounts)
+            joined = time.time()
             for key, mount in mounts.items():
-                mymount = {}
-                mymount['xmount'] = key
-                # Check but same for zfs and regular fs-es
-                device = self.getDevices(mount['uuid'])
-                if device:
-                    fsnames = []
-                    for mydevice in device:
-                        fsnames.append(mydevice['fsname'])
-                    mymount['device'] = fsnames
-                    mymount['mountpoint'] = device[0]['mountpoint']
-                    if not mymount['mountpoint']:
-                        mymount['mountpoint'] = mount['mountpoint']
-                    mymount['type'] = device[0]['type']
-                    mymount['size'] = device[0]['size']
-                    mymount['used'] = device[0]['used']
-                    mymount['mounted'] = device[0]['mounted']
-                    if mount['zfs']:
-                        #mymount['enabled'] = zfs.isEna(self, mount['uuid'])
-                        mymount['health'] = zfs.getHealth(self, mount['uuid'], device[0]['mounted'])
-                    else:
-                        #mymount['enabled'] = fstab.isEna(self, mount['uuid'], device[0]['fsname'], device[0]['label'])
-                        mymount['health'] = fstab.getHealth(self, mount['uuid'], device[0]['fsname'], device[0]['label'], device[0]['mounted'])
-                else:
-                    mymount['device'] = None
-                    mymount['mountpoint'] = mount['mountpoint']
-                    if mount['zfs']:
-                        entry = zfs.getEntry(self, mount['uuid'])
-                    else:
-                        entry = fstab.getEntry(self, mount['uuid'])
-                    if entry:
-                        mymount['type'] = entry['type']
-                    else:
-                        mymount['type'] = None
-                    mymount['size'] = None
-                    mymount['used'] = None
-                    mymount['mounted'] = False
-                    mymount['health'] = "UNAVAIL"
-                #mymount['enabled'] = mount['enabled']
-                mymount['referenced'] = self.isReferenced(key, True)
-                mymount['method'] = mount['method']
+                mymount = self.joinMount(key, mount, snapshot)
                 if mymount:
                     mymounts.append(mymount)
+            end = time.time()
+            shell.recordPhase("mount.getMounts snapshot", start, joined)
+            shell.recordPhase("mount.getMounts join", joined, end)
+            self.logger.debug("Mounts status: snapshot {:.1f} ms, join {:.1f} ms".format((joined - start) * 1000, (end - joined) * 1000))
 
         return mymounts
 
@@ -255,6 +227,7 @@ class mount(devices, fstab, mountfs, zfs, mountpoint):
                             mp = mpoint
                         else:
                             mp = entry['mountpoint']
+                        fstab.flushFstab(self) # mount reads the edits from fstab
                         retval = mountfs.mount(self, mp)
                 elif dbItem:
                     self.logger.warning("{} already mounted".format(name))
@@ -473,6 +446,8 @@ class mount(devices, fstab, mountfs, zfs, mountpoint):
         mode = 0o777
         curmode = 0o777
         method = "disabled" #should never occur as settings["method"] is always set
+        # fstab is backed up, written and reloaded once for all edits
+        transaction = fstab.beginFstab(self)
 
         if 'type' in self.engine.settings:
             retval = self.checkType(self.engine.settings['type'])
@@ -615,8 +590,9 @@ class mount(devices, fstab, mountfs, zfs, mountpoint):
                     uuid = self.getUuid(entryNew)
                 retval = self.mnt(uuid, dbItem = False, Zfs = isZfs, mpoint = entryNew['mountpoint'])
 
-        if retval and not isZfs and changed:
-            retval = fstab.systemdReload(self, remote = False)
+        if transaction:
+            if not fstab.commitFstab(self, reload = retval and changed):
+                retval = False
 
         # Add to DB or edit DB
         if retval:
@@ -646,6 +622,7 @@ class mount(devices, fstab, mountfs, zfs, mountpoint):
     def delFs(self, name):
         retval = False
         db = self.engine.checkKey(groups.MOUNTS, name)
+        transaction = fstab.beginFstab(self)
         if db:
             if db['zfs']:
                 if not self.isReferenced(name):
@@ -661,6 +638,10 @@ class mount(devices, fstab, mountfs, zfs, mountpoint):
                         if retval:
                             mountpoint.delete(self, db['mountpoint'])
                             self.logger.info("Removed mountpoint: {}".format(db['mountpoint']))
+        if transaction:
+            # the entry is deleted once written, a failed reload doesn't undo that
+            retval = fstab.flushFstab(self) and retval
+            fstab.commitFstab(self, reload = retval)
         if retval:
             self.logger.info("{} deleted".format(name))
             self.clr(name) # Remove from DB
@@ -683,6 +664,71 @@ class mount(devices, fstab, mountfs, zfs, mountpoint):
 
     ################## INTERNAL FUNCTIONS ###################
 
+    def getMountsSnapshot(self, mounts):
+        # devices by uuid, label and 'real' fsname (as getDevices) and health of all pools
+        snapshot = {'uuid': {}, 'label': {}, 'fsname': {}, 'health': {}}
+        for device in self.blkdevices:
+            if device['uuid']:
+                snapshot['uuid'].setdefault(device['uuid'].lower(), []).append(device)
+            if device['label']:
+                snapshot['label'].setdefault(device['label'].lower(), []).append(device)
+            if device['fsname']:
+                snapshot['fsname'].setdefault(self.getDevPath(device['fsname']), []).append(device)
+        for key, mount in mounts.items():
+            if mount['zfs']:
+                snapshot['health'] = zfs.getPoolsHealth(self)
+                break
+        return snapshot
+
+    def joinMount(self, key, mount, snapshot):
+        mymount = {}
+        mymount['xmount'] = key
+        # Check but same for zfs and regular fs-es
+        device = []
+        if mount['uuid']:
+            device = snapshot['uuid'].get(mount['uuid'].lower(), [])
+            if not device:
+                device = snapshot['label'].get(mount['uuid'].lower(), [])
+            if not device:
+                device = snapshot['fsname'].get(self.getDevPath(mount['uuid']), [])
+        if device:
+            fsnames = []
+            for mydevice in device:
+                fsnames.append(mydevice['fsname'])
+            mymount['device'] = fsnames
+            mymount['mountpoint'] = device[0]['mountpoint']
+            if not mymount['mountpoint']:
+                mymount['mountpoint'] = mount['mountpoint']
+            mymount['type'] = device[0]['type']
+            mymount['size'] = device[0]['size']
+            mymount['used'] = device[0]['used']
+            mymount['mounted'] = device[0]['mounted']
+            if mount['zfs']:
+                #mymount['enabled'] = zfs.isEna(self, mount['uuid'])
+                mymount['health'] = snapshot['health'].get(mount['uuid'], "UNEXIST")
+            else:
+                #mymount['enabled'] = fstab.isEna(self, mount['uuid'], device[0]['fsname'], device[0]['label'])
+                mymount['health'] = fstab.getHealth(self, mount['uuid'], device[0]['fsname'], device[0]['label'], device[0]['mounted'])
+        else:
+            mymount['device'] = None
+            mymount['mountpoint'] = mount['mountpoint']
+            if mount['zfs']:
+                entry = zfs.getEntry(self, mount['uuid'])
+            else:
+                entry = fstab.getEntry(self, mount['uuid'])
+            if entry:
+                mymount['type'] = entry['type']
+            else:
+                mymount['type'] = None
+            mymount['size'] = None
+            mymount['used'] = None
+            mymount['mounted'] = False
+            mymount['health'] = "UNAVAIL"
+        #mymount['enabled'] = mount['enabled']
+        mymount['referenced'] = self.isReferenced(key, True)
+        mymount['method'] = mount['method']
+        return mymount
+
     def addToDB(self, entry, uuid, interactive = False, popArg = {}):
         dbMount = {}
         newMount = {}
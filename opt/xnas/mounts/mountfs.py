@@ -8,10 +8,10 @@
 
 ####################### IMPORTS #########################
 from common.shell import shell
+from mounts.mounttable import mounttable
 #########################################################
 
 ####################### GLOBALS #########################
-EXCLUDEMOUNTEDLIST = ["autofs"]
 #########################################################
 
 ###################### FUNCTIONS ########################
@@ -85,17 +85,7 @@ class mountfs(object):
         return self.unmount(mountpoint, "unbinding", force = force, timeout = timeout)
 
     def isMounted(self, mountpoint):
-        retval = False
-        cmd = "cat /proc/mounts|grep " + mountpoint
-        try:
-            lines = shell().command(cmd).splitlines()
-            for line in lines:
-                l = line.split(" ")
-                if not l[2].strip() in EXCLUDEMOUNTEDLIST:
-                    retval = True
-        except Exception as e:
-            retval = False
-        return retval
+        return mounttable().isMounted(mountpoint)
 
 ######################### MAIN ##########################
 if __name__ == "__main__":
@@ -10,11 +10,12 @@
 import os
 import stat
 import pwd
-from common.shell import shell
+from mounts.mounttable import mounttable
 #########################################################
 
 ####################### GLOBALS #########################
 DEFAULTLOCATION = "/mnt"
+UUIDLOCATION = "/dev/disk/by-uuid"
 MOUNTPOINTMODE = 0o777
 SUWURMODE = 0o755
 DISABLEDMODE = 0o000
@@ -43,7 +44,7 @@ class mountpoint(object):
         return os.path.isdir(mountpoint)
 
     def mounted(self, mountpoint):
-        return os.path.ismount(mountpoint)
+        return mounttable().isMounted(mountpoint, False)
 
     def create(self, mountpoint):
         retval = False
@@ -172,18 +173,30 @@ class mountpoint(object):
 
     def getMountPoint(self, uuid, byName = False):
         mpoint = ""
-        cmd = ""
+        mpoints = []
         if byName: # e.g. for ZFS
-            cmd = "findmnt -rn -S {} -o TARGET".format(uuid)
+            mpoints = mounttable().findSource(uuid)
         else:
-            cmd = "findmnt -rn -S UUID={} -o TARGET".format(uuid)
+            fsname = self.getUuidPath(uuid)
+            if fsname:
+                mpoints = mounttable().findSource(fsname, canonical = True)
+        if mpoints:
+            mpoint = mpoints[0] # assume first mountpoint is of importance
+
+        return mpoint
+
+    ################## INTERNAL FUNCTIONS ###################
+
+    def getUuidPath(self, uuid):
+        fsname = ""
         try:
-            lines = shell().command(cmd).splitlines()
-            mpoint = lines[0] # assume first mountpoint is of importance
+            for name in os.listdir(UUIDLOCATION):
+                if name.lower() == uuid.lower():
+                    fsname = os.path.realpath(os.path.join(UUIDLOCATION, name))
+                    break
         except:
             pass
-
-        return mpoint
+        return fsname
 
 ######################### MAIN ##########################
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#########################################################
+# SERVICE : mounttable.py                               #
+#           Keeps the mount table of this process       #
+#           without forking commands                    #
+#           I. Helwegen 2020                            #
+#########################################################
+
+####################### IMPORTS #########################
+import os
+import select
+from threading import Lock
+#########################################################
+
+####################### GLOBALS #########################
+MOUNTINFO          = "/proc/self/mountinfo"
+EXCLUDEMOUNTEDLIST = ["autofs"]
+#########################################################
+
+###################### FUNCTIONS ########################
+
+#########################################################
+
+#########################################################
+# Class : mounttable                                    #
+#########################################################
+class mounttable(object):
+    # The kernel signals POLLPRI|POLLERR on an open mountinfo file when the
+    # mount table changes, so it is only read again after a change
+    table = {}
+    mounts = []
+    generation = 0
+    mountinfo = None
+    poller = None
+    lock = Lock()
+
+    def __init__(self):
+        self.refresh()
+
+    def __del__(self):
+        pass
+
+    def refresh(self):
+        with mounttable.lock:
+            if mounttable.changed():
+                mounttable.read()
+        return mounttable.generation
+
+    def isMounted(self, mountpoint, exclude = True):
+        retval = False
+        for source, fstype, dev in self.getMount(mountpoint):
+            if not exclude or not fstype in EXCLUDEMOUNTEDLIST:
+                retval = True
+                break
+        return retval
+
+    def getMount(self, mountpoint):
+        retval = []
+        if mountpoint:
+            retval = mounttable.table.get(os.path.normpath(mountpoint), [])
+            if not retval:
+                # the kernel lists resolved paths, mountpoint may be a symlink
+                # or relative, only resolved on a miss as it stats the path
+                retval = mounttable.table.get(os.path.realpath(mountpoint), [])
+        return retval
+
+    def findSource(self, source, fstype = None, canonical = False):
+        mountpoints = []
+        for msource, mfstype, mountpoint, dev in mounttable.mounts:
+            if canonical and msource.startswith("/dev/"):
+                msource = os.path.realpath(msource)
+            if msource == source and (not fstype or mfstype == fstype):
+                mountpoints.append(mountpoint)
+        return mountpoints
+
+    def getMounts(self):
+        return list(mounttable.mounts)
+
+    def getGeneration(self):
+        return mounttable.generation
+
+    @classmethod
+    def afterFork(cls):
+        # a forked child must not consume the change events of its parent
+        cls.lock = Lock()
+        if cls.mountinfo:
+            try:
+                cls.mountinfo.close()
+            except:
+                pass
+        cls.mountinfo = None
+        cls.poller = None
+
+    ################## INTERNAL FUNCTIONS ###################
+
+    @classmethod
+    def changed(cls):
+        retval = True
+        if not cls.mountinfo:
+            try:
+                cls.mountinfo = open(MOUNTINFO, "r")
+                cls.poller = select.poll()
+                cls.poller.register(cls.mountinfo, select.POLLPRI | select.POLLERR)
+            except:
+                cls.mountinfo = None
+                cls.poller = None
+        elif cls.poller:
+            retval = len(cls.poller.poll(0)) > 0
+        return retval
+
+    @classmethod
+    def read(cls):
+        table = {}
+        mounts = []
+        try:
+            if cls.mountinfo:
+                cls.mountinfo.seek(0)
+                lines = cls.mountinfo.read().splitlines()
+            else:
+                with open(MOUNTINFO, "r") as mountinfo:
+                    lines = mountinfo.read().splitlines()
+        except:
+            lines = []
+        for line in lines:
+            # id parent major:minor root mountpoint options ... - fstype source superoptions
+            fields = line.split()
+            try:
+                sep = fields.index("-", 6)
+                mountpoint = cls.unescape(fields[4])
+                source = cls.unescape(fields[sep + 2])
+                fstype = fields[sep + 1]
+            except:
+                continue
+            mounts.append((source, fstype, mountpoint, fields[2]))
+            if not mountpoint in table:
+                table[mountpoint] = []
+            table[mountpoint].append((source, fstype, fields[2]))
+        cls.table = table
+        cls.mounts = mounts
+        cls.generation += 1
+
+    @classmethod
+    def unescape(cls, value):
+        # space, tab, newline and backslash are octal escaped
+        retval = value
+        if "\\" in value:
+            retval = ""
+            i = 0
+            while i < len(value):
+                if value[i] == "\\" and value[i+1:i+4].isdigit():
+                    retval += chr(int(value[i+1:i+4], 8))
+                    i += 4
+                else:
+                    retval += value[i]
+                    i += 1
+        return retval
+
+os.register_at_fork(after_in_child = mounttable.afterFork)
+
+######################### MAIN ##########################
+if __name__ == "__main__":
+    pass
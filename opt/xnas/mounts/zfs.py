@@ -7,12 +7,18 @@
 #########################################################
 
 ####################### IMPORTS #########################
+import os
 import logging
 from common.shell import shell
+from mounts.mounttable import mounttable
 #########################################################
 
 ####################### GLOBALS #########################
 INSTALL = "zfsutils-linux"
+KSTATZFS = "/proc/spl/kstat/zfs"
+# Properties of all filesystems, read at once with getProperties
+ZFSPROPERTIES = ["mounted", "canmount", "mountpoint", "compression", "atime", "readonly", "exec",
+                 "devices", "setuid", "xattr", "encryption", "keylocation"]
 #########################################################
 
 ###################### FUNCTIONS ########################
@@ -69,13 +75,27 @@ class zfs(object):
     def getHealth(self, pool, isMounted = True):
         retval = "UNEXIST"
         if self.hasZfs:
-            if self.poolExists(pool):
-                cmd = "zpool list -H -o health " + pool
-                outp = shell().command(cmd)
-                if outp:
-                    retval = outp.upper().strip()
+            health = self.getPoolsHealth()
+            if pool in health:
+                retval = health[pool]
         return retval
 
+    def getPoolsHealth(self):
+        # health of all imported pools at once, from kstat if available
+        health = {}
+        if self.hasZfs:
+            health = self.kstatHealth()
+            if not health:
+                try:
+                    lines = shell().command(["zpool", "list", "-H", "-o", "name,health"], idempotent = True).splitlines()
+                    for line in lines:
+                        vals = line.split("\t")
+                        if len(vals) > 1:
+                            health[vals[0].strip()] = vals[1].upper().strip()
+                except:
+                    pass
+        return health
+
     def mount(self, pool, recursive = True):
         retval = True
         cmd = "zfs mount " + pool
@@ -115,35 +135,20 @@ class zfs(object):
         degr = False
         health = "UNEXIST"
         if self.hasZfs:
-            cmd = "zpool list -H -o health " + pool
-            outp = shell().command(cmd)
-            if outp:
-                health = outp.upper().strip()
+            health = self.getHealth(pool)
             degr = health.upper() == "DEGRADED"
             avl = health.upper() == "ONLINE" or degr
 
         return avl, degr
 
     def isMounted(self, pool):
-        retval = False
-        cmd = "zfs get mounted -H -o value " + pool
-        try:
-            lines = shell().command(cmd)
-            if lines:
-                retval = lines.lower().strip() == "yes"
-        except Exception as e:
-            retval = False
-        return retval
+        return len(mounttable().findSource(pool, "zfs")) > 0
 
     def isEna(self, pool):
         retval = False
-        cmd = "zfs get canmount -H -o value " + pool
-        try:
-            lines = shell().command(cmd)
-            if lines:
-                retval = lines.lower().strip() == "on"
-        except Exception as e:
-            retval = False
+        properties = self.getProperties()
+        if pool in properties:
+            retval = properties[pool].get("canmount", "").lower() == "on"
         return retval
 
     def ena(self, pool):
@@ -335,6 +340,18 @@ class zfs(object):
                 extraOpt.append(opt)
         return extraOpt
 
+    def kstatHealth(self):
+        health = {}
+        try:
+            for pool in os.listdir(KSTATZFS):
+                statefile = os.path.join(KSTATZFS, pool, "state")
+                if os.path.isfile(statefile):
+                    with open(statefile, "r") as state:
+                        health[pool] = state.read().upper().strip()
+        except:
+            pass
+        return health
+
     def checkZfsInstalled(self):
         return shell().commandExists("zfs") and shell().commandExists("zpool")
 
@@ -343,55 +360,69 @@ class zfs(object):
             # get pools
             # zpool list (-H to remove headers and tabs)
             # zpool list -o name
-            pools = shell().command("zpool list -H -o name").splitlines()
+            pools = shell().command(["zpool", "list", "-H", "-o", "name"], idempotent = True).splitlines()
+            properties = self.getProperties()
             for pool in pools:
-                entry = self.getEntryFromPool(pool)
+                entry = self.getEntryFromPool(pool, properties)
                 if entry:
                     self.zentries.append(entry)
         return
 
-    def getEntryFromPool(self, pool):
+    def getEntryFromPool(self, pool, properties = None):
         entry = {}
 
         if self.poolExists(pool):
+            if properties == None:
+                properties = self.getProperties()
+            if not pool in properties:
+                # not in the bulk query, e.g. imported after it ran
+                properties = self.getProperties(pool)
             entry['uuid'] = ""
             entry['fsname'] = ""
             entry['label'] = pool
-            cmd = "zfs get -H -o value mountpoint " + pool
-            outp = shell().command(cmd)
-            entry['mountpoint'] = outp.strip()
+            entry['mountpoint'] = properties.get(pool, {}).get("mountpoint", "")
             entry['type'] = "zfs"
-            entry['options'] = self.getOpts(pool)
+            entry['options'] = self.getOpts(pool, properties)
             entry['dump'] = str(0)
             entry['pass'] = str(0)
         return entry
 
     def poolExists(self, pool):
-        retval = False
-        cmd = "zfs list -H -o name " + pool
-        try:
-            outp = shell().command(cmd)
-            if outp:
-                retval = True
-        except:
-            pass
-        return retval
+        return pool in self.getPoolsHealth()
 
-    def getOpts(self, pool):
+    def getProperties(self, filesystem = None):
+        # ZFSPROPERTIES of all filesystems (or one) in one command, {name: {property: value}}
+        # the output is kept by shell for the rest of the invocation
+        properties = {}
+        if self.hasZfs:
+            cmd = ["zfs", "get", "-H", "-p", "-o", "name,property,value", "-t", "filesystem", ",".join(ZFSPROPERTIES)]
+            if filesystem:
+                cmd.append(filesystem)
+            returncode, outp, errp = shell().runCommand(cmd, idempotent = True)
+            for line in outp.splitlines():
+                vals = line.split("\t")
+                if len(vals) == 3:
+                    properties.setdefault(vals[0].strip(), {})[vals[1].strip()] = vals[2].strip()
+        return properties
+
+    def getOpts(self, pool, properties = None):
         opts = []
-        if self.getOpt(pool, "atime") != "on":
+        if properties == None:
+            properties = self.getProperties()
+        values = properties.get(pool, {})
+        if values.get("atime") != "on":
             opts.append('noatime')
-        if self.getOpt(pool, "readonly") == "on":
+        if values.get("readonly") == "on":
             opts.append('ro')
-        if self.getOpt(pool, "exec") != "on":
+        if values.get("exec") != "on":
             opts.append('noexec')
-        if self.getOpt(pool, "devices") != "on":
+        if values.get("devices") != "on":
             opts.append('nodevices')
-        if self.getOpt(pool, "setuid") != "on":
+        if values.get("setuid") != "on":
             opts.append('nosetuid')
-        if self.getOpt(pool, "xattr") != "on":
+        if values.get("xattr") != "on":
             opts.append('noxattr')
-        if self.getOpt(pool, "canmount") != "on":
+        if values.get("canmount") != "on":
             opts.append('noauto')
         return opts
 
@@ -437,8 +468,8 @@ class zfs(object):
         return True
 
     def getOpt(self, pool, opt):
-        cmd = "zfs get -H -o value {} {}".format(opt, pool)
-        return shell().command(cmd).strip()
+        cmd = ["zfs", "get", "-H", "-o", "value", opt, pool]
+        return shell().command(cmd, idempotent = True).strip()
 
     def setOpt(self, pool, opt, value):
         cmd = "zfs set {}={} {}".format(opt.lower(), value, pool)
@@ -446,23 +477,12 @@ class zfs(object):
     
     #https://docs.oracle.com/cd/E36784_01/html/E36835/gkkra.html#:~:text=If%20you%20want%20to%20mount,after%20the%20system%20is%20booted.
     def getMountableChildFilesystems(self, filesystemname):
-        cmd = "zfs list -H -o name,canmount,encryption,keylocation -r -t filesystem"
-        lines = []
-        try:
-            lines = shell().command(cmd).splitlines()
-        except Exception as e:
-            self.logger.error("Error getting child filesystems {}".format(filesystemname))
-            self.logger.error(e)
         childDatasets = []
-        try:
-            for line in lines:
-                vals=line.split("\t")
-                if vals[0].strip().startswith(filesystemname + "/"):
-                    if (vals[1] == "on") and ((vals[2] == "off") or ((vals[2] != "off") and (vals[3] != "prompt"))):
-                        childDatasets.append(vals[0].strip())
-        except Exception as e:
-            self.logger.error("Error parsing child filesystems {}".format(filesystemname))
-            self.logger.error(e)
+        for name, values in self.getProperties().items():
+            if name.startswith(filesystemname + "/"):
+                encryption = values.get("encryption", "off")
+                if (values.get("canmount") == "on") and ((encryption == "off") or (values.get("keylocation") != "prompt")):
+                    childDatasets.append(name)
         return childDatasets
     
 """
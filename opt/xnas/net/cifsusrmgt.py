@@ -141,9 +141,9 @@ class cifsusrmgt(object):
     def userList(self):
         userlst = []
 
-        cmd = "{} -L".format(PDBEDITEXEC)
+        cmd = [PDBEDITEXEC, "-L"]
         try:
-            lines = shell().command(cmd).splitlines()
+            lines = shell().command(cmd, idempotent = True).splitlines()
             for line in lines:
                 usrItem = {}
                 parts = line.split(":")
@@ -165,7 +165,7 @@ class cifsusrmgt(object):
         cmd = "grep -E '^UID_MIN|^UID_MAX' /etc/login.defs"
         lines = []
         try:
-            lines = shell().command(cmd).splitlines()
+            lines = shell().command(cmd, readonly = True).splitlines()
         except:
             pass
         uidsel = {}
@@ -183,7 +183,7 @@ class cifsusrmgt(object):
         cmd = "cat /etc/passwd"
         lines = []
         try:
-            lines = shell().command(cmd).splitlines()
+            lines = shell().command(cmd, readonly = True).splitlines()
         except:
             pass
         users = []
@@ -34,6 +34,7 @@ class dynmountremote(mountfs, dynmountdata):
         self.verbose   = verbose
         self.logger    = logging.getLogger('xnas.dynmountremote')
         self.xmounts   = []
+        self.engine.addIndex(groups.REMOTEMOUNTS, 'url', self.getURL)
         self.remote_wd = remote_wd(self.getUrlList(), self.onAdded, self.onDeleted)
         mountfs.__init__(self, self.logger)
         dynmountdata.__init__(self, self.logger)
@@ -48,8 +49,8 @@ class dynmountremote(mountfs, dynmountdata):
             self.remote_wd.stop()
             del self.remote_wd
 
-    def updateUrlList(self):
-        self.remote_wd.updateList(self.getUrlList())
+    def updateUrlList(self, changes = None):
+        self.remote_wd.updateList(self.getUrlList(self.getChanged(changes, groups.REMOTEMOUNTS)))
 
     ####################### CALLBACKS #######################
 
@@ -118,7 +119,7 @@ class dynmountremote(mountfs, dynmountdata):
 
     ################## INTERNAL FUNCTIONS ###################
 
-    def getUrlList(self):
+    def getUrlList(self, names = None):
         newxmounts = []
         urlList = []
         mounts = self.engine.checkGroup(groups.REMOTEMOUNTS)
@@ -128,6 +129,11 @@ class dynmountremote(mountfs, dynmountdata):
                     url = self.getURL(mount)
                     if url:
                         urlList.append(url)
+                if names != None and not key in names:
+                    # unchanged, the watchdogs keep it up to date
+                    if mount['method'] in ["dynmount", "auto"]:
+                        newxmounts.append(key)
+                elif mount['method'] == "dynmount":
                     refs, refsena = self.getReferences(self.engine, key)
                     mounted = self.isMounted(mount['mountpoint'])
                     dynmountdata.addDynmount(key, mounted, mount['mountpoint'], refs, refsena)
@@ -157,14 +163,11 @@ class dynmountremote(mountfs, dynmountdata):
 
     def findRemoteMount(self, url):
         xmount = ""
-        mounts = self.engine.checkGroup(groups.REMOTEMOUNTS)
-        if mounts:
-            for key, mount in mounts.items():
-                if mount['method'] == "dynmount":
-                    mnturl = self.getURL(mount)
-                    if mnturl == url:
-                        xmount = key
-                        break
+        mounts = self.engine.findAllInGroup(groups.REMOTEMOUNTS, 'url', url)
+        for key, mount in mounts.items():
+            if mount['method'] == "dynmount":
+                xmount = key
+                break
         return xmount
 
     def getMethod(self, xmount):
@@ -7,11 +7,21 @@
 #########################################################
 
 ####################### IMPORTS #########################
+import time
+import math
+import errno
+import socket
+import select
 from urllib.parse import urlsplit
 from common.shell import shell
 #########################################################
 
 ####################### GLOBALS #########################
+PROBEICMP    = "icmp"
+PROBETCP     = "tcp"
+PROBEMODES   = [PROBEICMP, PROBETCP]
+PROBETIMEOUT = 2
+PROBEPORTS   = {"cifs": 445, "nfs": 2049, "nfs4": 2049, "http": 80, "https": 443, "s2hfs": 22}
 
 #########################################################
 
@@ -23,26 +33,76 @@ from common.shell import shell
 # Class : ping                                          #
 #########################################################
 class ping(object):
+    probe = PROBEICMP
+    probeTimeout = PROBETIMEOUT
+
     def __init__(self):
         pass
 
     def __del__(self):
         pass
 
-    ### Use socket to test complete url and port if port if applicable
-    # and required somewher
-    #https://serverfault.com/questions/309357/ping-a-specific-port
+    @classmethod
+    def config(cls, probe = None, timeout = None):
+        cls.probe = probe if probe in PROBEMODES else PROBEICMP
+        cls.probeTimeout = timeout if timeout else PROBETIMEOUT
+
+    def getTimeout(self):
+        return ping.probeTimeout
+
+    def ping(self, url, timeout = None, type = None):
+        if not timeout:
+            timeout = ping.probeTimeout
+        if ping.probe == PROBETCP and self.getProbePort(url, type):
+            available = self.tcpPing(url, timeout, type)
+        else:
+            available = self.icmpPing(url, timeout)
+        return available
+
+    def tcpPing(self, url, timeout = PROBETIMEOUT, type = None):
+        # Connect to the service port, this also works when icmp is filtered
+        # and fails when the host is up but the service is not
+        available = False
+        host = self.getHost(url)
+        port = self.getProbePort(url, type)
+        deadline = time.monotonic() + timeout
+        try:
+            addresses = socket.getaddrinfo(host, port, type = socket.SOCK_STREAM)
+        except:
+            addresses = []
+        for family, socktype, proto, canonname, address in addresses:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            sock = socket.socket(family, socktype, proto)
+            try:
+                sock.setblocking(False)
+                err = sock.connect_ex(address)
+                if err in [errno.EINPROGRESS, errno.EAGAIN, errno.EWOULDBLOCK]:
+                    r, writable, x = select.select([], [sock], [], remaining)
+                    if writable:
+                        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                available = err == 0
+            except:
+                pass
+            finally:
+                sock.close()
+            if available:
+                break
+        return available
 
-    def ping(self, url, timeout = None):
+    def icmpPing(self, url, timeout = None):
         available = False
         base = self.getBaseUrl(url)
         to=""
+        cmdtimeout = None
         if timeout:
-            to="-w{} ".format(timeout)
+            to="-w{} ".format(math.ceil(timeout))
+            cmdtimeout = timeout + 1
         cmd = "ping -c1 {}{}".format(to, base)
 
         try:
-            shell().command(cmd)
+            shell().command(cmd, timeout = cmdtimeout, timeoutError = True, readonly = True)
             available = True
         except:
             pass
@@ -81,6 +141,49 @@ class ping(object):
 
         return port
 
+    def getHost(self, url):
+        host = ""
+        try:
+            tmp = urlsplit(url)
+            host = tmp.hostname
+            if not host:
+                # try to find between @ and :
+                part = url.split(":")[0]
+                host = part.split("@")[-1]
+        except:
+            pass
+        return host
+
+    def getProbePort(self, url, type = None):
+        port = self.getPort(url)
+        if not port:
+            if not type or type == "davfs":
+                type = self.getType(url)
+            if type in PROBEPORTS:
+                port = PROBEPORTS[type]
+        return port
+
+    def getType(self, url):
+        type = ""
+        lurl = url.lower()
+        if lurl.startswith("https:"):
+            type = "https"
+        elif lurl.startswith("http:"):
+            type = "http"
+        elif url.startswith("//"):
+            type = "cifs"
+        elif "@" in url.split(":")[0]:
+            type = "s2hfs"
+        elif ":" in url:
+            type = "nfs"
+        return type
+
 ######################### MAIN ##########################
 if __name__ == "__main__":
-    pass
+    # Probe a url: python3 -m remotes.ping <url> [icmp|tcp] [timeout]
+    import sys
+    if len(sys.argv) > 1:
+        ping.config(sys.argv[2] if len(sys.argv) > 2 else None, float(sys.argv[3]) if len(sys.argv) > 3 else None)
+        available = ping().ping(sys.argv[1])
+        print("{} is {}".format(sys.argv[1], "available" if available else "not available"))
+        exit(0 if available else 1)
@@ -115,7 +115,7 @@ class remotemount(fstab, mountfs, mountpoint):
                         mymount['used'] = None
                         mymount['mounted'] = False
                     #mymount['enabled'] = mount['enabled'] #fstab.isEna(self, fsname = entry['fsname'])
-                    mymount['health'] = self.getHealth(fsname = entry['fsname'], isMounted = mymount['mounted'], hasHost = ping().ping(url))
+                    mymount['health'] = self.getHealth(fsname = entry['fsname'], isMounted = mymount['mounted'], hasHost = ping().ping(url, type = mount['type']))
                     mymount['referenced'] = self.isReferenced(key, True)
                     mymount['method'] = mount['method']
                 if mymount:
@@ -191,6 +191,7 @@ class remotemount(fstab, mountfs, mountpoint):
                 isMounted = self.isMounted(mp)
                 if not isMounted:
                     if ping().ping(entry['fsname']):
+                        self.flushFstab() # mount reads the edits from fstab
                         retval = mountfs.mount(self, mp)
                     else:
                         self.logger.warning("{} failed pinging host".format(name))
@@ -350,6 +351,8 @@ class remotemount(fstab, mountfs, mountpoint):
         mode = 0o777
         curmode = 0o777
         method = "disabled" #should never occur as settings["method"] is always set
+        # fstab is backed up, written and reloaded once for all edits
+        transaction = self.beginFstab()
 
         if 'type' in self.engine.settings:
             retval = self.checkType(self.engine.settings['type'])
@@ -486,8 +489,9 @@ class remotemount(fstab, mountfs, mountpoint):
                 retval = self.mnt(entryNew['fsname'], dbItem = False, mpoint = entryNew['mountpoint'])
                 retval = True # continue even if not able to mount
 
-        if retval and changed:
-            retval = fstab.systemdReload(self, remote = True)
+        if transaction:
+            if not self.commitFstab(reload = retval and changed):
+                retval = False
 
         # Add to DB or edit DB
         if retval:
@@ -515,6 +519,7 @@ class remotemount(fstab, mountfs, mountpoint):
     def delRm(self, name):
         retval = False
         db = self.engine.checkKey(groups.REMOTEMOUNTS, name)
+        transaction = self.beginFstab()
         if db:
             if not self.isReferenced(name):
                 retval = self.umnt(name)
@@ -534,6 +539,10 @@ class remotemount(fstab, mountfs, mountpoint):
                                 if typeObj.delKeys(url):
                                     self.logger.info("Removed keys")
                         self.delTypeObj(typeObj)
+        if transaction:
+            # the entry is deleted once written, a failed reload doesn't undo that
+            retval = self.flushFstab() and retval
+            self.commitFstab(reload = retval)
         if retval:
             self.logger.info("{} deleted".format(name))
             self.clr(name) # Remove from DB
@@ -709,12 +718,12 @@ class remotemount(fstab, mountfs, mountpoint):
         entry = {}
         cmd = ""
         if self.human:
-            cmd = "df --output=source,size,pcent,target -h {}".format(mpoint)
+            cmd = ["df", "--output=source,size,pcent,target", "-h", mpoint]
         else:
-            cmd = "df --output=source,size,used,target {}".format(mpoint)
+            cmd = ["df", "--output=source,size,used,target", mpoint]
         try:
             if self.isMounted(mpoint): #don't trigger df when not mounted as it mounts automounts
-                lines = shell().command(cmd).splitlines()
+                lines = shell().command(cmd, idempotent = True).splitlines()
                 if len(lines) > 1:
                     for line in lines[1:]:
                         data = line.split()
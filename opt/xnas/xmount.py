@@ -12,6 +12,7 @@
 import sys
 from common.xnas_engine import xnas_engine
 from common.xnas_check import xnas_check
+from common.xnas_rpc import rpcclient
 from mounts.mount import mount
 #########################################################
 
@@ -238,4 +239,5 @@ class xmount(xnas_engine):
 
 ######################### MAIN ##########################
 if __name__ == "__main__":
+    rpcclient("xmount").run(sys.argv)
     xmount().run(sys.argv)
@@ -14,15 +14,18 @@ import sys
 import logging
 import json
 from common.xnas_engine import xnas_engine, groups
-from common.xnas_check import xnas_check
+from common.xnas_check import xnas_check, CHECKJOBS
 from common.xnas_fix import xnas_fix
 from common.stdin import stdin
 from common.systemdctl import systemdctl
+from common.shell import shell
+from common.xnas_rpc import rpcclient
 from mounts.mount import mount
 from remotes.remotemount import remotemount
 from shares.share import share
 from net.netshare import netshare
 from mounts.fstab import fstab
+from remotes.ping import PROBEMODES
 #########################################################
 
 ####################### GLOBALS #########################
@@ -49,7 +52,7 @@ class xnas(xnas_engine):
         checkList = []
         self.handleArgs(argv)
         if self.hasSetting(self.settings,"command") and (self.settings["command"] == "fix" or self.settings["command"] == "chk"):
-            xnasChk = xnas_check(self, noMsg = True, level = 0, json = self.settings['json'])
+            xnasChk = xnas_check(self, noMsg = True, level = 0, json = self.settings['json'], jobs = self.getJobs())
             checkResults = xnasChk.check()
             checkList = xnasChk.GetList()
             del xnasChk
@@ -163,7 +166,11 @@ class xnas(xnas_engine):
                  "afretries": "number of retries during autofix (srv) (default = 3)",
                  "afinterval": "autofix retry interval (srv) (default = 60)",
                  "zfsmntrec": "enables or disables zfs recursive mount (srv) (default = true)",
-                 "settings": "lists current settings (srv)"}
+                 "settings": "lists current settings (srv)",
+                 "probe": "remote host probe method, icmp or tcp (srv) (default = icmp)",
+                 "probetimeout": "remote host probe timeout (srv) (default = 2 [s])",
+                 "jobs": "number of objects checked in parallel (fix, chk) (default = 8)",
+                 "profile": "report time spent in external commands, optional chrome trace <file>"}
         extra = ('xservices run as a service for dynmount, autofix and also handles emptying\n'
         'the cifs recyclebin if required. See "interval", "enable", "removable",\n'
         '"binenable", "afenable", "afretries" and "afinterval" options.\n'
@@ -193,12 +200,22 @@ class xnas(xnas_engine):
 
         self.settings.update(optsnargs[0])
         self.settingsBool(self.settings, 'json')
+        if self.hasSetting(self.settings, 'profile'):
+            shell.startProfile(self.settings['profile'])
         self.settingsStr(self.settings, 'backup', default = "0")
         if self.settings['json']:
             self.StdoutLogging(False)
         else:
             self.StdoutLogging(True)
 
+    def getJobs(self):
+        jobs = CHECKJOBS
+        if self.hasSetting(self.settings,"jobs"):
+            jobs = self.toInt(self.settings["jobs"])
+            if jobs < 1:
+                jobs = 1
+        return jobs
+
     def showAll(self):
         all = {}
         mounts = mount(self).getMounts()
@@ -284,6 +301,8 @@ class xnas(xnas_engine):
             settings["autofixretries"] = 3
             settings["autofixinterval"] = 60
             settings["zfsmountrecursive"] = True
+            settings["remoteprobe"] = "icmp"
+            settings["probetimeout"] = 2
             updated = True
             self.addToGroup(groups.SETTINGS, settings)
 
@@ -341,6 +360,22 @@ class xnas(xnas_engine):
                 settings["zfsmountrecursive"] = self.toBool(self.settings["zfsmntrec"])
                 updated = True
 
+        if self.hasSetting(self.settings,"probe"):
+            probe = str(self.settings["probe"]).lower()
+            if not probe in PROBEMODES:
+                self.parseError("Unknown probe method: {}".format(self.settings["probe"]))
+            if settings.get("remoteprobe") != probe:
+                settings["remoteprobe"] = probe
+                updated = True
+
+        if self.hasSetting(self.settings,"probetimeout"):
+            probetimeout = self.toInt(self.settings["probetimeout"])
+            if not probetimeout:
+                probetimeout = 2
+            if settings.get("probetimeout") != probetimeout:
+                settings["probetimeout"] = probetimeout
+                updated = True
+
         if updated or enaupd:
             dorestart = True
             self.update()
@@ -503,6 +538,10 @@ class xnas(xnas_engine):
         if settings:
             if not "zfsmountrecursive" in settings:
                 settings["zfsmountrecursive"] = True
+            if not "remoteprobe" in settings:
+                settings["remoteprobe"] = "icmp"
+            if not "probetimeout" in settings:
+                settings["probetimeout"] = 2
         
         self.update()
 
@@ -512,4 +551,5 @@ class xnas(xnas_engine):
 
 ######################### MAIN ##########################
 if __name__ == "__main__":
+    rpcclient("xnas").run(sys.argv)
     xnas().run(sys.argv)
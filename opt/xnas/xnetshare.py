@@ -13,6 +13,7 @@ import sys
 from common.xnas_engine import xnas_engine
 from common.xnas_check import xnas_check
 from common.ip import ip
+from common.xnas_rpc import rpcclient
 from net.netshare import netshare
 from net.nfsshare import CfgNfs
 from net.cifsshare import CfgCifs, HomesCifs, ShareCifs, VfsRecycleCifs
@@ -359,4 +360,5 @@ class xnetshare(xnas_engine):
 
 ######################### MAIN ##########################
 if __name__ == "__main__":
+    rpcclient("xnetshare").run(sys.argv)
     xnetshare().run(sys.argv)
@@ -14,6 +14,7 @@ import os
 from common.xnas_engine import xnas_engine
 from common.xnas_check import xnas_check
 from common.xnas_dir import xnas_dir
+from common.xnas_rpc import rpcclient
 #########################################################
 
 ####################### GLOBALS #########################
@@ -42,7 +43,7 @@ class xpd(xnas_engine):
         name, type = self.dir.parseName(self.settings)
         db, obj = self.findName(name, type)
         xcheck = xnas_check(self, json = self.settings['json'])
-        if xcheck.ErrorExitCmd(xcheck.check(), self.settings, obj):
+        if xcheck.ErrorExitCmd(xcheck.checkObject(obj, name), self.settings, obj):
             if self.settings["json"]:
                 self.printJsonResult(False)
             else:
@@ -95,4 +96,5 @@ class xpd(xnas_engine):
 
 ######################### MAIN ##########################
 if __name__ == "__main__":
+    rpcclient("xpd").run(sys.argv)
     xpd().run(sys.argv)
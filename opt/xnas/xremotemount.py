@@ -12,6 +12,7 @@
 import sys
 from common.xnas_engine import xnas_engine
 from common.xnas_check import xnas_check
+from common.xnas_rpc import rpcclient
 from remotes.remotemount import remotemount
 #########################################################
 
@@ -243,4 +244,5 @@ class xremotemount(xnas_engine):
 
 ######################### MAIN ##########################
 if __name__ == "__main__":
+    rpcclient("xremotemount").run(sys.argv)
     xremotemount().run(sys.argv)
@@ -12,10 +12,14 @@
 import sys
 import os
 import signal
+import hashlib
 from threading import Timer, Lock
 from common.xnas_engine import groups
 from common.xnas_engine import xnas_engine
+from common.database import database
+from common.xnas_rpc import rpcserver
 from common.xnas_autofix import xnas_autofix
+from common.xnas_wd import file_wd
 from common.shell import shell
 from net.cifsemptybin import cifsemptybin
 from mounts.dynmount import dynmount
@@ -24,7 +28,8 @@ from shares.share import share
 #########################################################
 
 ####################### GLOBALS #########################
-
+DBSETTLE = 0.5 # wait for more changes before reloading [s]
+RESYNC   = 10  # resync all dynmounts every n intervals, in case a watchdog missed an event
 #########################################################
 
 ###################### FUNCTIONS ########################
@@ -34,6 +39,7 @@ from shares.share import share
 #########################################################
 class xservices(xnas_engine):
     def __init__(self):
+        database.keepSnapshot = True
         xnas_engine.__init__(self, "xservices")
         self.settings = {}
         self.mutex = Lock()
@@ -41,9 +47,14 @@ class xservices(xnas_engine):
         self.cifsemptybin = None
         self.dynmount = None
         self.dynmountremote = None
+        self.rpcserver = None
+        self.config_wd = None
+        self.dbHash = ""
+        self.dbTimer = None
         self.srvTimer     = None
         self.srvIsRunning = False
         self.srvInterval = 60
+        self.srvCount = 0
         self.verbose = False
 
     def __del__(self):
@@ -52,6 +63,12 @@ class xservices(xnas_engine):
 
     def exitSignal(self, signum = 0, frame = 0):
         self.logger.info("stopping xservices")
+        if self.config_wd:
+            self.config_wd.stop()
+        if self.dbTimer:
+            self.dbTimer.cancel()
+        if self.rpcserver:
+            self.rpcserver.terminate()
         if self.autofix:
             self.autofix.terminate()
         if self.cifsemptybin:
@@ -74,7 +91,7 @@ class xservices(xnas_engine):
         cmd = "ps -All|grep {}".format(pname)
 
         try:
-            lines = shell().command(cmd).splitlines()
+            lines = shell().command(cmd, readonly = True).splitlines()
             if len(lines) > 1:
                 retval = True
         except:
@@ -97,33 +114,14 @@ class xservices(xnas_engine):
             self.verbose = self.toBool(self.settings["verbose"])
 
         self.srvInterval = self.checkKey(groups.SETTINGS,"dyninterval")
-        if self.srvInterval == None:
-            self.srvInterval = 60
-
         zfshealth = self.checkKey(groups.SETTINGS,"dynzfshealth")
-        if zfshealth == None:
-            zfshealth = False
-
         removable = self.checkKey(groups.SETTINGS,"dynremovable")
-        if removable == None:
-            removable = False
-
         cifsautobinenable = self.checkKey(groups.SETTINGS,"cifsautobinenable")
-        if cifsautobinenable == None:
-            cifsautobinenable = True
-
         autofixenable = self.checkKey(groups.SETTINGS,"autofixenable")
-        if autofixenable == None:
-            autofixenable = True
-
         autofixretries = self.checkKey(groups.SETTINGS,"autofixretries")
-        if autofixretries == None:
-            autofixretries = 3
-
         autofixinterval = self.checkKey(groups.SETTINGS,"autofixinterval")
-        if autofixinterval == None:
-            autofixinterval = 60
 
+        self.dbHash = self.getDBHash()
         self.start()
 
         if self.checkKey(groups.SETTINGS,"srvenable"):
@@ -131,6 +129,10 @@ class xservices(xnas_engine):
             self.cifsemptybin = cifsemptybin(self, self.verbose, False, cifsautobinenable)
             self.dynmount = dynmount(self, self.verbose, zfshealth, removable)
             self.dynmountremote = dynmountremote(self, self.verbose)
+            self.rpcserver = rpcserver(self, self.verbose)
+            self.rpcserver.start()
+            self.config_wd = file_wd(self.getXMLpath(False), self.onDBChanged)
+            self.config_wd.start()
 
             self.logger.info("started xservices")
             signal.pause()
@@ -148,6 +150,8 @@ class xservices(xnas_engine):
                  '                     Maximum age can be changed with: "xnetshare add ..."\n'
                  '    Autofix:         Check for errors and automatically fix them\n'
                  '                     Options can be changed with: "xnas srv ..."\n'
+                 '    Rpc server:      Run xnas commands in the service to skip startup\n'
+                 '                     Set XNAS_NODAEMON to run a command in process\n'
                  'xservices can be enabled or disabled with "xnas srv -e"')
         self.fillSettings(self.parseOpts(argv, xopts, xargs, extra), xopts)
 
@@ -163,7 +167,7 @@ class xservices(xnas_engine):
         if not self.srvIsRunning:
             if self.verbose:
                 self.logger.info("Reload database in {} seconds".format(self.srvInterval))
-            self.srvTimer = Timer(self.srvInterval, self.reloadDB)
+            self.srvTimer = Timer(self.srvInterval, self.reloadDB, kwargs = {"interval": True})
             self.srvTimer.start()
             self.srvIsRunning = True
 
@@ -171,56 +175,80 @@ class xservices(xnas_engine):
         self.srvTimer.cancel()
         self.srvIsRunning = False
 
-    def reloadDB(self):
+    def reloadDB(self, interval = False):
         self.mutex.acquire()
         self.stop()
-        self.reload()
-        if self.verbose:
-            self.logger.info("Reloaded database")
+        changes = {}
+        resync = False
+        if interval:
+            self.srvCount += 1
+            if self.srvCount >= RESYNC:
+                self.srvCount = 0
+                resync = True
+        dbHash = self.getDBHash()
+        # Only reload if the content changed, and only process what changed
+        if dbHash != self.dbHash:
+            self.dbHash = dbHash
+            olddb = self.db
+            self.reload()
+            changes = self.diffDB(olddb)
+            if self.verbose:
+                self.logger.info("Reloaded database, changes in: {}".format(", ".join(changes.keys())))
 
-        self.srvInterval = self.checkKey(groups.SETTINGS,"dyninterval")
-        if self.srvInterval == None:
-            self.srvInterval = 60
+        if groups.SETTINGS in changes:
+            self.configProbe()
 
-        if self.cifsemptybin:
-            cifsautobinenable = self.checkKey(groups.SETTINGS,"cifsautobinenable")
-            if cifsautobinenable == None:
-                cifsautobinenable = True
+            self.srvInterval = self.checkKey(groups.SETTINGS,"dyninterval")
 
-            self.cifsemptybin.update(cifsautobinenable)
+            if self.cifsemptybin:
+                cifsautobinenable = self.checkKey(groups.SETTINGS,"cifsautobinenable")
 
-        if self.autofix:
-            autofixenable = self.checkKey(groups.SETTINGS,"autofixenable")
-            if autofixenable == None:
-                autofixenable = True
+                self.cifsemptybin.update(cifsautobinenable)
 
-            autofixretries = self.checkKey(groups.SETTINGS,"autofixretries")
-            if autofixretries == None:
-                autofixretries = 3
+            if self.autofix:
+                autofixenable = self.checkKey(groups.SETTINGS,"autofixenable")
+                autofixretries = self.checkKey(groups.SETTINGS,"autofixretries")
+                autofixinterval = self.checkKey(groups.SETTINGS,"autofixinterval")
 
-            autofixinterval = self.checkKey(groups.SETTINGS,"autofixinterval")
-            if autofixinterval == None:
-                autofixinterval = 60
+                self.autofix.update(autofixenable, autofixretries, autofixinterval)
 
-            self.autofix.update(autofixenable, autofixretries, autofixinterval)
+            if self.dynmount:
+                zfshealth = self.checkKey(groups.SETTINGS,"dynzfshealth")
+                removable = self.checkKey(groups.SETTINGS,"dynremovable")
+                self.dynmount.update(zfshealth, removable)
 
-        if self.dynmountremote:
-            self.dynmountremote.updateUrlList()
+        if resync:
+            # everything, the database changes are included
+            if self.verbose:
+                self.logger.info("Resync dynmounts")
+            changes = None
 
-        if self.dynmount:
-            zfshealth = self.checkKey(groups.SETTINGS,"dynzfshealth")
-            if zfshealth == None:
-                zfshealth = False
+        if changes != {}:
+            if self.dynmountremote:
+                self.dynmountremote.updateUrlList(changes)
 
-            removable = self.checkKey(groups.SETTINGS,"dynremovable")
-            if removable == None:
-                removable = False
-            self.dynmount.update(zfshealth, removable)
-            self.dynmount.updateList()
+            if self.dynmount:
+                self.dynmount.updateList(changes)
 
         self.start()
         self.mutex.release()
 
+    def onDBChanged(self, path):
+        # Editors and xnas write in steps, reload when it settled
+        if self.dbTimer:
+            self.dbTimer.cancel()
+        self.dbTimer = Timer(DBSETTLE, self.reloadDB)
+        self.dbTimer.start()
+
+    def getDBHash(self):
+        dbHash = ""
+        try:
+            with open(self.getXMLpath(False), "rb") as xml_file:
+                dbHash = hashlib.sha256(xml_file.read()).hexdigest()
+        except:
+            pass
+        return dbHash
+
 #########################################################
 
 ######################### MAIN ##########################
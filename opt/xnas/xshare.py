@@ -12,6 +12,7 @@
 import sys
 from common.xnas_engine import xnas_engine
 from common.xnas_check import xnas_check
+from common.xnas_rpc import rpcclient
 from shares.share import share
 #########################################################
 
@@ -168,4 +169,5 @@ class xshare(xnas_engine):
 
 ######################### MAIN ##########################
 if __name__ == "__main__":
+    rpcclient("xshare").run(sys.argv)
     xshare().run(sys.argv)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#########################################################
+# TEST : test_devices.py                                #
+#        sysfs backend of the block device inventory    #
+#        against lsblk, on the bench fixture tree       #
+#        I. Helwegen 2020                               #
+#########################################################
+
+####################### IMPORTS #########################
+import os
+import sys
+import logging
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench"))
+from fixture import fixture
+import mounts.devices as devmodule
+#########################################################
+
+####################### GLOBALS #########################
+# sizes differ: the fixture's lsblk reports fixed sizes, sysfs the temporary tree
+KEYS = ['fsname', 'label', 'uuid', 'type', 'mountpoint', 'mounted']
+#########################################################
+
+#########################################################
+# Class : testDevices                                   #
+#########################################################
+class testDevices(unittest.TestCase):
+    def setUp(self):
+        self.system = fixture(disks = 4, remotes = 0, shares = 0, pools = 2, forkcost = 0)
+        # one disk and one pool not mounted
+        self.system.unmount(self.system.diskMountpoint(1))
+        self.system.unmount(self.system.poolMountpoint(1))
+        self.logger = logging.getLogger('xnas.test')
+
+    def tearDown(self):
+        self.system.remove()
+
+    def getDevices(self, backend, human):
+        devmodule.DEVBACKEND = backend
+        self.system.resetState()
+        return devmodule.devices(self.logger, human).blkdevices
+
+    def compare(self, human):
+        try:
+            lsblk = self.getDevices("lsblk", human)
+            sysfs = self.getDevices("sysfs", human)
+        finally:
+            devmodule.DEVBACKEND = "lsblk"
+        self.assertEqual(len(lsblk), self.system.disks + self.system.pools)
+        # lsblk lists in kernel order, sysfs by name
+        self.assertEqual(sorted([device[key] for key in KEYS] for device in sysfs),
+                         sorted([device[key] for key in KEYS] for device in lsblk))
+
+    def testBackends(self):
+        self.compare(False)
+
+    def testBackendsHuman(self):
+        self.compare(True)
+
+    def testZfsMember(self):
+        sysfs = self.getDevices("sysfs", False)
+        devmodule.DEVBACKEND = "lsblk"
+        pools = [device for device in sysfs if device['type'] == "zfs"]
+        self.assertEqual([device['label'] for device in pools], ["pool0", "pool1"])
+        self.assertEqual([device['mounted'] for device in pools], [True, False])
+
+######################### MAIN ##########################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#########################################################
+# TEST : test_xnas_wd.py                                #
+#        Remote probes of the xservices watchdog        #
+#                                                       #
+#        I. Helwegen 2020                               #
+#########################################################
+
+####################### IMPORTS #########################
+import os
+import sys
+import time
+import unittest
+from threading import Event, Lock
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "opt", "xnas"))
+from watchdog.observers.api import EventQueue, ObservedWatch
+from common.xnas_wd import RemoteEmitter
+#########################################################
+
+####################### GLOBALS #########################
+TIMEOUT = 0.2
+SLOWHOSTS = 20
+#########################################################
+
+#########################################################
+# Class : fakeping                                      #
+#########################################################
+class fakeping(object):
+    # slow hosts don't answer before release, others answer at once
+    def __init__(self, slow):
+        self.slow = slow
+        self.release = Event()
+        self.calls = {}
+        self.lock = Lock()
+
+    def getTimeout(self):
+        return TIMEOUT
+
+    def ping(self, url, timeout = None, type = None):
+        with self.lock:
+            self.calls[url] = self.calls.get(url, 0) + 1
+        if url in self.slow:
+            self.release.wait(10)
+            return False
+        return True
+
+#########################################################
+# Class : testRemoteEmitter                             #
+#########################################################
+class testRemoteEmitter(unittest.TestCase):
+    def setUp(self):
+        self.slow = ["//slow{}/share".format(i) for i in range(SLOWHOSTS)]
+        self.fast = "//fast/share"
+        self.emitter = RemoteEmitter(EventQueue(), ObservedWatch("", recursive = False))
+        self.ping = fakeping(self.slow)
+        self.emitter.ping = self.ping
+
+    def tearDown(self):
+        self.ping.release.set()
+        self.emitter.on_thread_stop()
+
+    def testFastAfterSlow(self):
+        start = time.monotonic()
+        results = self.emitter.probe(self.slow + [self.fast])
+        self.assertTrue(results[self.fast])
+        self.assertLess(time.monotonic() - start, TIMEOUT + 2)
+
+    def testSlowNotProbedAgain(self):
+        self.emitter.probe(self.slow + [self.fast])
+        results = self.emitter.probe(self.slow + [self.fast])
+        # the slow hosts are still probed, they keep their last state
+        for url in self.slow:
+            self.assertNotIn(url, results)
+            self.assertEqual(self.ping.calls[url], 1)
+        self.assertTrue(results[self.fast])
+        self.assertEqual(self.ping.calls[self.fast], 2)
+
+######################### MAIN ##########################
+if __name__ == "__main__":
+    unittest.main()